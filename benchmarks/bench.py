@@ -0,0 +1,178 @@
+import functools
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable
+from unittest.mock import patch
+
+import click
+
+from benchmarks.generator import SCENARIOS, generate_document
+from src.core.color import Color, colour
+from src.core.constants import Constants
+from src.core.models import PdfCfg
+from src.markdown import processor as processor_module
+from src.markdown.processor import MarkdownProcessor
+from src.pdf.converter import PdfConverter
+from tests.fake_server import FakeServer
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+STAGES = ["extraction", "rendering", "wrap", "markdown2", "pdf", "total"]
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg" width="400" height="300"><rect width="400" height="300"/></svg>'
+# Timings below this difference, in seconds, are noise and never a regression
+MIN_DIFFERENCE = 0.005
+
+Results = dict[str, dict[str, float]]
+
+# region StageTimer
+
+
+class StageTimer:
+    """Accumulate the time spent in the wrapped functions by stage."""
+
+    def __init__(self) -> None:
+        self.seconds: dict[str, float] = defaultdict(float)
+
+    def wrap(self, stage: str, func: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(func)
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds[stage] += time.perf_counter() - start
+
+        return timed
+
+
+# region Benchmark
+
+
+def run_once(markdown_content: str, cfg: PdfCfg, with_pdf: bool) -> dict[str, float]:
+    """Convert the document with a new processor, so nothing is reused from a previous run,
+    and return the seconds spent in each stage."""
+    timer = StageTimer()
+    processor = MarkdownProcessor(cfg)
+    converter = PdfConverter(cfg, processor)
+    renderer = processor.renderer
+    setattr(renderer, "split", timer.wrap("extraction", renderer.split))
+    setattr(renderer, "_render_all", timer.wrap("rendering", renderer._render_all))
+    setattr(processor, "_wrap_intervals_with_div", timer.wrap("wrap", processor._wrap_intervals_with_div))
+    try:
+        start = time.perf_counter()
+        with patch.object(processor_module, "scan_markdown", timer.wrap("extraction", processor_module.scan_markdown)):
+            processed_content, svgs = processor.process_markdown(markdown_content)
+        raw_html = timer.wrap("markdown2", converter.to_html)([processed_content])
+        if with_pdf:
+            timer.wrap("pdf", converter.render_pdf)(raw_html, svgs)
+        timer.seconds["total"] = time.perf_counter() - start
+    finally:
+        processor.close()
+    return dict(timer.seconds)
+
+
+def benchmark(markdown_content: str, cfg: PdfCfg, repeat: int, with_pdf: bool) -> dict[str, float]:
+    """Return the best time of each stage over the runs, and the peak of memory of a run traced apart,
+    as tracing the allocations slows down the conversion."""
+    runs = [run_once(markdown_content, cfg, with_pdf) for _ in range(repeat)]
+    result = {stage: min(run[stage] for run in runs) for stage in STAGES if stage in runs[0]}
+
+    tracemalloc.start()
+    try:
+        run_once(markdown_content, cfg, with_pdf)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    result["peak_mb"] = peak / (1024 * 1024)
+    return result
+
+
+def compare(results: Results, baseline: Results, tolerance: float) -> list[str]:
+    """Return the metrics that are worse than the baseline by more than the tolerance."""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            reference = baseline.get(name, {}).get(metric)
+            if reference is None:
+                continue
+            slack = 0.0 if metric == "peak_mb" else MIN_DIFFERENCE
+            if value > reference * (1 + tolerance) and value - reference > slack:
+                regressions.append(f"{name}.{metric}: {value:.3f} > {reference:.3f}")
+    return regressions
+
+
+def print_results(results: Results, baseline: Results) -> None:
+    metrics = STAGES + ["peak_mb"]
+    print(f"{'scenario':<10}" + "".join(f"{metric:>12}" for metric in metrics))
+    for name, values in results.items():
+        row = f"{name:<10}"
+        for metric in metrics:
+            value = values.get(metric)
+            reference = baseline.get(name, {}).get(metric)
+            cell = "-" if value is None else f"{value:.3f}"
+            if value is not None and reference:
+                cell += f" {(value / reference - 1) * 100:+.0f}%"
+            row += f"{cell:>12}"
+        print(row)
+
+
+@click.command()
+@click.option("--scenario", "scenarios", multiple=True, type=click.Choice(list(SCENARIOS)), help="All by default.")
+@click.option("--latency", type=float, default=0.05, show_default=True, help="Seconds of each fake server response.")
+@click.option("--jobs", type=int, default=Constants.RENDER_JOBS, show_default=True, help="Diagrams rendered at once.")
+@click.option("--repeat", type=int, default=3, show_default=True, help="Runs of each scenario, the best one is kept.")
+@click.option("--no-pdf", is_flag=True, help="Skip the PDF generation, as without the WeasyPrint libraries.")
+@click.option("--baseline", type=click.Path(dir_okay=False), default=str(BASELINE), show_default=True)
+@click.option("--save-baseline", is_flag=True, help="Store the results as the new baseline.")
+@click.option("--tolerance", type=float, default=0.2, show_default=True, help="Allowed slowdown over the baseline.")
+def main(
+    scenarios: tuple[str, ...],
+    latency: float,
+    jobs: int,
+    repeat: int,
+    no_pdf: bool,
+    baseline: str,
+    save_baseline: bool,
+    tolerance: float,
+) -> None:
+    """Convert synthetic documents against a local fake mermaid-ink server, timing each stage,
+    and compare the results with the baseline."""
+    results: Results = {}
+    with FakeServer([(200, SVG, {"Content-Type": "image/svg+xml"})], latency=latency) as server:
+        with tempfile.TemporaryDirectory() as tmp:
+            cfg = PdfCfg(
+                "",
+                str(Path(tmp) / "benchmark.pdf"),
+                str(Constants.SCRIPT_PATH / "resources" / "style.css"),
+                str(Constants.SCRIPT_PATH / "img"),
+                debug=False,
+                cache_dir=None,
+                jobs=jobs,
+                mermaid_url=server.url,
+            )
+            for name in scenarios or SCENARIOS:
+                markdown_content = generate_document(SCENARIOS[name])
+                results[name] = benchmark(markdown_content, cfg, repeat, not no_pdf)
+
+    reference: Results = json.loads(Path(baseline).read_text()) if Path(baseline).exists() else {}
+    print_results(results, reference)
+    if save_baseline:
+        rounded = {
+            name: {metric: round(value, 4) for metric, value in metrics.items()} for name, metrics in results.items()
+        }
+        Path(baseline).write_text(json.dumps({**reference, **rounded}, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline saved to {baseline}")
+        return
+    regressions = compare(results, reference, tolerance)
+    for regression in regressions:
+        print(colour(Color.RED, f"Regression {regression}"))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import random
+from dataclasses import dataclass
+
+from src.core.constants import Constants
+
+# region Scenario
+
+
+@dataclass
+class Scenario:
+    """Shape of a synthetic document: its diagrams, and the text and lists around each one of them.
+    Diagrams longer than 50 lines are split by MermaidRenderer in several chunks."""
+
+    name: str
+    diagrams: int
+    lines_per_diagram: int
+    paragraphs: int = 3
+    list_items: int = 5
+    seed: int = 0
+
+
+SCENARIOS = {
+    "small": Scenario("small", diagrams=5, lines_per_diagram=20),
+    "medium": Scenario("medium", diagrams=30, lines_per_diagram=60, paragraphs=5, list_items=10),
+    "large": Scenario("large", diagrams=100, lines_per_diagram=120, paragraphs=10, list_items=20),
+}
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore".split()
+
+
+# region generate_document
+
+
+def generate_document(scenario: Scenario) -> str:
+    """Return a Markdown document with the shape of the scenario, as the API documents the tool is used for.
+    The same scenario always generates the same document."""
+    rnd = random.Random(scenario.seed)
+    sections = [f"# Synthetic document {scenario.name}\n"]
+    for i in range(scenario.diagrams):
+        sections.append(_section(rnd, i, scenario))
+    return "\n".join(sections)
+
+
+def _section(rnd: random.Random, i: int, scenario: Scenario) -> str:
+    lines = [
+        f"## Endpoint {i}",
+        f"Endpoint: /resources/{i}",
+        f"Method: {rnd.choice(['GET', 'POST', 'PUT', 'DELETE'])}<br>",
+        f"Path: /api/v1/resources/{i}<br>",
+        f"Documentation for the API: https://example.com/docs/{i}<br>",
+        "",
+    ]
+    for _ in range(scenario.paragraphs):
+        lines.append(_sentence(rnd, 40) + "\n")
+    for j in range(scenario.list_items):
+        lines.append(f"- Item {j}: **{_sentence(rnd, 6)}** `{rnd.choice(WORDS)}`")
+    lines += ["", "<details open>", "<summary>diagrams</summary>", "", "```mermaid"]
+    lines.append(_sequence_diagram(rnd, scenario.lines_per_diagram))
+    lines += ["```", "</details>", "", Constants.DIV_BREAK_AFTER, ""]
+    return "\n".join(lines)
+
+
+def _sentence(rnd: random.Random, words: int) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _sequence_diagram(rnd: random.Random, lines: int) -> str:
+    participants = ["Client", "Gateway", "Service", "Database"]
+    code = ["sequenceDiagram"] + [f"participant {name}" for name in participants]
+    while len(code) < lines:
+        source, target = rnd.sample(participants, 2)
+        code.append(f"{source}->>{target}: {_sentence(rnd, 3)}")
+    return "\n".join(code)
@@ -0,0 +1,203 @@
+import asyncio
+import dataclasses
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Iterable, Iterator
+
+from src.core.constants import Constants
+from src.core.models import ErrorHandler, PdfCfg, PdfOptions
+from src.core.validation import settings
+from src.markdown.mermaid import MermaidRenderer, RenderBackend, RenderResult
+from src.markdown.processor import MarkdownProcessor
+from src.markdown.rules import load_rules
+from src.markdown.sections import Source
+from src.pdf.converter import PdfConverter
+
+
+class ConversionError(Exception):
+    """The document was converted with errors, as a diagram that could not be rendered.
+    The PDF is still written, with a placeholder for what failed, and kept in pdf when it is returned."""
+
+    def __init__(self, errors: list[str], pdf: bytes = b"") -> None:
+        super().__init__("\n".join(errors))
+        self.errors = errors
+        self.pdf = pdf
+
+
+class _CancelledError(Exception):
+    """The conversion was cancelled by its caller, and stops at the next diagram or section."""
+
+
+def convert(markdown_content: Source, options: PdfOptions | None = None) -> bytes:
+    """Convert the Markdown to PDF and return the PDF, see convert_to_stream.
+    The PDF of a document converted with errors is in the pdf of the ConversionError."""
+    output = io.BytesIO()
+    try:
+        convert_to_stream(markdown_content, output, options)
+    except ConversionError as e:
+        e.pdf = output.getvalue()
+        raise
+    return output.getvalue()
+
+
+def convert_to_stream(markdown_content: Source, stream: BinaryIO, options: PdfOptions | None = None) -> None:
+    """Convert the Markdown to PDF and write it to the binary stream.
+    The paths of the options are not used, only the stylesheet, base URL and rendering options.
+    Each call has its own processor, diagram renderer and errors, so it can run in many threads at once.
+    An invalid option raises a ValueError, and the errors of the conversion a ConversionError,
+    after the PDF is written."""
+    _convert(_settings(options), markdown_content, stream)
+
+
+def _settings(options: PdfOptions | None) -> PdfCfg:
+    cfg = settings(dataclasses.replace(options or PdfOptions("", "", "", "")))
+    load_rules(cfg.rules_path)
+    cfg.quiet = True
+    return cfg
+
+
+def _convert(
+    cfg: PdfCfg,
+    markdown_content: Source,
+    stream: BinaryIO,
+    backend: RenderBackend | None = None,
+    cancelled: threading.Event | None = None,
+) -> None:
+    """Convert the document stage by stage, without the prompt and the messages of the command line,
+    checking between the sections whether the conversion was cancelled."""
+    processor = MarkdownProcessor(cfg, backend=backend)
+    with ErrorHandler.collect() as errors:
+        try:
+            converter = PdfConverter(cfg, processor)
+            svgs, sections = processor.process_sections(markdown_content)
+            raw_html = converter.to_html(_until(cancelled, sections))
+            _check(cancelled)
+            converter.render_pdf(raw_html, svgs, stream)
+        finally:
+            processor.close()
+    if errors:
+        raise ConversionError(errors)
+
+
+def _until(cancelled: threading.Event | None, sections: Iterable[str]) -> Iterator[str]:
+    for section in sections:
+        _check(cancelled)
+        yield section
+
+
+def _check(cancelled: threading.Event | None) -> None:
+    if cancelled and cancelled.is_set():
+        raise _CancelledError()
+
+
+# region AsyncConverter
+
+
+class _SharedBackend(RenderBackend):
+    """The backend of an AsyncConverter as seen by one conversion: the requests of all the conversions
+    share the HTTP pool and a limit of requests at once, and the ones of a cancelled conversion are not sent."""
+
+    def __init__(self, backend: RenderBackend, requests: threading.BoundedSemaphore, cancelled: threading.Event):
+        self.backend = backend
+        self.requests = requests
+        self.cancelled = cancelled
+        self.batch_size = backend.batch_size
+        self.workers = backend.workers
+
+    def render_svg(self, code: str) -> RenderResult:
+        [result] = self.render_batch([code])
+        return result
+
+    def render_batch(self, codes: list[str]) -> list[RenderResult]:
+        while not self.requests.acquire(timeout=Constants.CANCEL_POLL):
+            _check(self.cancelled)
+        try:
+            _check(self.cancelled)
+            return self.backend.render_batch(codes)
+        finally:
+            self.requests.release()
+
+    def identity(self) -> str:
+        return self.backend.identity()
+
+    def payload_size(self, code: str) -> int:
+        return self.backend.payload_size(code)
+
+    def close(self) -> None:
+        """The backend is shared, and closed with the AsyncConverter."""
+
+
+class AsyncConverter:
+    """Convert documents from asyncio code without blocking the event loop.
+    Each conversion runs in a thread of a bounded pool, with its own processor and errors, and the conversions
+    beyond the pool wait for a free thread in the event loop, so a burst of calls is queued instead of piling up.
+    The diagrams of all the conversions are rendered with a single backend, with its HTTP pool, and at most
+    max_requests at once, so the render endpoint sees a bounded load whatever the number of conversions.
+    A conversion that is cancelled or exceeds its deadline stops at its next diagram or section.
+    """
+
+    def __init__(
+        self,
+        options: PdfOptions | None = None,
+        max_conversions: int = Constants.ASYNC_CONVERSIONS,
+        max_requests: int = Constants.RENDER_JOBS,
+        backend: RenderBackend | None = None,
+    ) -> None:
+        if max_conversions < 1 or max_requests < 1:
+            raise ValueError("max_conversions and max_requests must be at least 1")
+        self.cfg = _settings(options)
+        self.backend = backend or MermaidRenderer._backend(self.cfg)
+        self.requests = threading.BoundedSemaphore(max_requests)
+        self.slots = asyncio.Semaphore(max_conversions)
+        self.executor = ThreadPoolExecutor(max_workers=max_conversions, thread_name_prefix="convert")
+
+    async def convert(self, markdown_content: Source, timeout: float | None = None) -> bytes:
+        """Convert the Markdown to PDF and return the PDF, waiting for a free thread first.
+        It raises a ConversionError for the errors of the conversion, with the PDF in its pdf, and
+        asyncio.TimeoutError when it takes longer than the timeout in seconds, counted from the call."""
+        output = io.BytesIO()
+        try:
+            await asyncio.wait_for(self._convert(markdown_content, output), timeout)
+        except ConversionError as e:
+            e.pdf = output.getvalue()
+            raise
+        return output.getvalue()
+
+    async def _convert(self, markdown_content: Source, stream: BinaryIO) -> None:
+        async with self.slots:
+            cancelled = threading.Event()
+            backend = _SharedBackend(self.backend, self.requests, cancelled)
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor, _convert, self.cfg, markdown_content, stream, backend, cancelled
+            )
+            try:
+                await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The thread can not be interrupted: it is told to stop, and its result is dropped
+                cancelled.set()
+                future.add_done_callback(lambda done: done.cancelled() or done.exception())
+                raise
+
+    async def aclose(self) -> None:
+        """Wait for the running conversions and release the threads and the backend."""
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        self.backend.close()
+
+    async def __aenter__(self) -> "AsyncConverter":
+        return self
+
+    async def __aexit__(self, *args: object) -> None:
+        await self.aclose()
+
+
+async def convert_async(
+    markdown_content: Source, options: PdfOptions | None = None, timeout: float | None = None
+) -> bytes:
+    """Convert a single document from asyncio code, see AsyncConverter. A service that converts many
+    documents should keep an AsyncConverter, to share its threads and its HTTP pool."""
+    async with AsyncConverter(options, max_conversions=1) as converter:
+        return await converter.convert(markdown_content, timeout)
@@ -0,0 +1,189 @@
+import copy
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from src.core.color import Color, colour
+from src.core.models import ErrorHandler, PdfCfg
+from src.manifest import Manifest, fingerprint
+
+if TYPE_CHECKING:
+    from src.markdown.processor import MarkdownProcessor
+    from src.pdf.converter import PdfConverter
+
+# region BatchResult
+
+
+@dataclass
+class BatchResult:
+    """Result of the conversion of a document of the batch."""
+
+    md_path: str
+    pdf_path: str
+    seconds: float = 0.0
+    errors: list[str] = field(default_factory=list)
+    # Not converted, as its inputs did not change since its PDF was built
+    skipped: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+# region collect_documents
+
+
+def collect_documents(paths: list[str]) -> list[Path]:
+    """Expand the paths to the Markdown files to convert, in order and without duplicates.
+    A path can be a file, a glob pattern, or a directory, which is searched recursively for *.md files."""
+    documents: dict[Path, None] = {}
+    for path in paths:
+        if os.path.isdir(path):
+            matches = sorted(Path(path).rglob("*.md"))
+        elif glob.has_magic(path):
+            matches = [Path(p) for p in sorted(glob.glob(path, recursive=True)) if os.path.isfile(p)]
+        else:
+            matches = [Path(path)]
+        for match in matches:
+            documents.setdefault(match.resolve(), None)
+    return list(documents)
+
+
+def output_paths(documents: list[Path], output_dir: str) -> list[Path]:
+    """Return the PDF path of each document inside the output directory, keeping the relative layout
+    of the documents so two files with the same name in different directories do not collide."""
+    if not documents:
+        return []
+    root = Path(os.path.commonpath([doc.parent for doc in documents]))
+    return [Path(output_dir) / doc.relative_to(root).with_suffix(".pdf") for doc in documents]
+
+
+# region BatchConverter
+
+
+class BatchConverter:
+    """Convert many documents in one process, sharing the configuration and the processor,
+    with its HTTP pool and diagram cache, between all of them.
+    Nothing but the PDF is written to disk, so the documents can also be spread over a pool of processes.
+    """
+
+    def __init__(self, cfg: PdfCfg) -> None:
+        # The conversion stages are imported when a document is converted, so a build with nothing to do is fast
+        from src.markdown.processor import MarkdownProcessor
+        from src.pdf.converter import PdfConverter
+
+        self.cfg = cfg
+        self.processor: "MarkdownProcessor" = MarkdownProcessor(cfg)
+        # A single converter keeps the fonts and stylesheet it loaded for the next documents
+        self.converter: "PdfConverter" = PdfConverter(cfg, self.processor)
+
+    def convert(self, md_path: str, pdf_path: str) -> BatchResult:
+        """Convert a document, returning its errors instead of exiting."""
+        from src.markdown.sections import open_markdown
+
+        result = BatchResult(md_path, pdf_path)
+        start = time.perf_counter()
+        with ErrorHandler.collect() as errors:
+            try:
+                os.makedirs(os.path.dirname(pdf_path) or ".", exist_ok=True)
+                cfg = copy.copy(self.cfg)
+                cfg.md_path = md_path
+                cfg.pdf_path = pdf_path
+                self.processor.cfg = self.converter.cfg = cfg
+                with open_markdown(md_path) as markdown_content:
+                    self.converter.convert(markdown_content)
+            except Exception as e:
+                ErrorHandler.add_error(f"Error converting {md_path}: {type(e).__name__}: {e}")
+            finally:
+                self.processor.cfg = self.converter.cfg = self.cfg
+        result.errors = errors
+        result.seconds = time.perf_counter() - start
+        return result
+
+    def close(self) -> None:
+        self.processor.close()
+
+
+_worker: BatchConverter | None = None
+
+
+def _init_worker(cfg: PdfCfg) -> None:
+    global _worker
+    _worker = BatchConverter(cfg)
+
+
+def _convert_in_worker(md_path: str, pdf_path: str) -> BatchResult:
+    assert _worker is not None
+    return _worker.convert(md_path, pdf_path)
+
+
+def run_batch(
+    cfg: PdfCfg, documents: list[Path], output_dir: str, workers: int = 1, force: bool = False
+) -> list[BatchResult]:
+    """Convert the documents into the output directory and return the results in the same order.
+    The documents whose inputs did not change since their PDF was built, by the manifest of the output directory,
+    are skipped unless forced. With more than one worker, the documents are spread over a pool of processes."""
+    manifest = Manifest(output_dir)
+    results: list[BatchResult] = []
+    jobs: dict[int, tuple[str, str]] = {}
+    fingerprints: dict[int, str] = {}
+    for i, (doc, pdf) in enumerate(zip(documents, output_paths(documents, output_dir))):
+        results.append(BatchResult(str(doc), str(pdf)))
+        try:
+            fingerprints[i] = fingerprint(cfg, str(doc))
+        except OSError:
+            pass
+        if not force and i in fingerprints and manifest.is_current(str(pdf), fingerprints[i]):
+            results[i].skipped = True
+        else:
+            jobs[i] = (str(doc), str(pdf))
+
+    for i, result in zip(jobs, _convert_jobs(cfg, list(jobs.values()), workers)):
+        results[i] = result
+        if result.ok and i in fingerprints:
+            manifest.record(result.pdf_path, fingerprints[i])
+        else:
+            manifest.forget(result.pdf_path)
+    manifest.save()
+    return results
+
+
+def _convert_jobs(cfg: PdfCfg, jobs: list[tuple[str, str]], workers: int) -> list[BatchResult]:
+    if not jobs:
+        return []
+    if workers <= 1 or len(jobs) <= 1:
+        converter = BatchConverter(cfg)
+        try:
+            return [converter.convert(md_path, pdf_path) for md_path, pdf_path in jobs]
+        finally:
+            converter.close()
+
+    from src.markdown.cache import open_cache
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=_init_worker, initargs=(cfg,)) as pool:
+        futures = [pool.submit(_convert_in_worker, md_path, pdf_path) for md_path, pdf_path in jobs]
+        results = [future.result() for future in futures]
+    # The workers share the cache, it is evicted once when all of them have finished
+    if cache := open_cache(cfg.cache_dir):
+        cache.close()
+    return results
+
+
+def print_summary(results: list[BatchResult]) -> None:
+    """Print the result of each document converted and the totals."""
+    for result in results:
+        if result.skipped:
+            continue
+        if result.ok:
+            print(colour(Color.GREEN, f"OK    {result.md_path} -> {result.pdf_path} ({result.seconds:.1f}s)"))
+        else:
+            print(colour(Color.RED, f"FAIL  {result.md_path} ({result.seconds:.1f}s)"))
+            for error in result.errors:
+                print(colour(Color.RED, f"      {error}"))
+    failed = sum(1 for result in results if not result.ok)
+    skipped = sum(1 for result in results if result.skipped)
+    print(f"{len(results) - failed - skipped} converted, {skipped} up to date, {failed} failed.")
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from typing import TypeAlias
 
@@ -5,6 +6,50 @@ from typing import TypeAlias
 class Constants:
     SCRIPT_PATH = Path(__file__).resolve().parent.parent.parent
     DIV_BREAK_AFTER = '<div style="page-break-after: always;"></div>'
+    DIAGRAM_URL = "mermaid://diagrams/"
+    CACHE_DIR = SCRIPT_PATH / ".cache" / "diagrams"
+    CACHE_MAX_BYTES = 256 * 1024 * 1024
+    CACHE_MAX_AGE = 30 * 24 * 3600.0
+    # A process evicts a cache when it first closes it, and then at most once in this time
+    CACHE_EVICT_INTERVAL = 3600.0
+    RENDER_JOBS = 8
+    RENDER_TIMEOUT = 60.0
+    RENDER_RETRIES = 3
+    RENDER_BACKOFF = 0.5
+    RENDER_MAX_BACKOFF = 30.0
+    FAILURE_TTL = 24 * 3600.0
+    BREAKER_FAILURES = 5
+    BREAKER_COOLDOWN = 30.0
+    CONNECT_TIMEOUT = 10.0
+    PAYLOAD_BUDGET = 6000
+    MIN_PAYLOAD_BUDGET = 256
+    WATCH_INTERVAL = 0.5
+    SVG_PRECISION = 2
+    SVG_MEMO_SIZE = 4096
+    MMDC_WORKERS = 2
+    MMDC_BATCH_SIZE = 50
+    LAYOUT_JOBS = 1
+    MARKDOWN_JOBS = 1
+    MARKDOWN_WINDOW = 4
+    HTML_CACHE_MIN_BYTES = 2048
+    ASSET_JOBS = 8
+    ASSET_TIMEOUT = 30.0
+    ASSET_MEMORY_BYTES = 64 * 1024 * 1024
+    LAYOUT_MIN_PAGES = 50
+    MANIFEST_NAME = ".md-mermaid-pdf.json"
+    ASYNC_CONVERSIONS = 4
+    MAX_INPUT_BYTES = 256 * 1024 * 1024
+    MAX_DIAGRAMS = 1000
+    MAX_DIAGRAM_LINES = 5000
+    MAX_DIAGRAM_BYTES = 256 * 1024
+    RENDER_DEADLINE = 900.0
+    CANCEL_POLL = 0.1
+    SERVE_HOST = "127.0.0.1"
+    SERVE_PORT = 8080
+    SERVE_QUEUE_SIZE = 16
+    SERVE_JOB_TIMEOUT = 300.0
+    SERVE_MAX_BYTES = 32 * 1024 * 1024
+    MERMAID_URL = os.getenv("MERMAID_INK_SERVER", "https://mermaid.ink")
 
 
-MDContent: TypeAlias = tuple[str, list[str]]
+MDContent: TypeAlias = tuple[str, dict[str, str]]
@@ -1,5 +1,8 @@
 import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass
+from typing import Iterator
 
 from .constants import Constants
 from .utils import print_error
@@ -16,6 +19,23 @@ class PdfOptions:
     css_path: str
     base_url: str
     debug: bool = False
+    cache_dir: str | None = None
+    no_cache: bool = False
+    jobs: int = Constants.RENDER_JOBS
+    timeout: float = Constants.RENDER_TIMEOUT
+    mermaid_url: str = Constants.MERMAID_URL
+    retries: int = Constants.RENDER_RETRIES
+    payload_budget: int = Constants.PAYLOAD_BUDGET
+    rules: str | None = None
+    mmdc: str | None = None
+    optimize_svg: bool = False
+    layout_jobs: int = Constants.LAYOUT_JOBS
+    markdown_jobs: int = Constants.MARKDOWN_JOBS
+    max_input_bytes: int = Constants.MAX_INPUT_BYTES
+    max_diagrams: int = Constants.MAX_DIAGRAMS
+    max_diagram_lines: int = Constants.MAX_DIAGRAM_LINES
+    max_diagram_bytes: int = Constants.MAX_DIAGRAM_BYTES
+    render_deadline: float = Constants.RENDER_DEADLINE
 
 
 # region PdfCfg
@@ -24,23 +44,85 @@ class PdfOptions:
 class PdfCfg:
     """Dto Configuration for the PDF renderer."""
 
-    def __init__(self, md_path: str, pdf_path: str, css_path: str, base_url: str, debug: bool) -> None:
+    def __init__(
+        self,
+        md_path: str,
+        pdf_path: str,
+        css_path: str,
+        base_url: str,
+        debug: bool,
+        cache_dir: str | None = None,
+        jobs: int = Constants.RENDER_JOBS,
+        render_timeout: float = Constants.RENDER_TIMEOUT,
+        mermaid_url: str = Constants.MERMAID_URL,
+        render_retries: int = Constants.RENDER_RETRIES,
+        payload_budget: int = Constants.PAYLOAD_BUDGET,
+        rules_path: str | None = None,
+        mmdc_path: str | None = None,
+        optimize_svg: bool = False,
+        layout_jobs: int = Constants.LAYOUT_JOBS,
+        markdown_jobs: int = Constants.MARKDOWN_JOBS,
+        max_input_bytes: int = Constants.MAX_INPUT_BYTES,
+        max_diagrams: int = Constants.MAX_DIAGRAMS,
+        max_diagram_lines: int = Constants.MAX_DIAGRAM_LINES,
+        max_diagram_bytes: int = Constants.MAX_DIAGRAM_BYTES,
+        render_deadline: float = Constants.RENDER_DEADLINE,
+        quiet: bool = False,
+    ) -> None:
         self.md_path = md_path
         self.pdf_path = pdf_path
         self.css_path = css_path
         self.base_url = base_url
-        self.tmp_md_path = f"{Constants.SCRIPT_PATH}/output/output_temp.md"
         self.is_debug = debug
+        self.cache_dir = cache_dir
+        self.jobs = jobs
+        self.render_timeout = render_timeout
+        self.mermaid_url = mermaid_url
+        self.render_retries = render_retries
+        self.payload_budget = payload_budget
+        self.rules_path = rules_path
+        self.mmdc_path = mmdc_path
+        self.optimize_svg = optimize_svg
+        self.layout_jobs = layout_jobs
+        self.markdown_jobs = markdown_jobs
+        self.max_input_bytes = max_input_bytes
+        self.max_diagrams = max_diagrams
+        self.max_diagram_lines = max_diagram_lines
+        self.max_diagram_bytes = max_diagram_bytes
+        self.render_deadline = render_deadline
+        # Neither the debug messages nor the progress bar are printed, as when converting from a library
+        self.quiet = quiet
+
+    @property
+    def verbose(self) -> bool:
+        """Whether the debug messages are printed."""
+        return self.is_debug and not self.quiet
 
 
 # region ErrorHandler
 
+# Errors of the job that runs in the current thread or task, see ErrorHandler.collect
+_job_errors: ContextVar[list[str] | None] = ContextVar("job_errors", default=None)
+
 
 class ErrorHandler:
-    """Handle errors and print help message before exiting."""
+    """Handle errors and print help message before exiting.
+    The errors are added to the global list of the command line, or to the list of the job being collected."""
 
     errors: list[str] = []
 
+    @staticmethod
+    @contextmanager
+    def collect() -> Iterator[list[str]]:
+        """Collect the errors added in the current thread or task into a new list, instead of the global one,
+        so the jobs that run at the same time do not see the errors of each other."""
+        errors: list[str] = []
+        token = _job_errors.set(errors)
+        try:
+            yield errors
+        finally:
+            _job_errors.reset(token)
+
     @staticmethod
     def print_error_and_exit(err_message: str | None = None) -> None:
         """Print the error message and exit with code 1."""
@@ -50,8 +132,9 @@ class ErrorHandler:
 
     @staticmethod
     def add_error(msg: str) -> None:
-        """Add an error message to the list of errors."""
-        ErrorHandler.errors.append(msg)
+        """Add an error message to the list of errors of the current job, or else to the global one."""
+        errors = _job_errors.get()
+        (ErrorHandler.errors if errors is None else errors).append(msg)
 
     @staticmethod
     def print_errors() -> None:
@@ -0,0 +1,134 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+# Categories of spans listed one by one in the report, instead of added up by stage
+LISTED = {"diagram": "diagrams", "network": "requests", "asset": "assets"}
+
+# region Span
+
+
+class Span:
+    """A timed stage, recorded when it ends with its wall and CPU time, its thread and its arguments."""
+
+    __slots__ = ("name", "cat", "args", "start", "cpu", "wall", "cpu_time", "tid")
+
+    def __init__(self, name: str, cat: str, args: dict[str, Any]) -> None:
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = 0.0
+        self.cpu = 0.0
+        self.wall = 0.0
+        self.cpu_time = 0.0
+        self.tid = 0
+
+    def __enter__(self) -> "Span":
+        self.tid = threading.get_ident()
+        self.start = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.wall = time.perf_counter() - self.start
+        self.cpu_time = time.thread_time() - self.cpu
+        Profiler.spans.append(self)
+
+    def set(self, **args: Any) -> None:
+        """Add arguments known at the end of the stage, as the size of a response."""
+        self.args.update(args)
+
+
+class _NullSpan:
+    """Span of a disabled profiler, that records nothing."""
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        return None
+
+    def set(self, **args: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+# region Profiler
+
+
+class Profiler:
+    """Record the wall and CPU time of the stages of the conversion, and of each request to the Mermaid server.
+    It is disabled by default, then a span is a shared object that does nothing."""
+
+    enabled = False
+    origin = 0.0
+    spans: list[Span] = []
+
+    @staticmethod
+    def enable() -> None:
+        Profiler.enabled = True
+        Profiler.origin = time.perf_counter()
+        Profiler.spans = []
+
+    @staticmethod
+    def disable() -> None:
+        Profiler.enabled = False
+
+    @staticmethod
+    def span(name: str, cat: str = "stage", **args: Any) -> Span | _NullSpan:
+        """Return a context manager that times a stage while the profiler is enabled."""
+        if not Profiler.enabled:
+            return _NULL_SPAN
+        return Span(name, cat, args)
+
+    @staticmethod
+    def report() -> dict[str, Any]:
+        """Return the totals by stage, in the order they ended, and each diagram and request to the Mermaid server."""
+        stages: dict[str, dict[str, float]] = {}
+        report: dict[str, Any] = {"stages": stages, **{key: [] for key in LISTED.values()}}
+        for span in Profiler.spans:
+            if span.cat in LISTED:
+                report[LISTED[span.cat]].append({"latency": round(span.wall, 6), **span.args})
+                continue
+            stage = stages.setdefault(span.name, {"count": 0, "wall": 0.0, "cpu": 0.0})
+            stage["count"] += 1
+            stage["wall"] += span.wall
+            stage["cpu"] += span.cpu_time
+        for stage in stages.values():
+            stage["wall"] = round(stage["wall"], 6)
+            stage["cpu"] = round(stage["cpu"], 6)
+        return report
+
+    @staticmethod
+    def trace_events() -> list[dict[str, Any]]:
+        """Return the spans as complete events of the Chrome trace-event format, in microseconds."""
+        pid = os.getpid()
+        return [
+            {
+                "name": span.name,
+                "cat": span.cat,
+                "ph": "X",
+                "ts": round((span.start - Profiler.origin) * 1e6, 3),
+                "dur": round(span.wall * 1e6, 3),
+                "pid": pid,
+                "tid": span.tid,
+                "args": {**span.args, "cpu_ms": round(span.cpu_time * 1e3, 3)},
+            }
+            for span in Profiler.spans
+        ]
+
+    @staticmethod
+    def write(path: str) -> str:
+        """Write the report to the path, and the trace to the same path with the .trace.json suffix.
+        Return the path of the trace, that can be loaded in chrome://tracing or in Perfetto."""
+        report_path = Path(path)
+        trace_path = report_path.with_suffix(".trace.json")
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        report_path.write_text(json.dumps(Profiler.report(), indent=2) + "\n")
+        trace_path.write_text(json.dumps({"traceEvents": Profiler.trace_events(), "displayTimeUnit": "ms"}))
+        return str(trace_path)
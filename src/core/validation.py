@@ -1,3 +1,4 @@
+import shutil
 from pathlib import Path
 
 from .constants import Constants
@@ -11,28 +12,92 @@ DIR = "dir"
 
 
 def cli_settings(ops: PdfOptions) -> PdfCfg:
-    """Check the options and return the PdfCfg object."""
+    """Check the options and return the PdfCfg object, or print the error and exit."""
+    try:
+        return settings(ops)
+    except ValueError as e:
+        ErrorHandler.print_error_and_exit(f"Error: {e}")
+        raise
+
+
+def settings(ops: PdfOptions) -> PdfCfg:
+    """Check the options and return the PdfCfg object, raising a ValueError for an invalid option."""
     if ops.md_path:
         check_path(ops.md_path, "Markdown file", FILE)
     if ops.css_path:
         check_path(ops.css_path, "CSS file", FILE)
     else:
         ops.css_path = str(Constants.SCRIPT_PATH / "resources" / "style.css")
+    if ops.rules:
+        check_path(ops.rules, "Rules file", FILE)
     if ops.base_url:
         check_path(ops.base_url, "Base URL", DIR)
     else:
         ops.base_url = str(Constants.SCRIPT_PATH / "img")
+    if ops.no_cache:
+        ops.cache_dir = None
+    elif not ops.cache_dir:
+        ops.cache_dir = str(Constants.CACHE_DIR)
+
+    if ops.jobs < 1:
+        raise ValueError(f"--jobs must be at least 1, got {ops.jobs}")
+    if ops.layout_jobs < 1:
+        raise ValueError(f"--layout-jobs must be at least 1, got {ops.layout_jobs}")
+    if ops.markdown_jobs < 1:
+        raise ValueError(f"--markdown-jobs must be at least 1, got {ops.markdown_jobs}")
+    for name, value in [
+        ("--max-input-bytes", ops.max_input_bytes),
+        ("--max-diagrams", ops.max_diagrams),
+        ("--max-diagram-lines", ops.max_diagram_lines),
+        ("--max-diagram-bytes", ops.max_diagram_bytes),
+    ]:
+        if value < 1:
+            raise ValueError(f"{name} must be at least 1, got {value}")
+    if ops.render_deadline <= 0:
+        raise ValueError(f"--render-deadline must be positive, got {ops.render_deadline}")
+    if ops.timeout <= 0:
+        raise ValueError(f"--timeout must be positive, got {ops.timeout}")
+    if ops.retries < 0:
+        raise ValueError(f"--retries can not be negative, got {ops.retries}")
+    if ops.payload_budget < Constants.MIN_PAYLOAD_BUDGET:
+        raise ValueError(f"--payload-budget must be at least {Constants.MIN_PAYLOAD_BUDGET}, got {ops.payload_budget}")
+    if ops.mmdc and not shutil.which(ops.mmdc):
+        raise ValueError(f"mermaid-cli executable not found: {ops.mmdc}")
+    if not ops.mermaid_url.startswith(("http://", "https://")):
+        raise ValueError(f"Mermaid server must be an http(s) URL, got {ops.mermaid_url}")
 
-    return PdfCfg(ops.md_path, ops.pdf_path, ops.css_path, ops.base_url, ops.debug)
+    return PdfCfg(
+        ops.md_path,
+        ops.pdf_path,
+        ops.css_path,
+        ops.base_url,
+        ops.debug,
+        cache_dir=ops.cache_dir,
+        jobs=ops.jobs,
+        render_timeout=ops.timeout,
+        mermaid_url=ops.mermaid_url,
+        render_retries=ops.retries,
+        payload_budget=ops.payload_budget,
+        rules_path=ops.rules,
+        mmdc_path=ops.mmdc,
+        optimize_svg=ops.optimize_svg,
+        layout_jobs=ops.layout_jobs,
+        markdown_jobs=ops.markdown_jobs,
+        max_input_bytes=ops.max_input_bytes,
+        max_diagrams=ops.max_diagrams,
+        max_diagram_lines=ops.max_diagram_lines,
+        max_diagram_bytes=ops.max_diagram_bytes,
+        render_deadline=ops.render_deadline,
+    )
 
 
 def check_path(path: str, path_type: str, expected_type: str) -> None:
     """Check if the path exists and is of the expected type."""
     p = Path(path)
-    error_message = f"Error: {path_type} not found at {p}"
+    error_message = f"{path_type} not found at {p}"
 
     if expected_type == FILE:
         if not (p.exists() and p.is_file()):
-            ErrorHandler.print_error_and_exit(error_message)
+            raise ValueError(error_message)
     elif expected_type == DIR and not (p.exists() and p.is_dir()):
-        ErrorHandler.print_error_and_exit(error_message)
+        raise ValueError(error_message)
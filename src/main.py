@@ -2,12 +2,143 @@
 #!/usr/bin/python
 
 
+import os
+import sys
+from typing import Any, Callable
+
 import click
 
+from src.core.constants import Constants
 from src.core.models import ErrorHandler, PdfCfg, PdfOptions
+from src.core.profiler import Profiler
+from src.core.utils import print_dbg
 from src.core.validation import cli_settings
-from src.markdown.processor import MarkdownProcessor
-from src.pdf.converter import PdfConverter
+from src.markdown.rules import load_rules
+
+
+def checked_settings(op: PdfOptions) -> PdfCfg:
+    """Check the options and the rules of the rules file, or print the error and exit."""
+    cfg = cli_settings(op)
+    try:
+        load_rules(cfg.rules_path)
+    except ValueError as e:
+        ErrorHandler.print_error_and_exit(f"Error: {e}")
+    return cfg
+
+
+def render_options(command: Callable[..., None]) -> Callable[..., None]:
+    """Options shared by the commands, named as the fields of PdfOptions."""
+    options = [
+        click.option("--debug", is_flag=True, help="Enable debug mode."),
+        click.option(
+            "--cache-dir",
+            type=str,
+            default=None,
+            help="Cache of rendered diagrams: a directory, or a .sqlite file for a single-file store.",
+        ),
+        click.option("--no-cache", is_flag=True, help="Render every diagram again without using the cache."),
+        click.option(
+            "--rules",
+            type=str,
+            default=None,
+            help="JSON file with rewrite rules applied to the document, after the default cleanup.",
+        ),
+        click.option(
+            "--jobs", type=int, default=Constants.RENDER_JOBS, show_default=True, help="Diagrams rendered concurrently."
+        ),
+        click.option(
+            "--timeout",
+            type=float,
+            default=Constants.RENDER_TIMEOUT,
+            show_default=True,
+            help="Seconds to wait for each response of the Mermaid server.",
+        ),
+        click.option(
+            "--mermaid-url",
+            type=str,
+            default=Constants.MERMAID_URL,
+            show_default=True,
+            help="mermaid-ink server, as a self-hosted container. Defaults to $MERMAID_INK_SERVER.",
+        ),
+        click.option(
+            "--mmdc",
+            type=str,
+            default=None,
+            help="Render the diagrams with this mermaid-cli executable, in batches, instead of the Mermaid server.",
+        ),
+        click.option(
+            "--optimize-svg",
+            is_flag=True,
+            help="Make the SVGs of the diagrams smaller before the PDF: without metadata, unused definitions "
+            "and repeated styles, and with rounded coordinates.",
+        ),
+        click.option(
+            "--retries",
+            type=int,
+            default=Constants.RENDER_RETRIES,
+            show_default=True,
+            help="Retries on 429 and 5xx errors.",
+        ),
+        click.option(
+            "--payload-budget",
+            type=int,
+            default=Constants.PAYLOAD_BUDGET,
+            show_default=True,
+            help="Bytes of the encoded diagram in each request, longer diagrams are split.",
+        ),
+        click.option(
+            "--layout-jobs",
+            type=int,
+            default=Constants.LAYOUT_JOBS,
+            show_default=True,
+            help="Processes that lay out groups of pages of a large document, combined into a single PDF.",
+        ),
+        click.option(
+            "--markdown-jobs",
+            type=int,
+            default=Constants.MARKDOWN_JOBS,
+            show_default=True,
+            help="Processes that convert to HTML the sections of the document that are not cached.",
+        ),
+        click.option(
+            "--max-input-bytes",
+            type=int,
+            default=Constants.MAX_INPUT_BYTES,
+            show_default=True,
+            help="Size of the document converted, the rest of a larger one is left out.",
+        ),
+        click.option(
+            "--max-diagrams",
+            type=int,
+            default=Constants.MAX_DIAGRAMS,
+            show_default=True,
+            help="Diagrams rendered in a document, the rest show a placeholder.",
+        ),
+        click.option(
+            "--max-diagram-lines",
+            type=int,
+            default=Constants.MAX_DIAGRAM_LINES,
+            show_default=True,
+            help="Lines of a diagram that is rendered, a longer one shows a placeholder.",
+        ),
+        click.option(
+            "--max-diagram-bytes",
+            type=int,
+            default=Constants.MAX_DIAGRAM_BYTES,
+            show_default=True,
+            help="Bytes of a diagram that is rendered, a larger one shows a placeholder.",
+        ),
+        click.option(
+            "--render-deadline",
+            type=float,
+            default=Constants.RENDER_DEADLINE,
+            show_default=True,
+            help="Seconds to render all the diagrams of a document, the ones left show a placeholder.",
+        ),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
 
 
 @click.command()
@@ -15,22 +146,143 @@ from src.pdf.converter import PdfConverter
 @click.argument("pdf_path", type=str, required=False)
 @click.argument("css_path", type=str, required=False)
 @click.argument("base_url", type=str, required=False)
-@click.option("--debug", is_flag=True, help="Enable debug mode.")
-def run(md_path: str, pdf_path: str, css_path: str, base_url: str, debug: bool) -> None:
-    op = PdfOptions(md_path, pdf_path, css_path, base_url, debug)
-    cfg = cli_settings(op)
+@click.option("--watch", is_flag=True, help="Rebuild the PDF each time the Markdown or the CSS file changes.")
+@click.option("--force", is_flag=True, help="Convert the document even if its inputs did not change since the PDF.")
+@click.option(
+    "--profile",
+    type=str,
+    default=None,
+    help="Write the time of each stage and request to this JSON file, and a Chrome trace next to it.",
+)
+@render_options
+def run(
+    md_path: str,
+    pdf_path: str,
+    css_path: str,
+    base_url: str,
+    watch: bool,
+    force: bool,
+    profile: str | None,
+    **options: Any,
+) -> None:
+    op = PdfOptions(md_path, pdf_path, css_path, base_url, **options)
+    cfg = checked_settings(op)
+
+    if profile:
+        Profiler.enable()
+    try:
+        if watch:
+            from src.watch import Watcher
+
+            Watcher(cfg).run()
+        else:
+            main(cfg, force)
+    finally:
+        if profile:
+            trace_path = Profiler.write(profile)
+            print_dbg(f"Profile written to {profile} and {trace_path}")
+
+
+@click.command()
+@click.argument("paths", type=str, nargs=-1, required=True)
+@click.option("--output-dir", type=str, default="output", show_default=True, help="Directory of the PDF files.")
+@click.option("--css-path", type=str, default=None, help="CSS file, the default style if it is not set.")
+@click.option("--base-url", type=str, default=None, help="Base directory of the images of the documents.")
+@click.option("--workers", type=int, default=1, show_default=True, help="Documents converted in parallel processes.")
+@click.option("--force", is_flag=True, help="Convert every document, also the ones whose inputs did not change.")
+@render_options
+def batch(
+    paths: tuple[str, ...], output_dir: str, css_path: str, base_url: str, workers: int, force: bool, **options: Any
+) -> None:
+    """Convert many Markdown files, directories or glob patterns, to PDF files in the output directory."""
+    op = PdfOptions("", "", css_path, base_url, **options)
+    cfg = checked_settings(op)
+    from src.batch import collect_documents, print_summary, run_batch
+
+    documents = collect_documents(list(paths))
+    if not documents:
+        ErrorHandler.print_error_and_exit(f"Error: No Markdown files found in {' '.join(paths)}")
+    results = run_batch(cfg, documents, output_dir, workers, force)
+    print_summary(results)
+    if not all(result.ok for result in results):
+        sys.exit(1)
+
+
+@click.command()
+@click.option("--css-path", type=str, default=None, help="CSS file, the default style if it is not set.")
+@click.option("--base-url", type=str, default=None, help="Base directory of the images of the documents.")
+@click.option("--host", type=str, default=Constants.SERVE_HOST, show_default=True, help="Address of the HTTP server.")
+@click.option("--port", type=int, default=Constants.SERVE_PORT, show_default=True, help="Port of the HTTP server.")
+@click.option("--socket", "socket_path", type=str, default=None, help="Serve on this Unix socket instead of HTTP.")
+@click.option("--workers", type=int, default=1, show_default=True, help="Documents converted at once, by processes.")
+@click.option(
+    "--queue-size",
+    type=int,
+    default=Constants.SERVE_QUEUE_SIZE,
+    show_default=True,
+    help="Jobs waiting for a worker, more are rejected with 503.",
+)
+@click.option(
+    "--job-timeout",
+    type=float,
+    default=Constants.SERVE_JOB_TIMEOUT,
+    show_default=True,
+    help="Seconds to wait for each conversion, it is answered with 504 after them.",
+)
+@render_options
+def serve(
+    css_path: str,
+    base_url: str,
+    host: str,
+    port: int,
+    socket_path: str | None,
+    workers: int,
+    queue_size: int,
+    job_timeout: float,
+    **options: Any,
+) -> None:
+    """Keep the converter running and convert the Markdown posted to /convert, over HTTP or a Unix socket."""
+    op = PdfOptions("", "", css_path, base_url, **options)
+    cfg = checked_settings(op)
+    if workers < 1:
+        ErrorHandler.print_error_and_exit(f"Error: --workers must be at least 1, got {workers}")
+    if queue_size < 0:
+        ErrorHandler.print_error_and_exit(f"Error: --queue-size can not be negative, got {queue_size}")
+    if job_timeout <= 0:
+        ErrorHandler.print_error_and_exit(f"Error: --job-timeout must be positive, got {job_timeout}")
+    from src.serve import serve_forever
+
+    try:
+        serve_forever(cfg, host, port, socket_path, workers, queue_size, job_timeout)
+    except OSError as e:
+        ErrorHandler.print_error_and_exit(f"Error: can not serve: {e}")
+
 
-    main(cfg)
+def main(cfg: PdfCfg, force: bool = False) -> None:
+    """Convert the document, unless its PDF was built from the same inputs, by the manifest of its directory."""
+    from src.manifest import Manifest, fingerprint
 
+    manifest = Manifest(os.path.dirname(cfg.pdf_path)) if cfg.pdf_path else None
+    current = fingerprint(cfg, cfg.md_path) if manifest else None
+    if manifest and current and not force and manifest.is_current(cfg.pdf_path, current):
+        print_dbg(f"{cfg.pdf_path} is up to date, use --force to convert it again")
+        return
 
-def main(cfg: PdfCfg) -> None:
-    with open(cfg.md_path) as f:
-        markdown_content = f.read()
-    f.close()
+    # The conversion stages are imported when they run, so --help, a rejected path or an up to date PDF do not load them
+    from src.markdown.processor import MarkdownProcessor
+    from src.markdown.sections import open_markdown
+    from src.pdf.converter import PdfConverter
 
     processor = MarkdownProcessor(cfg)
-    converter = PdfConverter(cfg, processor)
-    converter.convert_to_pdf(markdown_content)
+    try:
+        converter = PdfConverter(cfg, processor)
+        with open_markdown(cfg.md_path) as markdown_content:
+            converter.convert_to_pdf(markdown_content)
+    finally:
+        processor.close()
+    if manifest and current and not ErrorHandler.errors:
+        manifest.record(cfg.pdf_path, current)
+        manifest.save()
     ErrorHandler.print_errors()
 
 
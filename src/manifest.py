@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+from functools import lru_cache
+from importlib import metadata
+from pathlib import Path
+from urllib.parse import urlsplit
+from urllib.request import url2pathname
+
+from src.core.constants import Constants
+from src.core.models import PdfCfg
+from src.markdown.assets import find_assets, resolve_url
+
+
+@lru_cache(maxsize=1)
+def converter_version() -> str:
+    """Return the versions of the converter and of the libraries that shape its output, read without importing them."""
+    versions = []
+    for package in ("md-mermaid-pdf", "markdown2", "weasyprint"):
+        try:
+            versions.append(f"{package} {metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            versions.append(f"{package} unknown")
+    return ", ".join(versions)
+
+
+def fingerprint(cfg: PdfCfg, md_path: str) -> str:
+    """Return the hash of everything a PDF is built from: the Markdown, the stylesheet and the rules,
+    the local images and the URLs of the remote ones, the render settings and the converter version."""
+    digest = hashlib.sha256()
+
+    def update(data: bytes | str) -> None:
+        digest.update(data.encode("utf-8") if isinstance(data, str) else data)
+        digest.update(b"\0")
+
+    settings = (converter_version(), cfg.base_url, cfg.mermaid_url, cfg.mmdc_path, cfg.optimize_svg, cfg.payload_budget)
+    for setting in settings:
+        update(str(setting))
+    markdown = Path(md_path).read_bytes()
+    update(markdown)
+    for path in (cfg.css_path, cfg.rules_path):
+        update(_file_digest(path) if path else "")
+    for url in sorted(set(find_assets(markdown.decode("utf-8", errors="replace")))):
+        absolute = resolve_url(url, cfg.base_url)
+        update(absolute)
+        if urlsplit(absolute).scheme == "file":
+            update(_file_digest(url2pathname(urlsplit(absolute).path)))
+    return digest.hexdigest()
+
+
+def _file_digest(path: str) -> str:
+    try:
+        return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    except OSError:
+        return "missing"
+
+
+# region Manifest
+
+
+class Manifest:
+    """Fingerprint of the inputs of each PDF built in a directory, kept in a JSON file in it,
+    so a build skips the documents whose inputs did not change and whose PDF still exists.
+    The PDFs are recorded by their path relative to the directory."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = Path(directory or ".")
+        self.path = self.directory / Constants.MANIFEST_NAME
+        try:
+            self.entries: dict[str, str] = json.loads(self.path.read_text("utf-8"))
+        except (OSError, ValueError):
+            self.entries = {}
+        self.changed = False
+
+    def is_current(self, pdf_path: str, fingerprint: str) -> bool:
+        """Return whether the PDF exists and was built from inputs with the same fingerprint."""
+        return self.entries.get(self._name(pdf_path)) == fingerprint and os.path.isfile(pdf_path)
+
+    def record(self, pdf_path: str, fingerprint: str) -> None:
+        self.entries[self._name(pdf_path)] = fingerprint
+        self.changed = True
+
+    def forget(self, pdf_path: str) -> None:
+        if self.entries.pop(self._name(pdf_path), None) is not None:
+            self.changed = True
+
+    def save(self) -> None:
+        """Write the manifest if it changed, replacing the previous one at once."""
+        if not self.changed:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(self.entries, indent=2, sort_keys=True) + "\n", "utf-8")
+        os.replace(tmp, self.path)
+        self.changed = False
+
+    def _name(self, pdf_path: str) -> str:
+        return Path(os.path.relpath(Path(pdf_path).resolve(), self.directory.resolve())).as_posix()
@@ -0,0 +1,230 @@
+import json
+import mimetypes
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterable
+from urllib.parse import urljoin, urlsplit
+from urllib.request import url2pathname
+
+from src.core.constants import Constants
+from src.core.profiler import Profiler
+
+from .cache import DiagramCache
+
+if TYPE_CHECKING:
+    import requests
+
+# Images of a section, in Markdown and in HTML
+IMAGE_PATTERN = re.compile(
+    r"!\[[^\]]*\]\(\s*(?:<(?P<angle>[^>]+)>|(?P<markdown>[^)\s]+))[^)]*\)"
+    r"|<img\b[^>]*?\bsrc\s*=\s*[\"'](?P<html>[^\"']+)[\"']",
+    re.IGNORECASE,
+)
+# Code blocks, fenced up to the end of the section when they are not closed, and code spans,
+# whose images are text and not fetched
+CODE_PATTERN = re.compile(
+    r"^ {0,3}(?P<fence>`{3,}|~{3,}).*?(?:^ {0,3}(?P=fence)[ \t]*$|\Z)|(?P<ticks>`+)(?!`).+?(?<!`)(?P=ticks)(?!`)",
+    re.MULTILINE | re.DOTALL,
+)
+# Schemes of the assets that are fetched ahead, the others are left to WeasyPrint
+PREFETCHED_SCHEMES = frozenset({"http", "https", "file"})
+
+
+def find_assets(section: str) -> list[str]:
+    """Return the URLs of the images of a section, as they are written, but the ones in code."""
+    return [
+        match.group("angle") or match.group("markdown") or match.group("html")
+        for match in IMAGE_PATTERN.finditer(CODE_PATTERN.sub("", section))
+    ]
+
+
+def resolve_url(url: str, base_url: str) -> str:
+    """Return the absolute URL of an asset, resolved against the base URL as WeasyPrint does:
+    a base that is a path is taken as a file URL, as a directory when it is one."""
+    if urlsplit(url).scheme:
+        return url
+    if not urlsplit(base_url).scheme:
+        path = Path(base_url or ".").resolve()
+        base_url = path.as_uri() + ("/" if path.is_dir() else "")
+    return urljoin(base_url, url)
+
+
+@dataclass
+class Asset:
+    body: bytes
+    content_type: str
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+# region AssetFetcher
+
+
+class AssetFetcher:
+    """Fetch the images of a document concurrently, while its diagrams are rendered, so the PDF engine
+    finds them in memory instead of fetching them one at a time during the layout.
+    The remote assets are kept in the cache with their ETag and Last-Modified, and in memory up to a size,
+    and are requested again with a conditional request, so an asset that did not change is not downloaded again.
+    The assets of a document are kept for it up to the same size, the ones beyond it are left to WeasyPrint.
+    """
+
+    def __init__(
+        self,
+        cache: DiagramCache | None = None,
+        jobs: int = Constants.ASSET_JOBS,
+        max_bytes: int = Constants.ASSET_MEMORY_BYTES,
+        timeout: float = Constants.ASSET_TIMEOUT,
+    ) -> None:
+        self.cache = cache
+        self.jobs = jobs
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        # The assets of the current document by their absolute URL, and the size of the ones kept
+        self.futures: dict[str, Future[Asset | None]] = {}
+        self.kept_bytes = 0
+        # The remote assets used last, up to max_bytes
+        self.memory: OrderedDict[str, Asset] = OrderedDict()
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+        self.executor: ThreadPoolExecutor | None = None
+        # The HTTP stack is only loaded for a document with remote assets
+        self._session: "requests.Session | None" = None
+        # Remote assets downloaded, and revalidated without downloading them, in the current document
+        self.downloaded = 0
+        self.revalidated = 0
+
+    def prefetch(self, urls: Iterable[str], base_url: str) -> None:
+        """Start fetching the assets of a new document in the background, resolved against the base URL."""
+        self.futures = {}
+        self.kept_bytes = 0
+        self.downloaded = self.revalidated = 0
+        for url in urls:
+            absolute = resolve_url(url, base_url)
+            if absolute not in self.futures and urlsplit(absolute).scheme in PREFETCHED_SCHEMES:
+                self.futures[absolute] = self._pool().submit(self._fetch, absolute)
+
+    def get(self, url: str) -> Asset | None:
+        """Return the asset of the URL, waiting for it, or None if it was not prefetched or could not be fetched."""
+        future = self.futures.get(url)
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except Exception:
+            return None
+
+    def close(self) -> None:
+        """Stop the threads and close the HTTP pool."""
+        if self.executor:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        if self._session:
+            self._session.close()
+            self._session = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="asset")
+        return self.executor
+
+    @property
+    def session(self) -> "requests.Session":
+        with self.lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                self._session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=self.jobs)
+                self._session.mount("http://", adapter)
+                self._session.mount("https://", adapter)
+            return self._session
+
+    def _fetch(self, url: str) -> Asset | None:
+        """Return the asset if it fits in what is left of the size for the document, else None."""
+        if urlsplit(url).scheme == "file":
+            path = Path(url2pathname(urlsplit(url).path))
+            content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+            asset: Asset | None = Asset(path.read_bytes(), content_type)
+        else:
+            asset = self._fetch_remote(url)
+        if asset is None:
+            return None
+        with self.lock:
+            if self.kept_bytes + len(asset.body) > self.max_bytes:
+                return None
+            self.kept_bytes += len(asset.body)
+        return asset
+
+    def _fetch_remote(self, url: str) -> Asset | None:
+        """Download the asset, or revalidate the cached one with a conditional request.
+        A failed request returns None, and WeasyPrint fetches the asset and reports its error."""
+        cached = self._lookup(url)
+        headers = {}
+        if cached and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+        with Profiler.span("asset", "asset", url=url, cached=cached is not None) as span:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            span.set(status=response.status_code, bytes=len(response.content))
+        if response.status_code == 304 and cached:
+            with self.lock:
+                self.revalidated += 1
+            return cached
+        if response.status_code != 200:
+            return None
+        with self.lock:
+            self.downloaded += 1
+        content_type = response.headers.get("Content-Type") or mimetypes.guess_type(urlsplit(url).path)[0]
+        asset = Asset(
+            response.content,
+            content_type or "application/octet-stream",
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
+        self._store(url, asset)
+        return asset
+
+    def _lookup(self, url: str) -> Asset | None:
+        """Return the asset kept in memory or in the cache, or None."""
+        with self.lock:
+            if (asset := self.memory.get(url)) is not None:
+                self.memory.move_to_end(url)
+                return asset
+        data = self.cache.store.get(self._key(url)) if self.cache else None
+        if data is None:
+            return None
+        header, _, body = data.partition(b"\n")
+        meta: dict[str, Any] = json.loads(header)
+        asset = Asset(body, meta["content_type"], meta.get("etag"), meta.get("last_modified"))
+        self._remember(url, asset)
+        return asset
+
+    def _store(self, url: str, asset: Asset) -> None:
+        """Keep the asset in memory, and in the cache when the server can tell whether it changed."""
+        self._remember(url, asset)
+        if self.cache and (asset.etag or asset.last_modified):
+            meta = {"content_type": asset.content_type, "etag": asset.etag, "last_modified": asset.last_modified}
+            self.cache.store.put(self._key(url), json.dumps(meta).encode("utf-8") + b"\n" + asset.body)
+
+    def _remember(self, url: str, asset: Asset) -> None:
+        """Keep the asset in memory, dropping the ones used least recently beyond max_bytes."""
+        if len(asset.body) > self.max_bytes:
+            return
+        with self.lock:
+            if (previous := self.memory.pop(url, None)) is not None:
+                self.memory_bytes -= len(previous.body)
+            self.memory[url] = asset
+            self.memory_bytes += len(asset.body)
+            while self.memory_bytes > self.max_bytes:
+                _, dropped = self.memory.popitem(last=False)
+                self.memory_bytes -= len(dropped.body)
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return DiagramCache.key(url, "asset")
@@ -0,0 +1,206 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Callable
+
+from src.core.constants import Constants
+
+# region CacheStore
+
+
+class CacheStore(ABC):
+    """Storage backend of the diagram cache. Entries are opaque bytes addressed by a hex key."""
+
+    # Where the entries are kept, the same for every store opened on them
+    location = ""
+
+    @abstractmethod
+    def get(self, key: str) -> bytes | None:
+        """Return the entry for the key and mark it as recently used, or None if it is missing."""
+
+    @abstractmethod
+    def put(self, key: str, data: bytes) -> None:
+        """Store the entry for the key, replacing any previous one."""
+
+    @abstractmethod
+    def evict(self, max_bytes: int, max_age: float) -> int:
+        """Remove entries not used in max_age seconds, then the least recently used ones
+        until the store fits in max_bytes. Returns the number of removed entries."""
+
+    def close(self) -> None:
+        """Release the resources held by the store."""
+
+
+class DirectoryStore(CacheStore):
+    """Store each entry as a file inside a directory, sharded by the first two characters of the key.
+    The modification time of the file is used as the last access time."""
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.location = str(self.path.resolve())
+
+    def get(self, key: str) -> bytes | None:
+        file = self._file(key)
+        try:
+            data = file.read_bytes()
+            os.utime(file)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        file = self._file(key)
+        file.parent.mkdir(exist_ok=True)
+        tmp = file.with_name(f"{file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, file)
+
+    def evict(self, max_bytes: int, max_age: float) -> int:
+        entries = []
+        for file in self.path.glob("*/*.svg"):
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file))
+        return _evict_lru(entries, max_bytes, max_age, lambda file: file.unlink(missing_ok=True))
+
+    def _file(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.svg"
+
+
+class SqliteStore(CacheStore):
+    """Store all the entries in a single SQLite file, to avoid creating thousands of small files."""
+
+    def __init__(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.location = str(Path(path).resolve())
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> bytes | None:
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT data FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+        return bytes(row[0])
+
+    def put(self, key: str, data: bytes) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, data, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+
+    def evict(self, max_bytes: int, max_age: float) -> int:
+        with self.lock:
+            entries = self.conn.execute("SELECT accessed, size, key FROM entries").fetchall()
+            with self.conn:
+                removed = _evict_lru(
+                    entries,
+                    max_bytes,
+                    max_age,
+                    lambda key: self.conn.execute("DELETE FROM entries WHERE key = ?", (key,)),
+                )
+            if removed:
+                self.conn.execute("VACUUM")
+        return removed
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+def _evict_lru(entries: list[Any], max_bytes: int, max_age: float, remove: Callable[[Any], Any]) -> int:
+    """Remove the expired entries and then the least recently used ones until the total size fits.
+    Each entry is a tuple (last_access, size, id) and remove is called with the id of the removed ones."""
+    oldest_allowed = time.time() - max_age
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for accessed, size, entry in sorted(entries, key=lambda e: e[0]):
+        if accessed >= oldest_allowed and total <= max_bytes:
+            break
+        remove(entry)
+        total -= size
+        removed += 1
+    return removed
+
+
+# region DiagramCache
+
+# When each cache location was last evicted by this process
+_evicted: dict[str, float] = {}
+_evicted_lock = threading.Lock()
+
+
+class DiagramCache:
+    """Content-addressed cache of rendered diagrams.
+    The key is a hash of the normalized Mermaid code plus the render settings (server, theme...),
+    so an unchanged diagram is never sent again to the Mermaid server.
+    """
+
+    def __init__(
+        self,
+        store: CacheStore,
+        max_bytes: int = Constants.CACHE_MAX_BYTES,
+        max_age: float = Constants.CACHE_MAX_AGE,
+    ) -> None:
+        self.store = store
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    @staticmethod
+    def key(code: str, *settings: str) -> str:
+        """Return the cache key of the Mermaid code rendered with the given settings."""
+        digest = hashlib.sha256(DiagramCache.normalize(code).encode("utf-8"))
+        for setting in settings:
+            digest.update(b"\0" + setting.encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def normalize(code: str) -> str:
+        """Normalize line endings and trailing spaces, which do not change the rendered diagram."""
+        lines = code.replace("\r\n", "\n").split("\n")
+        return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+    def get(self, key: str) -> str | None:
+        data = self.store.get(key)
+        return data.decode("utf-8") if data is not None else None
+
+    def put(self, key: str, svg: str) -> None:
+        self.store.put(key, svg.encode("utf-8"))
+
+    def close(self) -> None:
+        """Evict the stale entries and close the store. Listing the entries costs as much as the cache is large,
+        so a process evicts a location when it first closes it, and then at most once every CACHE_EVICT_INTERVAL,
+        however many caches it opens on it."""
+        now = time.monotonic()
+        with _evicted_lock:
+            last = _evicted.get(self.store.location)
+            due = last is None or now - last >= Constants.CACHE_EVICT_INTERVAL
+            if due:
+                _evicted[self.store.location] = now
+        if due:
+            self.store.evict(self.max_bytes, self.max_age)
+        self.store.close()
+
+
+def open_cache(cache_dir: str | None) -> DiagramCache | None:
+    """Open the diagram cache at the given path, or return None when the cache is disabled.
+    A path ending in .sqlite or .db is opened as a single-file store, any other path as a directory."""
+    if not cache_dir:
+        return None
+    if Path(cache_dir).suffix in (".sqlite", ".db"):
+        return DiagramCache(SqliteStore(cache_dir))
+    return DiagramCache(DirectoryStore(cache_dir))
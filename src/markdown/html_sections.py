@@ -0,0 +1,123 @@
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+from typing import Iterable, Iterator
+
+import markdown2
+
+from src.core.constants import Constants
+from src.core.profiler import Profiler
+
+from .cache import DiagramCache
+
+
+def markdown_to_html(section: str, extras: list[str] | None = None) -> str:
+    """Convert a section with markdown2, in this process or in a worker of the pool."""
+    return markdown2.markdown(section, extras=extras)
+
+
+# region HtmlSections
+
+
+class HtmlSections:
+    """Convert the sections of a document to HTML with markdown2, keeping the HTML of each section
+    by the hash of its Markdown and the extras, so a section that did not change is not converted again:
+    in memory for the sections of the previous document when incremental, as in the watch mode,
+    and in the diagram cache for the sections large enough to be worth reading from disk.
+    With jobs > 1, the sections that are not known are converted in a pool of processes,
+    a window of sections ahead of the one being consumed.
+    """
+
+    def __init__(self, cache: DiagramCache | None = None, jobs: int = 1, incremental: bool = False) -> None:
+        self.cache = cache
+        self.jobs = jobs
+        self.incremental = incremental
+        # The HTML of the sections of the previous document and of the current one, by their key
+        self.memo: dict[str, str] = {}
+        self.next_memo: dict[str, str] = {}
+        # The HTML converted by the pool ahead of the sections being consumed
+        self.prefetched: dict[str, str] = {}
+        # Sections converted with markdown2 in the current document
+        self.converted = 0
+        self.executor: ProcessPoolExecutor | None = None
+
+    @staticmethod
+    def key(section: str, extras: list[str] | None = None) -> str:
+        """Return the key of the section converted with the extras. The Markdown is hashed as it is,
+        as its trailing spaces are line breaks."""
+        digest = hashlib.sha256(f"markdown2 {markdown2.__version__}\0{','.join(extras or [])}\0".encode("utf-8"))
+        digest.update(section.encode("utf-8"))
+        return digest.hexdigest()
+
+    def new_document(self) -> None:
+        """Start a new document: the sections of the last one are kept in memory only when incremental."""
+        self.memo, self.next_memo = (self.next_memo, {}) if self.incremental else ({}, {})
+        self.prefetched = {}
+        self.converted = 0
+
+    def convert(self, section: str, extras: list[str] | None = None) -> str:
+        """Return the HTML of the section, converted only if it is not known."""
+        key = self.key(section, extras)
+        html = self._lookup(key, section)
+        if html is None:
+            with Profiler.span("markdown2", bytes=len(section)):
+                html = markdown_to_html(section, extras)
+            self._store(key, section, html)
+        if self.incremental:
+            self.next_memo[key] = html
+        return html
+
+    def prefetch(
+        self, contents: Iterable[str], extras: list[str] | None = None, separator: str | None = None
+    ) -> Iterator[str]:
+        """Yield the contents as they are, converting in the pool the sections of a window of contents
+        ahead that are not known, so convert finds them. A content is made of the sections between
+        the separator, or is a single section. Without a pool the contents are yielded one by one."""
+        iterator = iter(contents)
+        if self.jobs <= 1:
+            yield from iterator
+            return
+        while window := list(islice(iterator, self.jobs * Constants.MARKDOWN_WINDOW)):
+            missing: dict[str, str] = {}
+            for content in window:
+                for section in content.split(separator) if separator else [content]:
+                    key = self.key(section, extras)
+                    if key in missing or key in self.prefetched:
+                        continue
+                    if (html := self._lookup(key, section)) is None:
+                        missing[key] = section
+                    else:
+                        self.prefetched[key] = html
+            if len(missing) > 1:
+                with Profiler.span("markdown2", sections=len(missing)):
+                    converted = self._pool().map(markdown_to_html, missing.values(), repeat(extras))
+                    for (key, section), html in zip(missing.items(), converted):
+                        self._store(key, section, html)
+                        self.prefetched[key] = html
+            yield from window
+
+    def close(self) -> None:
+        """Stop the pool. The cache is closed by its owner."""
+        if self.executor:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.jobs)
+        return self.executor
+
+    def _lookup(self, key: str, section: str) -> str | None:
+        """Return the HTML of the section found ahead, of the current or the previous document,
+        or of the cache, or None."""
+        html = self.prefetched.pop(key, None)
+        if html is None:
+            html = self.next_memo.get(key, self.memo.get(key))
+        if html is None and self.cache and len(section) >= Constants.HTML_CACHE_MIN_BYTES:
+            html = self.cache.get(key)
+        return html
+
+    def _store(self, key: str, section: str, html: str) -> None:
+        self.converted += 1
+        if self.cache and len(section) >= Constants.HTML_CACHE_MIN_BYTES:
+            self.cache.put(key, html)
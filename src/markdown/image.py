@@ -1,5 +1,14 @@
 from src.core.constants import Constants
 
+# Image of a diagram that was not rendered, as when the circuit breaker was open or a limit was exceeded
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="320" height="60" viewBox="0 0 320 60">'
+    '<rect x="1" y="1" width="318" height="58" fill="#f4f4f4" stroke="#999" stroke-dasharray="6 4"/>'
+    '<text x="160" y="35" font-family="sans-serif" font-size="14" fill="#666" text-anchor="middle">'
+    "Diagram not rendered</text></svg>"
+)
+PLACEHOLDER_HEIGHT = 60
+
 # region ImageSkeletonBuilder
 
 
@@ -37,11 +46,11 @@ class ImageSkeletonBuilder:
 
     def _add_style_bigs(self) -> None:
         if self.images_left > 1:
-            self.style_bigs = ', style="min-width: 90%;"'
+            self.style_bigs = ' style="min-width: 90%;"'
 
     def _build_image_tag(self) -> str:
         if self.height < 150:
-            return self.prefix + f'<img src="{self.uri}", style="max-height: 40%; width: 90%;">' + self.suffix
+            return self.prefix + f'<img src="{self.uri}" style="max-height: 40%; width: 90%;">' + self.suffix
         if self.height < 400:
-            return self.prefix + f'<img src="{self.uri}", style="max-height: 60%; width: 90%;">' + self.suffix
+            return self.prefix + f'<img src="{self.uri}" style="max-height: 60%; width: 90%;">' + self.suffix
         return self.prefix + f'<img src="{self.uri}"{self.style_bigs}>' + self.suffix
@@ -1,94 +1,678 @@
-import math
+import base64
+import json
+import random
 import re
-from typing import Any
+import subprocess
+import tempfile
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import asdict, dataclass
+from pathlib import Path
 
-from mermaid import Graph, Mermaid
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
 
+from src.core.constants import Constants
 from src.core.models import ErrorHandler, PdfCfg
+from src.core.profiler import Profiler
 from src.core.utils import print_dbg
 
-DIV_BREAK_AFTER = '<div style="page-break-after: always;"></div>'
+from .cache import DiagramCache, open_cache
+from .image import PLACEHOLDER_SVG
+from .svg import SvgOptimizer
+from .syntax import ParsedDiagram, parse_diagram
+
+# region RenderBackend
+
+
+@dataclass
+class RenderResult:
+    """Response of a render backend. The status code is 0 when the server could not be reached."""
+
+    status_code: int
+    text: str
+    reason: str = ""
+
+
+class RenderBackend(ABC):
+    """Backend that renders Mermaid code to SVG. It must be safe to call from several threads.
+    A backend with a startup cost renders many diagrams with each call of render_batch, up to batch_size,
+    and the renderer makes at most workers calls at once."""
+
+    batch_size = 1
+    workers = 1
+
+    @abstractmethod
+    def render_svg(self, code: str) -> RenderResult:
+        """Render the Mermaid code and return the SVG, or the error of the backend."""
+
+    @abstractmethod
+    def identity(self) -> str:
+        """Return the settings that change the rendered SVG, to be part of the cache key."""
+
+    def render_batch(self, codes: list[str]) -> list[RenderResult]:
+        """Render the Mermaid codes and return their results in the same order."""
+        return [self.render_svg(code) for code in codes]
+
+    def payload_size(self, code: str) -> int:
+        """Return the size of the request that renders the code, to keep it under the budget of the backend."""
+        return len(code.encode("utf-8"))
+
+    def close(self) -> None:
+        """Release the resources held by the backend."""
+
+
+class HttpRenderBackend(RenderBackend):
+    """Render the diagrams with a mermaid-ink server, the public https://mermaid.ink or a self-hosted one.
+    All the requests share a pooled HTTP session with keep-alive. Connection errors, 429 and 5xx responses
+    are retried with exponential backoff and jitter, honouring the Retry-After header.
+    The diagrams are sent compressed in the pako format, so a long diagram fits in a single URL.
+    """
+
+    RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+    def __init__(
+        self,
+        base_url: str = Constants.MERMAID_URL,
+        connect_timeout: float = Constants.CONNECT_TIMEOUT,
+        read_timeout: float = Constants.RENDER_TIMEOUT,
+        retries: int = Constants.RENDER_RETRIES,
+        backoff: float = Constants.RENDER_BACKOFF,
+        pool_size: int = Constants.RENDER_JOBS,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def render_svg(self, code: str) -> RenderResult:
+        url = f"{self.base_url}/svg/{self.encode(code)}"
+        attempt = 0
+        while True:
+            try:
+                with Profiler.span("request", "network", attempt=attempt) as span:
+                    response = self.session.get(url, timeout=self.timeout)
+                    span.set(status=response.status_code, bytes=len(response.content))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.retries:
+                    return RenderResult(0, "", f"No response from {self.base_url}: {e}")
+                delay = self._delay(attempt)
+            else:
+                if response.status_code not in self.RETRY_STATUS or attempt >= self.retries:
+                    return RenderResult(response.status_code, response.text, response.reason)
+                delay = self._delay(attempt, response.headers.get("Retry-After"))
+            time.sleep(delay)
+            attempt += 1
+
+    def identity(self) -> str:
+        return self.base_url
+
+    def payload_size(self, code: str) -> int:
+        return len(self.encode(code))
+
+    def close(self) -> None:
+        self.session.close()
+
+    @staticmethod
+    def encode(code: str) -> str:
+        """Encode the Mermaid code in the pako format that mermaid-ink accepts, as the Mermaid live editor does:
+        the state of the editor as JSON, deflated with zlib, in URL-safe base64 without padding."""
+        state = json.dumps({"code": code, "mermaid": {"theme": "default"}})
+        data = zlib.compress(state.encode("utf-8"), 9)
+        return "pako:" + base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+    def _delay(self, attempt: int, retry_after: str | None = None) -> float:
+        """Seconds to wait before the next attempt: the Retry-After of the server or a full-jitter backoff."""
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), Constants.RENDER_MAX_BACKOFF)
+        return random.uniform(0, min(self.backoff * 2**attempt, Constants.RENDER_MAX_BACKOFF))
+
+
+class MmdcRenderBackend(RenderBackend):
+    """Render the diagrams with a local mermaid-cli executable, mmdc or a compatible one, without network.
+    Each call renders a batch of diagrams with a single run, as the blocks of a Markdown file, so the headless
+    browser starts once per batch. When a run fails, as for a syntax error, the batch is rendered again
+    by halves to find the diagrams that fail. A failure of mmdc itself, as a browser that can not be launched,
+    is answered as 503, not as a bad diagram: it is recognised by its message, or because both halves of a batch
+    fail with the same one.
+    """
+
+    # Messages of mmdc for a failure of its environment, that any diagram would have
+    ENVIRONMENT_ERRORS = re.compile(
+        r"Failed to launch the browser process|Could not find (?:Chrome|Chromium|expected browser)"
+        r"|Protocol error|Target closed|Navigation timeout",
+        re.IGNORECASE,
+    )
+
+    def __init__(
+        self,
+        executable: str = "mmdc",
+        workers: int = Constants.MMDC_WORKERS,
+        batch_size: int = Constants.MMDC_BATCH_SIZE,
+        timeout: float = Constants.RENDER_TIMEOUT,
+    ) -> None:
+        self.executable = executable
+        self.workers = workers
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(workers)
+
+    def render_svg(self, code: str) -> RenderResult:
+        return self.render_batch([code])[0]
+
+    def render_batch(self, codes: list[str]) -> list[RenderResult]:
+        svgs, failure = self._run(codes)
+        if failure is None:
+            return [RenderResult(200, svg) for svg in svgs]
+        return self._bisect(codes, failure)
+
+    def _bisect(self, codes: list[str], failure: RenderResult) -> list[RenderResult]:
+        """Render again by halves a batch that failed, to find the diagrams that fail."""
+        # A run that could not start, timed out or failed by its environment would fail again for each half
+        if len(codes) == 1 or failure.status_code != 422:
+            return [failure] * len(codes)
+        middle = len(codes) // 2
+        halves = [codes[:middle], codes[middle:]]
+        runs = [self._run(half) for half in halves]
+        (_, first), (_, second) = runs
+        if first is not None and second is not None and first.text == second.text:
+            return [RenderResult(503, first.text, f"{self.executable} failed for every diagram")] * len(codes)
+        results: list[RenderResult] = []
+        for half, (svgs, half_failure) in zip(halves, runs):
+            if half_failure is None:
+                results.extend(RenderResult(200, svg) for svg in svgs)
+            else:
+                results.extend(self._bisect(half, half_failure))
+        return results
+
+    def identity(self) -> str:
+        return f"mmdc:{self.executable}"
+
+    def _run(self, codes: list[str]) -> tuple[list[str], RenderResult | None]:
+        """Run the executable once for all the codes and return their SVGs, or the failure of the run."""
+        with self.slots, tempfile.TemporaryDirectory(prefix="mmdc-") as tmp:
+            source = Path(tmp) / "diagrams.md"
+            source.write_text("".join(f"```mermaid\n{code}\n```\n\n" for code in codes), encoding="utf-8")
+            command = [self.executable, "-i", str(source), "-o", str(Path(tmp) / "out.md"), "-e", "svg"]
+            with Profiler.span("mmdc", "network", diagrams=len(codes)) as span:
+                try:
+                    process = subprocess.run(command, capture_output=True, text=True, timeout=self.timeout)
+                except subprocess.TimeoutExpired:
+                    return [], RenderResult(0, "", f"{self.executable} timed out after {self.timeout:g}s")
+                except OSError as e:
+                    return [], RenderResult(0, "", f"Could not run {self.executable}: {e}")
+                span.set(status=process.returncode)
+            if process.returncode != 0:
+                stderr = process.stderr.strip()
+                status = 503 if self.ENVIRONMENT_ERRORS.search(stderr) else 422
+                return [], RenderResult(status, stderr, f"{self.executable} failed")
+            # mermaid-cli writes the image of each block next to the output, numbered from 1
+            svgs = []
+            for i in range(1, len(codes) + 1):
+                svg_path = Path(tmp) / f"out-{i}.svg"
+                if not svg_path.exists():
+                    return [], RenderResult(500, "", f"{self.executable} did not write {svg_path.name}")
+                svgs.append(svg_path.read_text(encoding="utf-8"))
+            return svgs, None
+
 
 # region MermaidWrapper
 
 
 class MermaidWrapper:
-    """Wrapper class for the Mermaid library to render Mermaid diagrams.
-    It uses the Mermaid library to render the diagrams and save them as SVG files.
-    This class is used when the Docker container is not used.
-    Also, shows error messages when the Mermaid server returns an error.
+    """Wrapper class to render a Mermaid diagram to SVG with a render backend.
+    Also, keeps the error messages when the Mermaid server returns an error.
     """
 
-    def __init__(self, code: str, is_debug: bool):
+    TOO_LARGE_STATUS = frozenset({413, 414, 431})
+    # Responses for a diagram that the backend can not render, as a syntax error, which fail again the same way
+    BAD_DIAGRAM_STATUS = frozenset({400, 404, 422})
+
+    def __init__(self, code: str, is_debug: bool, backend: RenderBackend):
         self.code = code
-        self.graph = Graph("diagram", code)
-        self.diagram = Mermaid(self.graph)
-        self.container = None
+        self.backend = backend
         self.is_debug = is_debug
+        self.svg: str | None = None
+        self.response: RenderResult | None = None
+        self.too_large = False
+        self.errors: list[str] = []
 
-    def render_to_svg(self, svg_file_path: str, endpoint: str) -> str:
-        """Render the Mermaid diagram in https://mermaid.ink/svg and save it as an SVG file."""
+    def render_to_svg(self, endpoint: str) -> str:
+        """Render the Mermaid diagram with the backend and return the SVG.
+        On error, it returns the response of the server and the error is recorded."""
         if self.is_debug:
             print_dbg(f"Generating diagram for endpoint: {endpoint}")
-            print_dbg(f"\n              Mermaid code: {self.graph.script}")
-        if response := self._get_internal_variable("svg_response"):
-            if response.status_code == 200:
-                self.diagram.to_svg(svg_file_path)
-                return svg_file_path
+            print_dbg(f"\n              Mermaid code: {self.code}")
+        return self.read_response(self.backend.render_svg(self.code), endpoint)
+
+    def read_response(self, response: RenderResult, endpoint: str) -> str:
+        """Keep the SVG of a response of the backend, or record its error, and return its text."""
+        self.response = response
+        if response.status_code == 200:
+            self.svg = response.text
+        elif response.status_code == 404:
+            msg = f"Error for {endpoint}: {response.status_code} {response.reason}"
+            msg += ", maybe the diagram include character:'?'"
+            self.errors.append(msg)
+        elif response.status_code in self.TOO_LARGE_STATUS:
+            self.too_large = True
+            self.errors.append(
+                f"Error for {endpoint}: {response.status_code} {response.reason}, the diagram is too large"
+            )
+        elif response.status_code == 0:
+            self.errors.append(f"Error for {endpoint}: {response.reason}")
         else:
-            svg_response = self._get_internal_variable("svg_response")
-            if svg_response.status_code == 404:
-                msg = f"Error for {endpoint}: {svg_response}, maybe the diagram include character:'?'"
-                ErrorHandler.add_error(msg)
-            else:
-                msg = f"Error for {endpoint}: {svg_response.reason}: {svg_response.text}"
-                ErrorHandler.add_error(msg)
-            self.diagram.to_svg(svg_file_path)
-        return svg_file_path
+            self.errors.append(f"Error for {endpoint}: {response.reason}: {response.text}")
+        return response.text
 
-    def _get_internal_variable(self, variable_name: str) -> Any:
-        return getattr(self.diagram, variable_name, None)
+
+# region CircuitBreaker
+
+
+class CircuitBreaker:
+    """Stop calling a backend that fails: after the given number of failures in a row the circuit opens
+    and the diagrams are not rendered, until the cooldown passes and a single diagram is tried again.
+    The failures of the backend count, as an unreachable server, a 5xx, a 401 or an mmdc that can not launch
+    its browser; a diagram answered as bad or too large does not.
+    It is shared by the threads that render the diagrams."""
+
+    def __init__(
+        self, failures: int = Constants.BREAKER_FAILURES, cooldown: float = Constants.BREAKER_COOLDOWN
+    ) -> None:
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """Return whether a diagram can be rendered. Once the cooldown has passed, only one caller is allowed
+        until its result closes the circuit or opens it again."""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.opened_at = time.monotonic()
+            return True
+
+    def record(self, response: RenderResult) -> None:
+        """Count the response of the backend, opening the circuit after too many failures in a row."""
+        # Only a diagram that the backend answered as bad or too large is not a failure of the backend
+        exempt = MermaidWrapper.BAD_DIAGRAM_STATUS | MermaidWrapper.TOO_LARGE_STATUS
+        failed = response.status_code != 200 and response.status_code not in exempt
+        with self.lock:
+            if not failed:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                self.opened_at = time.monotonic()
+
+
+# region DiagramChunk
+
+
+@dataclass
+class DiagramChunk:
+    """A piece of a Mermaid diagram that is rendered with a single request to the Mermaid server.
+    The uri identifies the image in the document, it is served from memory to the PDF engine."""
+
+    image_number: int
+    code: str
+    uri: str
+    endpoint: str
+    height: int
 
 
 # region MermaidRenderer
 
 
 class MermaidRenderer:
-    def __init__(self, cfg: PdfCfg) -> None:
+    def __init__(self, cfg: PdfCfg, backend: RenderBackend | None = None, cache: DiagramCache | None = None) -> None:
         self.cfg = cfg
+        self.backend = backend or self._backend(cfg)
+        # The cache of the processor is shared and closed by it, else the renderer opens its own
+        self.owns_cache = cache is None
+        self.cache: DiagramCache | None = cache or open_cache(cfg.cache_dir)
+        self.optimizer = SvgOptimizer(cache=self.cache) if cfg.optimize_svg else None
+        # The diagrams of the previous document, by their key, so an edited document only renders its changes
+        self.previous: dict[str, str] = {}
+        self.reused = 0
+        # The keys of the chunks that the server rejected as too large
+        self.too_large: set[str] = set()
+        # The keys of the chunks that were not rendered because the circuit was open, or the deadline passed
+        self.skipped: set[str] = set()
+        self.expired: set[str] = set()
+        # The time by which the diagrams of the document must be rendered, the rest show a placeholder
+        self.deadline = float("inf")
+        # The errors of the diagrams that are not valid, by their key, found without sending them
+        self.invalid: dict[str, list[str]] = {}
+        self.breaker = CircuitBreaker()
+        self.failure_ttl = Constants.FAILURE_TTL
+
+    @staticmethod
+    def _backend(cfg: PdfCfg) -> RenderBackend:
+        if cfg.mmdc_path:
+            return MmdcRenderBackend(
+                cfg.mmdc_path, workers=min(cfg.jobs, Constants.MMDC_WORKERS), timeout=cfg.render_timeout
+            )
+        return HttpRenderBackend(
+            cfg.mermaid_url,
+            read_timeout=cfg.render_timeout,
+            retries=cfg.render_retries,
+            pool_size=cfg.jobs,
+        )
 
-    def render(self, image_number: int, code: str, base_url: str, enpoint: str) -> tuple[list[str], list[int]]:
-        """Render the Mermaid code and return the SVG files and the heights of the diagrams.
-        It splits the Mermaid code into chunks of 50 lines to avoid the Mermaid server's limitation.
+    def render(self, image_number: int, code: str, enpoint: str) -> tuple[list[str], list[int]]:
+        """Render the Mermaid code and return the SVGs and the heights of the diagrams.
+        It splits the Mermaid code into chunks that fit in the payload budget of the Mermaid server.
         """
-        code_lines = code.split("\n")
-        svg_files = []
-        heights = []
-        num_chuncks = math.ceil(len(code_lines) / 50.0)
-
-        header = self._get_header(code) if num_chuncks > 1 else ""
-        for i in range(0, len(code_lines), 50):
-            pre = header if i > 0 else ""
-            chunk = pre + "\n".join(code_lines[i : i + 50])
-            suffix = f"_{i//50}" if num_chuncks > 1 else ""
+        [block] = self.render_diagrams([(image_number, code, enpoint)], jobs=1)
+        return [svg for _, svg in block], [chunk.height for chunk, _ in block]
+
+    def split(self, image_number: int, code: str, enpoint: str, budget: int | None = None) -> list[DiagramChunk]:
+        """Split the Mermaid code into the fewest chunks that fit in the payload budget of the Mermaid server,
+        cutting only between blocks and repeating the header of the diagram and its declarations in each one.
+        A block that does not fit alone is a chunk by itself. A diagram with syntax errors is not split,
+        and its errors are kept to report them without sending it."""
+        budget = budget or self.cfg.payload_budget
+        diagram = parse_diagram(code)
+        if diagram.errors:
+            self.invalid[self._key(code)] = diagram.errors
+            pieces = [code]
+        elif self.backend.payload_size(code) <= budget:
+            pieces = [code]
+        else:
+            pieces = []
+            start = 0
+            while start < len(diagram.cuts) - 1:
+                pre = diagram.header_before(diagram.cuts[start])
+                end = self._fit(diagram, start, pre, budget)
+                pieces.append(pre + diagram.body(diagram.cuts[start], diagram.cuts[end]))
+                start = end
+
+        chunks = []
+        for i, chunk in enumerate(pieces):
+            suffix = f"_{i}" if len(pieces) > 1 else ""
             svg_file = f"diagram_{image_number}{suffix}.svg"
-            image_file = self._render_mermaid(chunk, base_url + "/" + svg_file, enpoint)
-            svg_files.append(image_file)
-            heights.append((len(chunk.split("\n")) - 10) * 14)
-        return svg_files, heights
-
-    def _render_mermaid(self, mermaid_code: str, svg_file_path: str, enpoint: str) -> str:
-        """Render a Mermaid diagram and save it as an SVG file."""
-        wrapper = MermaidWrapper(mermaid_code, self.cfg.is_debug)
-        svg_path = wrapper.render_to_svg(svg_file_path, enpoint)
-        return svg_path
-
-    def _get_header(self, code: str) -> str:
-        """Get the header of the Mermaid code until the last participant."""
-        pattern = "participant .*"
-        participants = re.findall(pattern, code)
-        if not participants:
-            return ""
-        last_participant = participants[-1]
-        header = code.split(last_participant)[0] + last_participant + "\n"
-        return str(header)
+            height = (len(chunk.split("\n")) - 10) * 14
+            chunks.append(DiagramChunk(image_number, chunk, Constants.DIAGRAM_URL + svg_file, enpoint, height))
+        return chunks
+
+    def _fit(self, diagram: ParsedDiagram, start: int, pre: str, budget: int) -> int:
+        """Return the last cut of the diagram after the start cut, such that the lines between them fit
+        in the budget after the header. The payload grows with the lines, so it is a binary search."""
+        low, high = start + 1, len(diagram.cuts) - 1
+        first = diagram.cuts[start]
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.backend.payload_size(pre + diagram.body(first, diagram.cuts[middle])) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def render_diagrams(
+        self, diagrams: list[tuple[int, str, str]], jobs: int | None = None
+    ) -> list[list[tuple[DiagramChunk, str]]]:
+        """Split and render the diagrams, given as (image number, code, endpoint), and return the chunks
+        of each one of them with their SVGs. All the chunks are rendered together with a pool of threads.
+        A diagram with a chunk rejected by the server as too large is split again with half the budget,
+        until it can not be split any more. The errors are reported in the order of the document."""
+        budgets = [self.cfg.payload_budget] * len(diagrams)
+        self.invalid = {}
+        self.deadline = time.monotonic() + self.cfg.render_deadline
+        blocks = [self.split(*diagram) for diagram in diagrams]
+        results: list[list[tuple[str, list[str]]]] = [[] for _ in diagrams]
+        self.reused = sum(1 for block in blocks for chunk in block if self._key(chunk.code) in self.previous)
+        self.too_large = set()
+        self.skipped = set()
+        self.expired = set()
+        pending = list(range(len(diagrams)))
+        while pending:
+            rendered = iter(self._render_all([chunk for i in pending for chunk in blocks[i]], jobs))
+            retry = []
+            for i in pending:
+                results[i] = [next(rendered) for _ in blocks[i]]
+                rejected = any(self._key(chunk.code) in self.too_large for chunk in blocks[i])
+                if (
+                    rejected
+                    and not self._overdue()
+                    and (finer := self._split_finer(diagrams[i], len(blocks[i]), budgets[i]))
+                ):
+                    blocks[i], budgets[i] = finer
+                    retry.append(i)
+            pending = retry
+
+        chunks = [chunk for block in blocks for chunk in block]
+        self._remember(chunks, [result for block_results in results for result in block_results])
+        return [[(chunk, svg) for chunk, (svg, _) in zip(block, res)] for block, res in zip(blocks, results)]
+
+    def _split_finer(
+        self, diagram: tuple[int, str, str], num_chunks: int, budget: int
+    ) -> tuple[list[DiagramChunk], int] | None:
+        """Halve the budget until the diagram is split in more chunks, and return them with the budget,
+        or None if the diagram can not be split any more."""
+        while budget > 1:
+            budget //= 2
+            chunks = self.split(*diagram, budget=budget)
+            if len(chunks) > num_chunks:
+                return chunks, budget
+        return None
+
+    def _render_all(self, chunks: list[DiagramChunk], jobs: int | None = None) -> list[tuple[str, list[str]]]:
+        """Render the chunks with a pool of jobs threads and return the SVGs with their errors in the same order."""
+        jobs = jobs or self.cfg.jobs
+        progress = tqdm(
+            total=len(chunks),
+            position=1,
+            desc="Rendering diagrams...",
+            unit="diagram",
+            leave=False,
+            bar_format="{l_bar} {bar:50}",
+            disable=self.cfg.quiet,
+        )
+        results: list[tuple[str, list[str]]] = []
+        try:
+            if self.backend.batch_size > 1:
+                results = self._render_batches(chunks, progress)
+            elif jobs <= 1 or len(chunks) <= 1:
+                for chunk in chunks:
+                    results.append(self._render_mermaid(chunk.code, chunk.endpoint))
+                    progress.update()
+            else:
+                results = self._render_threads(chunks, jobs, progress)
+        finally:
+            progress.close()
+        if self.optimizer:
+            with Profiler.span("optimize_svg"):
+                results = [(svg if errors else self.optimizer.optimize(svg), errors) for svg, errors in results]
+        return results
+
+    def _render_threads(self, chunks: list[DiagramChunk], jobs: int, progress: tqdm) -> list[tuple[str, list[str]]]:
+        """Render the chunks one per request in a pool of jobs threads. The pool is shut down without waiting
+        for the chunks that timed out, and the ones not started are cancelled if a chunk raises."""
+        results: list[tuple[str, list[str]]] = []
+        executor = ThreadPoolExecutor(max_workers=min(jobs, len(chunks)), thread_name_prefix="mermaid")
+        try:
+            futures = [executor.submit(self._render_mermaid, chunk.code, chunk.endpoint) for chunk in chunks]
+            # The backend has its own timeouts, this one also covers all the retries of a chunk
+            timeout = (self.cfg.render_timeout + Constants.RENDER_MAX_BACKOFF) * (self.cfg.render_retries + 1)
+            for chunk, future in zip(chunks, futures):
+                remaining = max(self.deadline - time.monotonic(), 0.0)
+                try:
+                    results.append(future.result(timeout=min(timeout, remaining)))
+                except FutureTimeoutError:
+                    if remaining < timeout:
+                        self.expired.add(self._key(chunk.code))
+                        results.append((PLACEHOLDER_SVG, []))
+                    else:
+                        results.append(("", [f"Error for {chunk.endpoint}: timeout after {timeout}s"]))
+                progress.update()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    def _render_batches(self, chunks: list[DiagramChunk], progress: tqdm) -> list[tuple[str, list[str]]]:
+        """Render the chunks that are not known yet in batches, spread evenly over the workers of the backend,
+        and return the SVGs with their errors in the same order."""
+        known = [self._lookup(chunk.code, chunk.endpoint) for chunk in chunks]
+        results: list[tuple[str, list[str]]] = [("", []) if hit is None else (hit[1], []) for hit in known]
+        missing = []
+        for i, hit in enumerate(known):
+            if hit is not None:
+                continue
+            if (failed := self._known_errors(chunks[i].code, chunks[i].endpoint)) is not None:
+                results[i] = failed
+            else:
+                missing.append(i)
+        progress.update(len(chunks) - len(missing))
+        if not missing:
+            return results
+
+        size = min(self.backend.batch_size, -(-len(missing) // self.backend.workers))
+        batches = [missing[start : start + size] for start in range(0, len(missing), size)]
+        codes = [[chunks[i].code for i in batch] for batch in batches]
+        workers = min(self.backend.workers, len(batches))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mermaid") as executor:
+            responses = executor.map(self._render_batch, codes)
+            for batch, batch_responses in zip(batches, responses):
+                if batch_responses is None:
+                    not_rendered = self.expired if self._overdue() else self.skipped
+                    for i in batch:
+                        not_rendered.add(self._key(chunks[i].code))
+                        results[i] = (PLACEHOLDER_SVG, [])
+                for i, response in zip(batch, batch_responses or []):
+                    wrapper = MermaidWrapper(chunks[i].code, self.cfg.verbose, self.backend)
+                    svg = wrapper.read_response(response, chunks[i].endpoint)
+                    results[i] = (svg, self._store(chunks[i].code, wrapper))
+                progress.update(len(batch))
+        return results
+
+    def _render_batch(self, codes: list[str]) -> list[RenderResult] | None:
+        """Render a batch of codes with the backend, or return None if the circuit is open or the deadline passed."""
+        if self._overdue() or not self.breaker.allow():
+            return None
+        return self.backend.render_batch(codes)
+
+    def _remember(self, chunks: list[DiagramChunk], results: list[tuple[str, list[str]]]) -> None:
+        """Keep the SVGs rendered without errors for the next document, and report the errors in order.
+        The diagrams skipped by the circuit breaker or the deadline are reported once, after the others."""
+        self.previous = {
+            key: svg
+            for chunk, (svg, errors) in zip(chunks, results)
+            if not errors and (key := self._key(chunk.code)) not in self.skipped and key not in self.expired
+        }
+        for _, errors in results:
+            for error in errors:
+                ErrorHandler.add_error(error)
+        if skipped := sum(1 for chunk in chunks if self._key(chunk.code) in self.skipped):
+            ErrorHandler.add_error(
+                f"Error: the Mermaid renderer failed {self.breaker.max_failures} times in a row, "
+                f"{skipped} diagrams were not rendered and show a placeholder"
+            )
+        if expired := sum(1 for chunk in chunks if self._key(chunk.code) in self.expired):
+            ErrorHandler.add_error(
+                f"Error: the diagrams took longer than the render deadline of {self.cfg.render_deadline}s, "
+                f"{expired} diagrams were not rendered and show a placeholder"
+            )
+
+    def _render_mermaid(self, mermaid_code: str, enpoint: str) -> tuple[str, list[str]]:
+        """Render a Mermaid diagram and return the SVG with the errors of the server.
+        A diagram of the previous document or found in the cache is returned without calling the Mermaid server."""
+        with Profiler.span("diagram", "diagram", endpoint=enpoint) as span:
+            if (hit := self._lookup(mermaid_code, enpoint)) is not None:
+                span.set(source=hit[0])
+                return hit[1], []
+            if (known := self._known_errors(mermaid_code, enpoint)) is not None:
+                span.set(source="failure")
+                return known
+            if self._overdue():
+                span.set(source="expired")
+                self.expired.add(self._key(mermaid_code))
+                return PLACEHOLDER_SVG, []
+            if not self.breaker.allow():
+                span.set(source="skipped")
+                self.skipped.add(self._key(mermaid_code))
+                return PLACEHOLDER_SVG, []
+            wrapper = MermaidWrapper(mermaid_code, self.cfg.verbose, self.backend)
+            svg = wrapper.render_to_svg(enpoint)
+            span.set(source="server", bytes=len(svg))
+            return svg, self._store(mermaid_code, wrapper)
+
+    def _lookup(self, mermaid_code: str, enpoint: str) -> tuple[str, str] | None:
+        """Return where the diagram was found, the previous document or the cache, and its SVG, or None."""
+        key = self._key(mermaid_code)
+        if (svg := self.previous.get(key)) is not None:
+            return "previous", svg
+        if self.cache and (svg := self.cache.get(key)) is not None:
+            if self.cfg.verbose:
+                print_dbg(f"Diagram for endpoint {enpoint} found in the cache")
+            return "cache", svg
+        return None
+
+    def _known_errors(self, mermaid_code: str, enpoint: str) -> tuple[str, list[str]] | None:
+        """Return the text and the errors of a diagram known to fail without calling the backend:
+        its syntax errors, or a failure of the backend in the cache. None if it is not known to fail."""
+        if (errors := self.invalid.get(self._key(mermaid_code))) is not None:
+            return PLACEHOLDER_SVG, [f"Error for {enpoint}: invalid diagram, {error}" for error in errors]
+        if (failure := self._known_failure(mermaid_code)) is not None:
+            wrapper = MermaidWrapper(mermaid_code, self.cfg.verbose, self.backend)
+            return wrapper.read_response(failure, enpoint), wrapper.errors
+        return None
+
+    def _known_failure(self, mermaid_code: str) -> RenderResult | None:
+        """Return the response of the backend for a diagram that failed in the cache, if it failed within the TTL."""
+        if not self.cache or (data := self.cache.get(self._failure_key(mermaid_code))) is None:
+            return None
+        failure = json.loads(data)
+        if time.time() - failure.pop("time") > self.failure_ttl:
+            return None
+        failure["reason"] = f"{failure['reason']} (cached failure)".lstrip()
+        return RenderResult(**failure)
+
+    def _store(self, mermaid_code: str, wrapper: MermaidWrapper) -> list[str]:
+        """Keep the SVG rendered by the backend in the cache, or the response for a bad diagram, or the key
+        of a diagram rejected as too large, count the response in the circuit breaker and return its errors."""
+        key = self._key(mermaid_code)
+        if wrapper.too_large:
+            self.too_large.add(key)
+        if wrapper.response is not None:
+            self.breaker.record(wrapper.response)
+            if self.cache and wrapper.response.status_code in MermaidWrapper.BAD_DIAGRAM_STATUS:
+                failure = {"time": time.time(), **asdict(wrapper.response)}
+                self.cache.put(self._failure_key(mermaid_code), json.dumps(failure))
+        if self.cache and wrapper.svg is not None:
+            self.cache.put(key, wrapper.svg)
+        return wrapper.errors
+
+    def _overdue(self) -> bool:
+        return time.monotonic() >= self.deadline
+
+    def _failure_key(self, mermaid_code: str) -> str:
+        return DiagramCache.key(mermaid_code, self.backend.identity(), "failure")
+
+    def _key(self, mermaid_code: str) -> str:
+        return DiagramCache.key(mermaid_code, self.backend.identity())
+
+    def close(self) -> None:
+        """Close the backend, and the cache when it is its own."""
+        self.backend.close()
+        if self.cache and self.owns_cache:
+            self.cache.close()
+        self.cache = None
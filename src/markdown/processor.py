@@ -1,149 +1,291 @@
 import re
-
-import markdown2
-from tqdm import tqdm
+from typing import TYPE_CHECKING, Iterator
 
 from src.core.constants import Constants, MDContent
-from src.core.models import PdfCfg
+from src.core.models import ErrorHandler, PdfCfg
+from src.core.profiler import Profiler
+
+from .assets import AssetFetcher, find_assets
+from .cache import open_cache
+from .html_sections import HtmlSections
+from .image import PLACEHOLDER_HEIGHT, PLACEHOLDER_SVG, ImageSkeletonBuilder
+from .rules import DEFAULT_RULES, RuleEngine, load_rules
+from .scanner import ScannedDocument, scan_markdown
+from .sections import Source, find_definitions, iter_sections
 
-from .image import ImageSkeletonBuilder
-from .mermaid import MermaidRenderer
+if TYPE_CHECKING:
+    from .mermaid import MermaidRenderer, RenderBackend
 
 # region MarkdownProcessor
 
+# Extras of markdown2 for the conversion of the sections, footnotes are rendered on the page they are on
+MARKDOWN_EXTRAS = ["footnotes"]
+
 
 class MarkdownProcessor:
     """
     Class to process the Markdown content and render the Mermaid diagrams.
     It uses the MermaidRenderer to render the diagrams and replace the code blocks with the SVG images.
-    It returns the processed Markdown, simplified as an HTML, and the SVG files.
+    It returns the processed Markdown, simplified as an HTML, and the SVGs by their URI in the document.
     """
 
-    def __init__(self, cfg: PdfCfg) -> None:
+    def __init__(self, cfg: PdfCfg, incremental: bool = False, backend: "RenderBackend | None" = None) -> None:
         self.cfg = cfg
-        self.renderer = MermaidRenderer(cfg)
+        # The Mermaid and HTTP stack is only loaded for a document with diagrams, with the backend of the
+        # configuration unless one is given
+        self._renderer: "MermaidRenderer | None" = None
+        self.backend = backend
+        self.rules = RuleEngine([*DEFAULT_RULES, *load_rules(cfg.rules_path)])
+        self.cache = open_cache(cfg.cache_dir)
+        # The HTML of the sections by their Markdown, in the cache, and in memory for the previous document
+        # when incremental
+        self.html = HtmlSections(self.cache, cfg.markdown_jobs, incremental)
+        # The images of the document, fetched while its diagrams are rendered, and their URLs as written
+        self.assets = AssetFetcher(self.cache)
+        self.asset_urls: list[str] = []
+        # The definitions of reference links and footnotes of the document by their label, as markdown2
+        # only resolves the ones in the text it converts
+        self.definitions: dict[str, str] = {}
+        # Pages of the document written so far, a page break goes before each one but the first
+        self.pages = 0
+
+    @property
+    def renderer(self) -> "MermaidRenderer":
+        if self._renderer is None:
+            from .mermaid import MermaidRenderer
+
+            self._renderer = MermaidRenderer(self.cfg, self.backend, self.cache)
+        return self._renderer
+
+    @property
+    def reused(self) -> int:
+        """Diagrams of the last document reused from the previous one."""
+        return self._renderer.reused if self._renderer else 0
 
     def process_markdown(self, md_content: str) -> MDContent:
-        """Process the Markdown content and return the processed content and the SVG files.
-        It extracts the Mermaid code blocks from the Markdown content, renders them as SVG files,
+        """Process the Markdown content and return the processed content and the SVGs by URI.
+        It extracts the Mermaid code blocks from the Markdown content, renders them as SVG,
         and replaces the code blocks with the SVG image references.
         """
-        svg_files = []
-        length_mermaid = {}
-        for i, code in enumerate(
-            tqdm(
-                (self._extract_mermaid_blocks(md_content)),
-                position=1,
-                desc="Rendering diagrams...",
-                unit="diagram",
-                leave=False,
-                bar_format="{l_bar} {bar:50}",
+        svgs, sections = self.process_sections(md_content)
+        return "".join(sections), svgs
+
+    def process_sections(self, source: Source) -> tuple[dict[str, str], Iterator[str]]:
+        """Render the diagrams of the document and return the SVGs by URI, with a generator of the processed
+        content page by page. The document is read twice, a section between page breaks at a time, so only
+        one section is in memory besides the diagrams: the first pass extracts the diagrams, which are
+        rendered all together, and the second one converts each section when the generator is consumed.
+        The diagrams beyond the limits of the configuration are not rendered and show a placeholder,
+        and a document larger than its limit is converted up to it, each one reported as an error.
+        """
+        with Profiler.span("process_markdown"):
+            source = self._limit_input(source)
+            diagrams = self._extract_diagrams(source)
+            self.assets.prefetch(self.asset_urls, self.cfg.base_url)
+            over_limits = self._limit_diagrams(diagrams)
+            allowed = [diagram for diagram in diagrams if diagram[0] not in over_limits]
+            # All the chunks are rendered concurrently, the results keep the order of the document
+            with Profiler.span("render"):
+                blocks = iter(self.renderer.render_diagrams(allowed) if allowed else [])
+
+            svgs: dict[str, str] = {}
+            length_mermaid = {}
+            image_skeletons = []
+            for number, _, _ in diagrams:
+                if number in over_limits:
+                    uri = f"{Constants.DIAGRAM_URL}diagram_{number}.svg"
+                    svgs[uri] = PLACEHOLDER_SVG
+                    image_skeletons.append(self.image_skeleton(uri, PLACEHOLDER_HEIGHT, 1))
+                    continue
+                block = next(blocks)
+                image_skeleton = ""
+                for j, (chunk, svg) in enumerate(block):
+                    svgs[chunk.uri] = svg
+                    length_mermaid[self._leaf_last(chunk.uri)] = chunk.height
+                    image_skeleton += self.image_skeleton(chunk.uri, chunk.height, len(block) - j)
+                image_skeletons.append(image_skeleton)
+            if self.cfg.verbose:
+                # print 5 greater values of length_mermaid, print also the keys
+                print(sorted(length_mermaid.items(), key=lambda x: x[1], reverse=True)[:5])
+        return svgs, self._assemble(source, image_skeletons, length_mermaid)
+
+    def _extract_diagrams(self, source: Source) -> list[tuple[int, str, str]]:
+        """Return the number, the clean code and the endpoint of each Mermaid diagram of the document,
+        and collect the URLs of its images and its definitions in the same pass."""
+        diagrams: list[tuple[int, str, str]] = []
+        self.asset_urls = []
+        self.definitions = {}
+        label = None
+        with Profiler.span("extract"):
+            for section in iter_sections(source):
+                self.asset_urls.extend(find_assets(section))
+                for key, definition in find_definitions(section).items():
+                    self.definitions.setdefault(key, definition)
+                document = scan_markdown(section, "Endpoint:")
+                for fence in document.fences:
+                    i = len(diagrams)
+                    enpoint = self._get_current_enpoint(document, fence.line, i, label)
+                    diagrams.append((i, self._get_clean_code(fence.code), enpoint))
+                if document.label_values:
+                    label = document.label_values[-1]
+        return diagrams
+
+    def _limit_input(self, source: Source) -> Source:
+        """Return the document cut at the last line that fits in the maximum input size, in bytes,
+        a string measured by its UTF-8 encoding."""
+        limit = self.cfg.max_input_bytes
+        if isinstance(source, str):
+            # A character takes at most four bytes, so a short string is not encoded to be measured
+            if len(source) * 4 <= limit:
+                return source
+            data = source.encode("utf-8")
+            return source if len(data) <= limit else data[: len(self._limit_input(data))].decode("utf-8")
+        if len(source) <= limit:
+            return source
+        cut = source.rfind(b"\n", 0, limit) + 1
+        if not cut:
+            cut = limit
+            # A line longer than the limit is cut at the start of a UTF-8 character
+            while cut and source[cut] & 0xC0 == 0x80:
+                cut -= 1
+        ErrorHandler.add_error(
+            f"Error: the document has {len(source)} bytes, more than the limit of {limit}, "
+            f"only the first {cut} were converted"
+        )
+        return source[:cut]
+
+    def _limit_diagrams(self, diagrams: list[tuple[int, str, str]]) -> set[int]:
+        """Return the numbers of the diagrams that exceed the limits of the configuration, reporting each one."""
+        over_limits = set()
+        for number, code, endpoint in diagrams:
+            lines = code.count("\n") + 1
+            size = len(code.encode("utf-8"))
+            if number >= self.cfg.max_diagrams:
+                over_limits.add(number)
+            elif lines > self.cfg.max_diagram_lines:
+                over_limits.add(number)
+                ErrorHandler.add_error(
+                    f"Error for {endpoint}: the diagram has {lines} lines, more than the limit of "
+                    f"{self.cfg.max_diagram_lines}, it was not rendered and shows a placeholder"
+                )
+            elif size > self.cfg.max_diagram_bytes:
+                over_limits.add(number)
+                ErrorHandler.add_error(
+                    f"Error for {endpoint}: the diagram has {size} bytes, more than the limit of "
+                    f"{self.cfg.max_diagram_bytes}, it was not rendered and shows a placeholder"
+                )
+        if (extra := len(diagrams) - self.cfg.max_diagrams) > 0:
+            ErrorHandler.add_error(
+                f"Error: the document has {len(diagrams)} diagrams, more than the limit of {self.cfg.max_diagrams}, "
+                f"the last {extra} were not rendered and show a placeholder"
             )
-        ):
-            enpoint = self._get_current_enpoint(md_content, code, "Endpoint:", i)
-            clean_code = self._get_clean_code(code)
-            image_files, heights = self.renderer.render(i, clean_code, self.cfg.base_url, enpoint)
-            svg_files.extend(image_files)
-            image_skeleton = ""
-            for j, (image_file, height) in enumerate(zip(image_files, heights)):
-                length_mermaid[self._leaf_last(image_file)] = height
-                image_skeleton += self.image_skeleton(image_file, height, len(image_files) - j)
-
-            md_content = md_content.replace(f"```mermaid{code}```", image_skeleton)
-            md_content = self._clean_content(md_content)
-        html_content = self._wrap_intervals_with_div(md_content, length_mermaid)
-        html_content = self._enhance_to_html_links(html_content)
-        if self.cfg.is_debug:
-            # print 5 greater values of length_mermaid, print also the keys
-            print(sorted(length_mermaid.items(), key=lambda x: x[1], reverse=True)[:5])
-        return html_content, svg_files
+        return over_limits
+
+    def _assemble(self, source: Source, image_skeletons: list[str], length_mermaid: dict[str, int]) -> Iterator[str]:
+        """Yield the processed content of each section of the document, with the diagrams replaced by
+        their images, cleaned and wrapped by pages."""
+        self.pages = 0
+        self.html.new_document()
+        skeletons = iter(image_skeletons)
+        contents = (
+            self._with_definitions(self._assemble_section(section, skeletons)) for section in iter_sections(source)
+        )
+        for content in self.html.prefetch(contents, MARKDOWN_EXTRAS, Constants.DIV_BREAK_AFTER):
+            with Profiler.span("wrap"):
+                yield self._wrap_intervals_with_div(content, length_mermaid)
+
+    def _assemble_section(self, section: str, skeletons: Iterator[str]) -> str:
+        """Return the content of the section with its diagrams replaced by their images, cleaned."""
+        with Profiler.span("assemble"):
+            document = scan_markdown(section)
+            return self._clean_content(document.join([next(skeletons) for _ in document.fences]))
+
+    def _with_definitions(self, content: str) -> str:
+        """Return the content with the definitions it refers to, from other sections of the document,
+        added at the end of each of its sections."""
+        if not self.definitions:
+            return content
+        sections = []
+        for section in content.split(Constants.DIV_BREAK_AFTER):
+            lowered = section.lower()
+            own = find_definitions(section)
+            found = [
+                definition for key, definition in self.definitions.items() if key not in own and f"[{key}]" in lowered
+            ]
+            sections.append(section.rstrip("\n") + "\n\n" + "\n\n".join(found) + "\n" if found else section)
+        return Constants.DIV_BREAK_AFTER.join(sections)
+
+    def close(self) -> None:
+        """Release the resources of the renderer, of the HTML conversion and of the assets, and the cache."""
+        if self._renderer:
+            self._renderer.close()
+        self.html.close()
+        self.assets.close()
+        if self.cache:
+            self.cache.close()
+            self.cache = None
 
     def _get_clean_code(self, code: str) -> str:
         """Get the clean code by replacing '?' characters that bugs the mermaid.ink endpoints."""
         return code.replace("?", "+").strip()
 
-    def _get_current_enpoint(self, content: str, code: str, search: str, i: int) -> str:
-        """Get the previous line of mermaid code. This is the current endpoint name."""
-        section = f"```mermaid{code}```"
-        previous_line = ""
-        index = content.find(section)
-        if index == -1:
-            return ""
-        previous_lines = content[:index].split("\n")
-        for line in reversed(previous_lines):
-            if search in line:
-                previous_line = line
-                break
-        if search in previous_line:
-            endpoint = previous_line.split(":")[1].strip()
-        else:
-            endpoint = f"Endpoint_{i}"
-        return endpoint
+    def _get_current_enpoint(self, document: ScannedDocument, line: int, i: int, previous: str | None = None) -> str:
+        """Get the previous labelled line of the mermaid code at the given line. This is the current endpoint name.
+        The previous labelled line of the document is used when there is not any in the section."""
+        previous_line = document.label_before(line) or previous
+        if previous_line is None:
+            return f"Endpoint_{i}"
+        return previous_line.split(":", 1)[1].strip()
 
     def _wrap_intervals_with_div(self, content: str, length_mermaid: dict[str, int]) -> str:
         """Wrap the content in divs to control the page breaks.
-        It wraps the content in divs based on the height of the Mermaid diagrams and the number of list items."""
+        It wraps each page of the content in a div based on the height of its Mermaid diagram and
+        the number of list items. Empty pages are left out."""
         html_content = self._convert_markdown_to_html(content)
-        parts = html_content.split(Constants.DIV_BREAK_AFTER)
-
-        if len(parts) == 1:
-            return str(html_content)
 
-        wrapped_content = self._process_parts(parts, length_mermaid)
-        return "".join(wrapped_content)
-
-    def _process_parts(self, parts: list[str], length_mermaid: dict[str, int]) -> list[str]:
-        """Process each part of the content and wrap it with appropriate divs."""
         wrapped_content: list[str] = []
+        for part in html_content.split(Constants.DIV_BREAK_AFTER):
+            if not part.strip():
+                continue
+            if self.pages > 0:
+                wrapped_content.append(Constants.DIV_BREAK_AFTER)
+            wrapped_content.append(f'<div class="{self._page_class(part, length_mermaid)}">')
+            wrapped_content.append(part)
+            wrapped_content.append("</div>")
+            self.pages += 1
+        return "".join(wrapped_content)
 
-        for i in range(len(parts) - 1):
-            svg_file = self._extract_svg_file(parts[i])
-            if svg_file:
-                self._handle_svg_file(svg_file, parts[i], wrapped_content, length_mermaid, i)
-            else:
-                wrapped_content.append('<div class="normal-page">')
-                wrapped_content.append(parts[i])
-                wrapped_content.append("</div>")
-            wrapped_content.append(Constants.DIV_BREAK_AFTER)
-
-        # Remove the last unnecessary div break
-        wrapped_content.pop()
-        return wrapped_content
+    def _page_class(self, part: str, length_mermaid: dict[str, int]) -> str:
+        """Return the class of the page by the height of its diagram, if it has one, and its number of list items."""
+        svg_file = self._extract_svg_file(part)
+        height = length_mermaid.get(self._leaf_last(svg_file)) if svg_file else None
+        if height is None:
+            return "normal-page"
+        if height < 400 and self.pages > 0 and self._count_li_tags(part) < 4:
+            return "short-page"
+        if height > 600:
+            return "taller-page"
+        return "normal-page"
 
     def _extract_svg_file(self, part: str) -> str | None:
         """Extract the SVG file name from the given part."""
         match = re.search(r'src="([^"]+)"', part)
         return match.group(1) if match else None
 
-    def _handle_svg_file(
-        self, svg_file: str, part: str, wrapped_content: list[str], len_mmd: dict[str, int], index: int
-    ) -> None:
-        """Handle wrapping logic for parts containing SVG files."""
-        if svg_file is None or "No response" in svg_file:
-            wrapped_content.append(part)
-            wrapped_content.append(Constants.DIV_BREAK_AFTER)
-            return
-        svg_file_name = self._leaf_last(svg_file)
-        height = len_mmd[svg_file_name]
-
-        if height < 400 and index > 0 and self._count_li_tags(part) < 4:
-            wrapped_content.append('<div class="short-page">')
-        elif height > 600:
-            wrapped_content.append('<div class="taller-page">')
-        else:
-            wrapped_content.append('<div class="normal-page">')
-
-        wrapped_content.append(part)
-        wrapped_content.append("</div>")
-
     def _convert_markdown_to_html(self, content: str) -> str:
-        """Convert Markdown content to HTML and clean unnecessary tags."""
-        html_content = markdown2.markdown(content)
-        return re.sub(r"<p>\s*<br\s*/?>\s*</p>", "", html_content, flags=re.IGNORECASE)
+        """Convert Markdown content to HTML and clean unnecessary tags.
+        The content is converted by sections between page breaks, and the sections that are already known,
+        from the previous document or from the cache, are not converted again."""
+        html_sections = [
+            self.html.convert(section, MARKDOWN_EXTRAS).strip("\n")
+            for section in content.split(Constants.DIV_BREAK_AFTER)
+        ]
+        html_content = f"\n\n{Constants.DIV_BREAK_AFTER}\n\n".join(html_sections) + "\n"
+        return re.sub(r"<p>\s*(<br\s*/?>)?\s*</p>", "", html_content, flags=re.IGNORECASE)
 
     def _leaf_last(self, file_path: str) -> str:
         """Return the last part of a file path."""
-        return file_path.rsplit("/", 1)[1]
+        return file_path.rsplit("/", 1)[-1]
 
     def _count_li_tags(self, text: str) -> int:
         """Count the number of list items in the text."""
@@ -163,29 +305,9 @@ class MarkdownProcessor:
         return builder.build()
 
     def _extract_mermaid_blocks(self, content: str) -> list[str]:
-        return re.findall(r"```mermaid(.*?)```", content, re.DOTALL)
+        return [fence.code for fence in scan_markdown(content).fences]
 
     def _clean_content(self, content: str) -> str:
-        """Clean the content by removing unnecessary elements for printing."""
-        content = content.replace("<details open>", "")
-        content = content.replace("</details>", "")
-        content = content.replace("<summary>diagrams</summary>", "")
-        content = self._combine_method_and_path_in_markdown(content)
-        content = self._remove_duplicate_page_breaks(content)
-        return content
-
-    def _combine_method_and_path_in_markdown(self, content: str) -> str:
-        pattern = re.compile(r"Method:\s*(\w+)\s*<br>\s*Path:\s*([^\s<]+)\s*<br>")
-        combined_content = pattern.sub(r"\1 \2<br>", content)
-        return combined_content
-
-    def _remove_duplicate_page_breaks(self, html_content: str) -> str:
-        pattern = re.compile(r'(<br\s*/?>\s*<div style="page-break-before: always;"></div>\s*){2,}')
-        cleaned_content = pattern.sub(r'<br/><div style="page-break-before: always;"></div>\n\n', html_content)
-        return cleaned_content
-
-    def _enhance_to_html_links(self, content: str) -> str:
-        pattern = re.compile(r"(Documentation for the API: )(.*)(<br>)")
-        subst = r'\1<a href="\2" class="modern-link">\2</a>\3'
-        result = pattern.sub(subst, content)
-        return result
+        """Clean the content by removing unnecessary elements for printing, and apply the rules of the user.
+        All the rules are applied in a single pass over the document."""
+        return self.rules.apply(content)
@@ -0,0 +1,117 @@
+import json
+import re
+from dataclasses import dataclass
+from typing import Iterable
+
+# region Rule
+
+
+@dataclass(frozen=True)
+class Rule:
+    """A rewrite of the document: the matches of the pattern are replaced by the replacement.
+    A regex replacement can refer to the groups of the pattern as \\1, a literal one is copied as it is."""
+
+    pattern: str
+    replacement: str = ""
+    literal: bool = False
+    ignore_case: bool = False
+
+    def regex(self) -> str:
+        source = re.escape(self.pattern) if self.literal else self.pattern
+        return f"(?i:{source})" if self.ignore_case else source
+
+
+PAGE_BREAK_BEFORE = '<div style="page-break-before: always;"></div>'
+
+# The cleanup of the document for printing, in order of precedence
+DEFAULT_RULES = [
+    Rule("<details open>", literal=True),
+    Rule("</details>", literal=True),
+    Rule("<summary>diagrams</summary>", literal=True),
+    # Method and path of an endpoint in a single line
+    Rule(r"Method:\s*(\w+)\s*<br>\s*Path:\s*([^\s<]+)\s*<br>", r"\1 \2<br>"),
+    # Consecutive page breaks
+    Rule(rf"(<br\s*/?>\s*{re.escape(PAGE_BREAK_BEFORE)}\s*){{2,}}", f"<br/>{PAGE_BREAK_BEFORE}\n\n"),
+    Rule(r"(Documentation for the API: )(.*)(<br>)", r'\1<a href="\2" class="modern-link">\2</a>\3'),
+]
+
+
+# region RuleEngine
+
+# Backreferences and conditionals of a pattern, which refer to its groups by number or name, not escaped
+BACKREFERENCE = re.compile(r"(?<!\\)(?:\\\\)*(?:\\[1-9]|\(\?P=|\(\?\()")
+
+
+class RuleEngine:
+    """Apply the rules to the document in a single pass.
+    The rules are compiled once into a single alternation, and at each position of the document the first
+    rule that matches is applied, so the cost grows with the document and not with the number of rules.
+    A rule whose pattern refers to its own groups, or that can not be combined with the previous ones,
+    as one that repeats the name of a group, starts a new alternation that is applied after them.
+    """
+
+    def __init__(self, rules: Iterable[Rule] = ()) -> None:
+        self.rules: list[Rule] = []
+        self.compiled: list[re.Pattern[str]] = []
+        # The alternations in order, with the indexes of their rules
+        self.groups: list[tuple[list[int], re.Pattern[str]]] = []
+        for rule in rules:
+            self.register(rule)
+
+    def register(self, rule: Rule) -> None:
+        """Add a rule after the registered ones. Raise ValueError if the pattern is not a valid regex."""
+        try:
+            compiled = re.compile(rule.regex())
+        except re.error as e:
+            raise ValueError(f"Invalid rule pattern {rule.pattern!r}: {e}") from e
+        index = len(self.rules)
+        self.rules.append(rule)
+        self.compiled.append(compiled)
+        if BACKREFERENCE.search(rule.regex()):
+            # Its groups are only numbered as in its pattern when it is compiled alone
+            self.groups.append(([index], compiled))
+            return
+        if self.groups and all(not BACKREFERENCE.search(self.rules[i].regex()) for i in self.groups[-1][0]):
+            indexes = [*self.groups[-1][0], index]
+            try:
+                combined = re.compile("|".join(f"(?P<rule_{i}>{self.rules[i].regex()})" for i in indexes))
+            except re.error:
+                pass
+            else:
+                self.groups[-1] = (indexes, combined)
+                return
+        self.groups.append(([index], compiled))
+
+    def apply(self, content: str) -> str:
+        for indexes, pattern in self.groups:
+            content = pattern.sub(lambda match: self._replace(indexes, match), content)
+        return content
+
+    def _replace(self, indexes: list[int], match: re.Match[str]) -> str:
+        if len(indexes) == 1:
+            rule = self.rules[indexes[0]]
+            return rule.replacement if rule.literal else match.expand(rule.replacement)
+        index = int(str(match.lastgroup).rsplit("_", 1)[1])
+        rule = self.rules[index]
+        if rule.literal:
+            return rule.replacement
+        # The groups of the rule are numbered inside the combined pattern, so the match is repeated alone
+        own_match = self.compiled[index].match(match.string, match.start(), match.end())
+        return own_match.expand(rule.replacement) if own_match else match.group()
+
+
+def load_rules(path: str | None) -> list[Rule]:
+    """Read the rules of a JSON file: a list of objects with a pattern, and optionally a replacement,
+    literal and ignore_case. Raise ValueError if the file is not a valid list of rules."""
+    if not path:
+        return []
+    try:
+        with open(path) as f:
+            items = json.load(f)
+        if not isinstance(items, list):
+            raise TypeError("expected a list of rules")
+        rules = [Rule(**item) for item in items]
+        RuleEngine(rules)  # check the patterns
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid rules file {path}: {e}") from e
+    return rules
@@ -0,0 +1,133 @@
+from bisect import bisect_left
+
+# region Segments
+
+
+class TextSegment:
+    """A span of the document that is copied as it is to the output."""
+
+    __slots__ = ("start", "end")
+
+    def __init__(self, start: int, end: int) -> None:
+        self.start = start
+        self.end = end
+
+
+class FenceSegment:
+    """A fenced Mermaid block, from the opening fence to the end of the closing one.
+    The code is unindented to the column of the opening fence."""
+
+    __slots__ = ("start", "end", "line", "code")
+
+    def __init__(self, start: int, end: int, line: int, code: str) -> None:
+        self.start = start
+        self.end = end
+        self.line = line
+        self.code = code
+
+
+Segment = TextSegment | FenceSegment
+
+
+# region ScannedDocument
+
+
+class ScannedDocument:
+    """The document split into text and Mermaid segments, with the lines that contain a label
+    indexed by line number to find the nearest one before a diagram."""
+
+    __slots__ = ("content", "segments", "fences", "label_lines", "label_values")
+
+    def __init__(self, content: str, segments: list[Segment], labels: list[tuple[int, str]]) -> None:
+        self.content = content
+        self.segments = segments
+        self.fences = [segment for segment in segments if isinstance(segment, FenceSegment)]
+        self.label_lines = [line for line, _ in labels]
+        self.label_values = [value for _, value in labels]
+
+    def label_before(self, line: int) -> str | None:
+        """Return the last line containing the label before the given line, or None if there is not any."""
+        index = bisect_left(self.label_lines, line)
+        return self.label_values[index - 1] if index > 0 else None
+
+    def join(self, replacements: list[str]) -> str:
+        """Return the document with each fence replaced by the replacement at the same position."""
+        pieces = []
+        fences = iter(replacements)
+        for segment in self.segments:
+            if isinstance(segment, FenceSegment):
+                pieces.append(next(fences))
+            else:
+                pieces.append(self.content[segment.start : segment.end])
+        return "".join(pieces)
+
+
+# region scan_markdown
+
+
+def scan_markdown(content: str, label: str = "") -> ScannedDocument:
+    """Split the Markdown content in a single pass into text segments and Mermaid fences.
+    Fences can be opened with ``` or ~~~ at any indentation, and are closed by the same marker,
+    at least as long as the opening one. Other fenced blocks are kept as text, and a fence that is
+    never closed is not a diagram. Lines outside the Mermaid fences that contain the label are indexed.
+    """
+    segments: list[Segment] = []
+    labels: list[tuple[int, str]] = []
+    text_start = 0
+    pos = 0
+    line_no = 0
+    length = len(content)
+    fence: tuple[int, int, str, int, bool, list[str]] | None = None  # start, line, marker, indent, mermaid, body
+
+    while pos < length:
+        end = content.find("\n", pos)
+        next_pos = length if end == -1 else end + 1
+        line = content[pos:next_pos].rstrip("\r\n")
+        stripped = line.lstrip(" ")
+        indent = len(line) - len(stripped)
+
+        if fence is None:
+            marker = _fence_marker(stripped)
+            if marker:
+                info = stripped[len(marker) :].strip()
+                fence = (pos + indent, line_no, marker, indent, info.split(" ", 1)[0] == "mermaid", [])
+            elif label and label in line:
+                labels.append((line_no, line))
+        else:
+            start, fence_line, marker, fence_indent, is_mermaid, body = fence
+            if _closes(stripped, marker):
+                if is_mermaid:
+                    if text_start < start:
+                        segments.append(TextSegment(text_start, start))
+                    code = "\n" + "".join(f"{body_line}\n" for body_line in body)
+                    close_end = pos + len(line)
+                    segments.append(FenceSegment(start, close_end, fence_line, code))
+                    text_start = close_end
+                fence = None
+            elif is_mermaid:
+                body.append(line[min(indent, fence_indent) :])
+            elif label and label in line:
+                labels.append((line_no, line))
+
+        pos = next_pos
+        line_no += 1
+
+    if text_start < length:
+        segments.append(TextSegment(text_start, length))
+    return ScannedDocument(content, segments, labels)
+
+
+def _fence_marker(stripped: str) -> str:
+    """Return the opening marker (three or more backticks or tildes) of the line, or an empty string."""
+    if not stripped.startswith(("```", "~~~")):
+        return ""
+    char = stripped[0]
+    count = len(stripped) - len(stripped.lstrip(char))
+    if char == "`" and "`" in stripped[count:]:
+        return ""
+    return char * count
+
+
+def _closes(stripped: str, marker: str) -> bool:
+    """Check if the line closes a fence opened with the marker."""
+    return stripped.startswith(marker) and not stripped.lstrip(marker[0]).strip()
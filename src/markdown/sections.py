@@ -0,0 +1,55 @@
+import mmap
+import os
+import re
+from contextlib import contextmanager
+from typing import Iterator, TypeAlias
+
+from src.core.constants import Constants
+
+from .assets import CODE_PATTERN
+
+# A document as a string, or as the bytes of a file mapped in memory
+Source: TypeAlias = str | bytes | mmap.mmap
+
+# Definition of a reference link, or of a footnote with its indented paragraphs
+DEFINITION_PATTERN = re.compile(
+    r"^ {0,3}\[(?P<label>(?P<footnote>\^)?[^\]\n]+)\]:[ \t]*\S[^\n]*"
+    r"(?(footnote)(?:\n(?:[ \t]*\n)*(?: {4}|\t)[^\n]*)*)",
+    re.MULTILINE,
+)
+
+
+def iter_sections(source: Source) -> Iterator[str]:
+    """Yield the sections of the document between page breaks, without the breaks.
+    A document in bytes is decoded a section at a time, so a memory-mapped file is never decoded as a whole."""
+    text = isinstance(source, str)
+    separator = Constants.DIV_BREAK_AFTER if text else Constants.DIV_BREAK_AFTER.encode("utf-8")
+    start = 0
+    while True:
+        end = source.find(separator, start)  # type: ignore[arg-type]
+        section = source[start : end if end != -1 else len(source)]
+        yield section if isinstance(section, str) else section.decode("utf-8")
+        if end == -1:
+            return
+        start = end + len(separator)
+
+
+def find_definitions(section: str) -> dict[str, str]:
+    """Return the definitions of reference links and footnotes of the section by their label in lower case,
+    leaving out the ones in code. The first definition of a label is the one that counts."""
+    definitions: dict[str, str] = {}
+    for match in DEFINITION_PATTERN.finditer(CODE_PATTERN.sub("", section)):
+        definitions.setdefault(match.group("label").lower(), match.group())
+    return definitions
+
+
+@contextmanager
+def open_markdown(path: str) -> Iterator[Source]:
+    """Map the Markdown file in memory, read only, instead of reading it into a string.
+    An empty file, that can not be mapped, is returned as empty bytes."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
@@ -0,0 +1,169 @@
+import re
+import xml.etree.ElementTree as ET
+
+from src.core.constants import Constants
+
+from .cache import DiagramCache
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+ET.register_namespace("", SVG_NS)
+ET.register_namespace("xlink", XLINK_NS)
+
+# Attributes with coordinates or lengths, whose numbers are rounded
+GEOMETRY = frozenset(
+    {
+        "d",
+        "points",
+        "transform",
+        "viewBox",
+        "x",
+        "y",
+        "x1",
+        "y1",
+        "x2",
+        "y2",
+        "dx",
+        "dy",
+        "cx",
+        "cy",
+        "r",
+        "rx",
+        "ry",
+        "width",
+        "height",
+        "refX",
+        "refY",
+        "markerWidth",
+        "markerHeight",
+    }
+)
+# Elements that are only drawn where they are referenced, by url(#id) or href="#id"
+REFERENCED = frozenset(
+    {"marker", "linearGradient", "radialGradient", "clipPath", "mask", "pattern", "filter", "symbol"}
+)
+NUMBER = re.compile(r"-?(?:\d+\.\d*|\.\d+)(?:[eE][-+]?\d+)?")
+REFERENCE = re.compile(r"url\(\s*['\"]?#([^)'\"\s]+)")
+
+
+def optimize_svg(svg: str, precision: int = Constants.SVG_PRECISION) -> str:
+    """Return a smaller SVG that draws the same diagram: without metadata, comments and data attributes,
+    with each distinct style block once, with the coordinates rounded to the precision, and without
+    the markers, gradients and other definitions that nothing references.
+    An SVG that can not be parsed is returned as it is."""
+    try:
+        root = ET.fromstring(svg)
+    except ET.ParseError:
+        return svg
+
+    styles: set[str] = set()
+    for parent in list(root.iter()):
+        for child in list(parent):
+            tag = _local(child.tag)
+            if tag == "metadata":
+                parent.remove(child)
+            elif tag == "style":
+                text = (child.text or "").strip()
+                if text in styles:
+                    parent.remove(child)
+                styles.add(text)
+
+    for element in root.iter():
+        for name in list(element.attrib):
+            if name.startswith("data-"):
+                del element.attrib[name]
+            elif name in GEOMETRY:
+                element.attrib[name] = _round_numbers(element.attrib[name], precision)
+
+    _drop_unreferenced(root)
+    return ET.tostring(root, encoding="unicode")
+
+
+def _drop_unreferenced(root: ET.Element) -> None:
+    """Remove the definitions that nothing references, again while a removal leaves others unreferenced.
+    The style blocks inside defs apply to the whole SVG, so they are kept."""
+    while True:
+        references = _references(root)
+        unused = [
+            (parent, child)
+            for parent in root.iter()
+            for child in parent
+            if (_local(child.tag) in REFERENCED or (_local(parent.tag) == "defs" and _local(child.tag) != "style"))
+            and child.get("id") not in references
+        ]
+        if not unused:
+            break
+        for parent, child in unused:
+            parent.remove(child)
+    for parent in list(root.iter()):
+        for child in list(parent):
+            if _local(child.tag) == "defs" and not len(child):
+                parent.remove(child)
+
+
+def _references(root: ET.Element) -> set[str]:
+    references = set()
+    for element in root.iter():
+        if _local(element.tag) == "style" and element.text:
+            references.update(REFERENCE.findall(element.text))
+        for name, value in element.attrib.items():
+            references.update(REFERENCE.findall(value))
+            if _local(name) == "href" and value.startswith("#"):
+                references.add(value[1:])
+    return references
+
+
+def _round_numbers(value: str, precision: int) -> str:
+    """Return the value with its numbers rounded to the precision. A number written right after another one,
+    as .5 in the compact path data 1.001.5, is separated by a space, as its rounded form could merge with it."""
+    parts = []
+    end = 0
+    for match in NUMBER.finditer(value):
+        number = _round(match.group(), precision)
+        if end and match.start() == end and not number.startswith("-"):
+            number = f" {number}"
+        parts.append(value[end : match.start()])
+        parts.append(number)
+        end = match.end()
+    parts.append(value[end:])
+    return "".join(parts)
+
+
+def _round(number: str, precision: int) -> str:
+    text = f"{round(float(number), precision):.{precision}f}".rstrip("0").rstrip(".")
+    return "0" if text in ("", "-0") else text
+
+
+def _local(tag: str) -> str:
+    """Return the name of a tag or attribute without its namespace."""
+    return tag.rsplit("}", 1)[-1]
+
+
+# region SvgOptimizer
+
+
+class SvgOptimizer:
+    """Optimize the SVGs of the diagrams, keeping the results by the hash of the input SVG in memory and
+    in the diagram cache, so an SVG is only optimized once. An optimized SVG is returned as it is."""
+
+    def __init__(self, precision: int = Constants.SVG_PRECISION, cache: DiagramCache | None = None) -> None:
+        self.precision = precision
+        self.cache = cache
+        self.memo: dict[str, str] = {}
+
+    def optimize(self, svg: str) -> str:
+        key = self._key(svg)
+        if (optimized := self.memo.get(key)) is not None:
+            return optimized
+        if self.cache is None or (optimized := self.cache.get(key)) is None:
+            optimized = optimize_svg(svg, self.precision)
+            if self.cache:
+                self.cache.put(key, optimized)
+        if len(self.memo) >= Constants.SVG_MEMO_SIZE:
+            self.memo.clear()
+        self.memo[key] = optimized
+        self.memo[self._key(optimized)] = optimized
+        return optimized
+
+    def _key(self, svg: str) -> str:
+        return DiagramCache.key(svg, "optimized", str(self.precision))
@@ -0,0 +1,216 @@
+import re
+
+# Types of diagram that are parsed by their first word. The others are split by lines and not validated.
+SEQUENCE = "sequence"
+FLOWCHART = "flowchart"
+CLASS = "class"
+DIAGRAM_TYPES = {
+    "sequenceDiagram": SEQUENCE,
+    "graph": FLOWCHART,
+    "flowchart": FLOWCHART,
+    "flowchart-elk": FLOWCHART,
+    "classDiagram": CLASS,
+    "classDiagram-v2": CLASS,
+}
+# Types of diagram that are not parsed, but whose type is carried into each chunk
+OTHER_TYPES = frozenset(
+    {
+        "stateDiagram",
+        "stateDiagram-v2",
+        "erDiagram",
+        "gantt",
+        "pie",
+        "journey",
+        "gitGraph",
+        "mindmap",
+        "timeline",
+        "quadrantChart",
+        "requirementDiagram",
+        "C4Context",
+        "sankey-beta",
+        "xychart-beta",
+        "block-beta",
+    }
+)
+
+# Statements that open a block closed by "end", and the ones that divide a block in branches
+SEQUENCE_BLOCKS = frozenset({"loop", "alt", "opt", "par", "critical", "break", "rect", "box"})
+SEQUENCE_BRANCHES = {"else": "alt", "and": "par", "option": "critical"}
+# Statements that every chunk of a diagram needs, as the participants that fix the order of the lifelines
+DECLARATIONS = {
+    SEQUENCE: frozenset({"participant", "actor", "autonumber"}),
+    FLOWCHART: frozenset({"classDef"}),
+    CLASS: frozenset({"classDef"}),
+}
+WORD = re.compile(r"[A-Za-z][\w-]*")
+# Quoted text, as labels and tooltips, whose semicolons, braces and words are not statements
+QUOTED = re.compile(r'"[^"]*"')
+
+
+# region ParsedDiagram
+
+
+class ParsedDiagram:
+    """The structure of a Mermaid diagram: its lines, the header that declares its type, the statements
+    that each chunk of it needs, and the lines where a chunk can start, outside of any block, so a chunk
+    never cuts a loop, an alt or a subgraph. The errors are the ones found without rendering it,
+    as an end without a block or a block that is never closed."""
+
+    __slots__ = ("kind", "lines", "prelude", "header", "directives", "declarations", "cuts", "errors")
+
+    def __init__(self, code: str) -> None:
+        self.lines = code.split("\n")
+        self.kind: str | None = None
+        # The lines up to the type of the diagram, as directives and front matter, and the type itself
+        self.prelude = 0
+        self.header = ""
+        # The lines of the directives after the type, which apply to the whole diagram
+        self.directives: list[int] = []
+        self.declarations: list[int] = []
+        self.cuts: list[int] = []
+        self.errors: list[str] = []
+
+    def header_before(self, start: int) -> str:
+        """Return the header of a chunk that starts at the line: the type of the diagram, its directives,
+        and the declarations before the line. The first chunk has the header in its own lines."""
+        if start == 0:
+            return ""
+        lines = [self.lines[i] for i in self.directives]
+        lines.extend(self.lines[i] for i in self.declarations if i < start)
+        if self.header:
+            lines.insert(0, self.header)
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def body(self, start: int, end: int) -> str:
+        """Return the lines of a chunk from the start line to the end one, without the directives
+        when they are in its header."""
+        if start == 0:
+            return "\n".join(self.lines[start:end])
+        directives = set(self.directives)
+        return "\n".join(self.lines[i] for i in range(start, end) if i not in directives)
+
+
+def parse_diagram(code: str) -> ParsedDiagram:
+    """Parse the Mermaid code in a single pass over its lines."""
+    diagram = ParsedDiagram(code)
+    lines = diagram.lines
+    directives = _directive_lines(lines)
+    in_front_matter = False
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped == "---":
+            in_front_matter = not in_front_matter
+            continue
+        if in_front_matter or i in directives or not stripped or stripped.startswith("%%"):
+            continue
+        word = match.group() if (match := WORD.match(stripped)) else ""
+        if word in DIAGRAM_TYPES or word in OTHER_TYPES:
+            diagram.kind = DIAGRAM_TYPES.get(word)
+            diagram.prelude = i + 1
+            # A flowchart can have statements in the line of its type, as "graph TD; A-->B;"
+            diagram.header = "\n".join(lines[:i] + [line.split(";", 1)[0].rstrip()])
+        break
+    diagram.directives = sorted(i for i in directives if i >= diagram.prelude)
+
+    if diagram.kind is None:
+        body = [i for i in range(diagram.prelude + 1, len(lines)) if i not in directives]
+        diagram.cuts = [0, *body, len(lines)]
+        return diagram
+
+    declarations = DECLARATIONS[diagram.kind]
+    # Open blocks as (statement, line), and the first line of a block of declarations, as a box of participants
+    stack: list[tuple[str, int]] = []
+    declaring: int | None = None
+    # Whether a quoted text goes on in the next line, as the label of a node over several lines
+    quoted = False
+    cuts = [0]
+    for i in range(diagram.prelude - 1, len(lines)):
+        if i in directives:
+            continue
+        if not stack and not quoted and i > diagram.prelude:
+            cuts.append(i)
+        # The line of the type is parsed after the type, for the statements of a flowchart in it
+        stripped, quoted = _code(lines[i] if i >= diagram.prelude else lines[i].partition(";")[2], quoted)
+        # The text of a message of a sequence diagram ends with its line
+        quoted = quoted and diagram.kind != SEQUENCE
+        if not stripped:
+            continue
+        for statement in _statements(diagram.kind, stripped):
+            word = match.group() if (match := WORD.match(statement)) else ""
+            error = _close_or_open(diagram.kind, word, statement, stack, i)
+            if error:
+                diagram.errors.append(f"line {i + 1}: {error}")
+        if declaring is None and stack and stack[-1][0] == "box":
+            declaring = stack[-1][1]
+        if declaring is not None:
+            if not stack:
+                diagram.declarations.extend(range(declaring, i + 1))
+                declaring = None
+        elif not stack and i >= diagram.prelude and (match := WORD.match(stripped)) and match.group() in declarations:
+            diagram.declarations.append(i)
+    for statement, opened in stack:
+        diagram.errors.append(f"line {opened + 1}: {statement} is never closed")
+    cuts.append(len(lines))
+    diagram.cuts = cuts
+    return diagram
+
+
+def _directive_lines(lines: list[str]) -> set[int]:
+    """Return the lines of the directives of the diagram, as %%{init: ...}%%, which can take several lines."""
+    directives = set()
+    opened: int | None = None
+    for i, line in enumerate(lines):
+        if opened is None and line.lstrip().startswith("%%{"):
+            opened = i
+        if opened is not None:
+            directives.add(i)
+            if "}%%" in line:
+                opened = None
+    return directives
+
+
+def _code(line: str, quoted: bool = False) -> tuple[str, bool]:
+    """Return the code of a line without the text between quotes and the comment at its end,
+    and whether a quoted text is still open at its end. A quoted text opened in a previous line is skipped
+    up to its closing quote."""
+    if quoted:
+        close = line.find('"')
+        if close < 0:
+            return "", True
+        line = line[close + 1 :]
+    code = QUOTED.sub("''", line).partition("%%")[0]
+    code, quote, _ = code.partition('"')
+    return code.strip(), bool(quote)
+
+
+def _statements(kind: str, line: str) -> list[str]:
+    """Return the statements of a line: a flowchart can have several separated by semicolons."""
+    if kind == FLOWCHART:
+        return [statement.strip() for statement in line.split(";") if statement.strip()]
+    return [line]
+
+
+def _close_or_open(kind: str, word: str, statement: str, stack: list[tuple[str, int]], line: int) -> str | None:
+    """Update the open blocks with the statement, and return the error of an unbalanced one."""
+    if kind == CLASS:
+        for char in statement:
+            if char == "{":
+                stack.append(("{", line))
+            elif char == "}":
+                if not stack:
+                    return "} without an open {"
+                stack.pop()
+        return None
+
+    if word == "end":
+        if not stack:
+            return "end without an open block"
+        stack.pop()
+    elif kind == SEQUENCE and word in SEQUENCE_BLOCKS:
+        stack.append((word, line))
+    elif kind == SEQUENCE and word in SEQUENCE_BRANCHES:
+        if not stack or stack[-1][0] != SEQUENCE_BRANCHES[word]:
+            return f"{word} outside of an {SEQUENCE_BRANCHES[word]} block"
+    elif kind == FLOWCHART and word == "subgraph":
+        stack.append((word, line))
+    return None
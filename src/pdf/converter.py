@@ -1,45 +1,112 @@
 import os
+from typing import BinaryIO, Iterable, TypeAlias
 
-from md2pdf import md2pdf
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
 
 from src.core.models import PdfCfg
+from src.core.profiler import Profiler
 from src.markdown.processor import MarkdownProcessor
+from src.markdown.sections import Source
+
+from .fetcher import DiagramFetcher
+from .layout import split_groups
+
+# Extras of markdown2 used by md2pdf, to keep the same output
+MARKDOWN_EXTRAS = ["cuddled-lists", "tables", "footnotes"]
+
+# Where the PDF is written: a path, or a binary file as a BytesIO
+Target: TypeAlias = str | BinaryIO
 
 
 class PdfConverter:
     """
     This class converts Markdown content to PDF.
     It uses the MarkdownProcessor to process the Markdown content and then converts it to PDF.
-    It uses the md2pdf library to convert the processed Markdown to PDF.
+    The processed content is handed to WeasyPrint in memory, and the diagrams are served
+    from memory too, so nothing is written to disk but the PDF.
+    The fonts and the stylesheet are kept between documents, and the stylesheet is parsed again
+    only when its file changes.
     """
 
     def __init__(self, cfg: PdfCfg, processor: MarkdownProcessor) -> None:
         self.cfg = cfg
         self.processor = processor
+        self.font_config = FontConfiguration()
+        self.css: list[CSS] = []
+        self.css_stamp: tuple[str, int] | None = None
+
+    def convert_to_pdf(self, markdown_content: Source, target: Target | None = None) -> None:
+        """Convert the Markdown, a string or a file mapped in memory, to the target or else to the PDF file.
+        The diagrams are rendered first, then the document is converted a section at a time.
+        It is the conversion of the command line, which waits for Enter in debug mode before the PDF."""
+        with Profiler.span("convert_to_pdf"):
+            svgs, sections = self.processor.process_sections(markdown_content)
+
+            if self.cfg.is_debug:
+                input("\rPress Enter to continue...")
+            print("\rConverting to PDF...")
+
+            self.write_pdf(sections, svgs, target)
+
+    def convert(self, markdown_content: Source, target: Target | None = None) -> None:
+        """Convert the Markdown as convert_to_pdf does, without the prompt and the messages of the command line,
+        for the workers that have no terminal."""
+        with Profiler.span("convert_to_pdf"):
+            svgs, sections = self.processor.process_sections(markdown_content)
+            self.write_pdf(sections, svgs, target)
 
-    def convert_to_pdf(self, markdown_content: str) -> None:
-        processed_content, svg_files = self.processor.process_markdown(markdown_content)
+    def write_pdf(self, sections: Iterable[str], svgs: dict[str, str], target: Target | None = None) -> None:
+        """Convert the processed Markdown to styled HTML and render it to the PDF file, as md2pdf does."""
+        raw_html = self.to_html(sections)
+        self.render_pdf(raw_html, svgs, target)
 
-        # Temp file to store the processed Markdown
-        temp = self.cfg.tmp_md_path
-        os.makedirs(os.path.dirname(temp), exist_ok=True)
-        with open(temp, "w") as f:
-            f.write(processed_content)
-        f.close()
+    def to_html(self, sections: Iterable[str]) -> str:
+        """Convert the processed Markdown to the HTML of the document, a section at a time.
+        The sections are consumed as they are converted, so only their HTML is kept in memory,
+        and the sections already converted are taken from the memory or the cache of the processor."""
+        html = self.processor.html
+        with Profiler.span("to_html"):
+            raw_html = "".join(
+                html.convert(section, MARKDOWN_EXTRAS) for section in html.prefetch(sections, MARKDOWN_EXTRAS)
+            )
+        if not len(raw_html):
+            raise ValueError("Input markdown seems empty")
+        return raw_html
 
-        if self.cfg.is_debug:
-            input("\rPress Enter to continue...")
-        print("\rConverting to PDF...")
+    def stylesheets(self) -> list[CSS]:
+        """Return the stylesheet of the configuration, parsed again only if the file changed."""
+        if not self.cfg.css_path:
+            return []
+        stamp = (self.cfg.css_path, os.stat(self.cfg.css_path).st_mtime_ns)
+        if stamp != self.css_stamp:
+            self.css = [CSS(filename=self.cfg.css_path, font_config=self.font_config)]
+            self.css_stamp = stamp
+        return self.css
 
-        # Converts the processed Markdown to PDF
-        md2pdf(self.cfg.pdf_path, md_file_path=temp, css_file_path=self.cfg.css_path, base_url=self.cfg.base_url)
+    def render_pdf(self, raw_html: str, svgs: dict[str, str], target: Target | None = None) -> None:
+        """Render the HTML with the stylesheet to the PDF file, serving the diagrams from memory.
+        With several layout jobs, a large document is laid out by groups of pages in a pool of processes."""
+        groups = split_groups(raw_html, self.cfg.layout_jobs) if self.cfg.layout_jobs > 1 else [raw_html]
+        if len(groups) > 1:
+            from .layout import render_parallel
 
-        print("Cleaning up...")
-        self.cleaning(svg_files, temp)
+            with Profiler.span("layout", groups=len(groups)) as span:
+                pages = render_parallel(
+                    groups,
+                    svgs,
+                    self.processor.assets,
+                    self.cfg.base_url,
+                    self.cfg.css_path,
+                    target or self.cfg.pdf_path,
+                )
+                span.set(pages=pages)
+            return
 
-    def cleaning(self, svg_files: list[str], temp: str) -> None:
-        # Clean up the generated SVG files and the temp file
-        for svg_file in svg_files:
-            os.remove(svg_file)
-        os.remove(temp)
-        print("Done cleaning up.")
+        with Profiler.span("layout"):
+            html = HTML(
+                string=raw_html, base_url=self.cfg.base_url, url_fetcher=DiagramFetcher(svgs, self.processor.assets)
+            )
+            document = html.render(stylesheets=self.stylesheets(), font_config=self.font_config)
+        with Profiler.span("write_pdf", pages=len(document.pages)):
+            document.write_pdf(target or self.cfg.pdf_path)
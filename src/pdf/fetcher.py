@@ -0,0 +1,28 @@
+from typing import Mapping
+
+from weasyprint.urls import URLFetcher, URLFetcherResponse
+
+from src.markdown.assets import Asset, AssetFetcher
+
+# region DiagramFetcher
+
+
+class DiagramFetcher(URLFetcher):
+    """URL fetcher for WeasyPrint that serves the rendered diagrams from memory, and the images
+    prefetched by the processor, or by their URL in a worker process. Any other resource of the document
+    is fetched as WeasyPrint does.
+    """
+
+    def __init__(
+        self, svgs: dict[str, str], assets: AssetFetcher | Mapping[str, Asset] | None = None, **kwargs: object
+    ) -> None:
+        super().__init__(**kwargs)
+        self.svgs = svgs
+        self.assets = assets
+
+    def fetch(self, url: str, headers: dict[str, str] | None = None) -> URLFetcherResponse:
+        if (svg := self.svgs.get(url)) is not None:
+            return URLFetcherResponse(url, svg.encode("utf-8"), {"Content-Type": "image/svg+xml"})
+        if self.assets and (asset := self.assets.get(url)) is not None:
+            return URLFetcherResponse(url, asset.body, {"Content-Type": asset.content_type})
+        return super().fetch(url, headers)
@@ -0,0 +1,128 @@
+import io
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, BinaryIO, TypeAlias
+
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+
+from src.core.constants import Constants
+from src.markdown.assets import Asset, AssetFetcher, find_assets, resolve_url
+
+from .fetcher import DiagramFetcher
+
+if TYPE_CHECKING:
+    from pypdf.generic import IndirectObject
+
+# A bookmark of the document: page number, level, label, distance from the top of the page in points and if it is open
+Bookmark: TypeAlias = tuple[int, int, str, float, bool]
+
+# WeasyPrint lays out in CSS pixels and writes the PDF in points
+PX_TO_PT = 0.75
+
+# region Groups
+
+
+def split_groups(raw_html: str, jobs: int, min_pages: int = Constants.LAYOUT_MIN_PAGES) -> list[str]:
+    """Split the HTML of the document by its page breaks into at most jobs groups of consecutive pages,
+    of about the same size and with at least min_pages pages each. A small document is a single group."""
+    pages = raw_html.split(Constants.DIV_BREAK_AFTER)
+    num_groups = min(jobs, len(pages) // max(min_pages, 1))
+    if num_groups < 2:
+        return [raw_html]
+
+    # The pages are cut where the accumulated size passes each share of the document
+    share = sum(len(page) for page in pages) / num_groups
+    groups: list[list[str]] = [[]]
+    size = 0
+    for page in pages:
+        if groups[-1] and size >= share * len(groups) and len(groups) < num_groups:
+            groups.append([])
+        groups[-1].append(page)
+        size += len(page)
+    return [Constants.DIV_BREAK_AFTER.join(group) for group in groups]
+
+
+def render_group(
+    raw_html: str, svgs: dict[str, str], assets: dict[str, Asset], base_url: str, css_path: str | None
+) -> tuple[bytes, list[Bookmark]]:
+    """Lay out a group of pages in a worker process, returning its PDF and its bookmarks.
+    The fonts of the stylesheet are loaded with the configuration used to lay out the pages, as in a single process,
+    and the diagrams and prefetched images of the group are served from memory."""
+    font_config = FontConfiguration()
+    html = HTML(string=raw_html, base_url=base_url, url_fetcher=DiagramFetcher(svgs, assets))
+    stylesheets = [CSS(filename=css_path, font_config=font_config)] if css_path else []
+    document = html.render(stylesheets=stylesheets, font_config=font_config)
+    bookmarks = [
+        (page_number, level, label, (page.height - y) * PX_TO_PT, state == "open")
+        for page_number, page in enumerate(document.pages)
+        for level, label, (_, y), state in page.bookmarks
+    ]
+    return document.write_pdf(), bookmarks
+
+
+# region Layout
+
+
+def render_parallel(
+    groups: list[str],
+    svgs: dict[str, str],
+    assets: AssetFetcher | None,
+    base_url: str,
+    css_path: str | None,
+    target: str | BinaryIO,
+) -> int:
+    """Lay out the groups of pages in a pool of processes, and write them in order to a single PDF.
+    Each process gets only the diagrams and the prefetched images of its group. Return the number of pages."""
+    with ProcessPoolExecutor(max_workers=len(groups)) as executor:
+        futures = [
+            executor.submit(
+                render_group,
+                group,
+                {uri: svg for uri, svg in svgs.items() if uri in group},
+                group_assets(group, assets, base_url),
+                base_url,
+                css_path,
+            )
+            for group in groups
+        ]
+        results = [future.result() for future in futures]
+    return merge_pdfs(results, target)
+
+
+def group_assets(raw_html: str, assets: AssetFetcher | None, base_url: str) -> dict[str, Asset]:
+    """Return the prefetched images of a group of pages by their absolute URL."""
+    if assets is None:
+        return {}
+    found = {}
+    for url in find_assets(raw_html):
+        absolute = resolve_url(url, base_url)
+        if (asset := assets.get(absolute)) is not None:
+            found[absolute] = asset
+    return found
+
+
+def merge_pdfs(results: list[tuple[bytes, list[Bookmark]]], target: str | BinaryIO) -> int:
+    """Write the PDFs of the groups one after the other, with a single outline built from the bookmarks
+    of all of them, so a heading can be nested under a heading of a previous group. Return the number of pages."""
+    from pypdf import PdfReader, PdfWriter
+    from pypdf.generic import Fit
+
+    writer = PdfWriter()
+    bookmarks: list[Bookmark] = []
+    for pdf, group_bookmarks in results:
+        offset = len(writer.pages)
+        writer.append(PdfReader(io.BytesIO(pdf)), import_outline=False)
+        for page_number, level, label, top, is_open in group_bookmarks:
+            bookmarks.append((offset + page_number, level, label, top, is_open))
+
+    # The open outline items by level, as WeasyPrint nests a heading under the previous one of a lower level
+    parents: list[tuple[int, "IndirectObject"]] = []
+    for page_number, level, label, top, is_open in bookmarks:
+        while parents and parents[-1][0] >= level:
+            parents.pop()
+        parent = parents[-1][1] if parents else None
+        item = writer.add_outline_item(label, page_number, parent=parent, fit=Fit.xyz(top=top), is_open=is_open)
+        parents.append((level, item))
+
+    writer.write(target)
+    return len(writer.pages)
@@ -0,0 +1,340 @@
+import io
+import json
+import math
+import os
+import socketserver
+import stat
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.util import Finalize
+from typing import Any, Iterable, Iterator
+from urllib.parse import parse_qs, urlsplit
+
+from src.core.color import Color, colour
+from src.core.constants import Constants
+from src.core.models import ErrorHandler, PdfCfg
+from src.core.utils import print_dbg
+from src.markdown.cache import open_cache
+from src.markdown.processor import MarkdownProcessor
+from src.pdf.converter import PdfConverter
+
+# Header of a PDF converted with errors, with the errors as a JSON list
+ERRORS_HEADER = "X-Conversion-Errors"
+
+# Document converted by each worker when it starts, so the first job does not pay for the imports
+WARM_UP_DOCUMENT = "# md-mermaid-pdf\n\nReady.\n"
+
+
+@dataclass
+class JobResult:
+    """The PDF of a document, empty if the conversion failed, and its errors.
+    A document with errors in its diagrams or images still has its PDF, with placeholders."""
+
+    pdf: bytes = b""
+    errors: list[str] = field(default_factory=list)
+
+
+# region Worker
+
+_worker: PdfConverter | None = None
+
+
+class _DeadlineError(Exception):
+    """The job passed its deadline, and its worker stops it at the next section."""
+
+
+def _init_worker(cfg: PdfCfg) -> None:
+    global _worker
+    _worker = PdfConverter(cfg, MarkdownProcessor(cfg))
+    # The worker exits when the pool shuts down, its processor is closed then
+    Finalize(None, _close_worker, args=(_worker.processor,), exitpriority=0)
+
+
+def _close_worker(processor: MarkdownProcessor) -> None:
+    """Close the processor of the worker, and its store without evicting it, as the service evicts the cache
+    once when all the workers have finished."""
+    cache, processor.cache = processor.cache, None
+    processor.close()
+    if cache:
+        cache.store.close()
+
+
+def _convert_in_worker(markdown_content: str, deadline: float | None = None) -> JobResult:
+    """Convert a document in memory, returning its errors instead of exiting.
+    A job with a deadline, in seconds since the epoch, renders its diagrams at most until then and
+    stops at the next section after it, so its worker is free for the next job."""
+    assert _worker is not None
+    result = JobResult()
+    render_deadline = _worker.cfg.render_deadline
+    with ErrorHandler.collect() as errors:
+        try:
+            if deadline is not None:
+                _check_deadline(deadline)
+                _worker.cfg.render_deadline = min(render_deadline, deadline - time.time())
+            output = io.BytesIO()
+            svgs, sections = _worker.processor.process_sections(markdown_content)
+            _worker.write_pdf(_until_deadline(deadline, sections), svgs, output)
+            result.pdf = output.getvalue()
+        except _DeadlineError:
+            ErrorHandler.add_error("Error converting the document: it took longer than the timeout of the job")
+        except Exception as e:
+            ErrorHandler.add_error(f"Error converting the document: {type(e).__name__}: {e}")
+        finally:
+            _worker.cfg.render_deadline = render_deadline
+    result.errors = errors
+    return result
+
+
+def _until_deadline(deadline: float | None, sections: Iterable[str]) -> Iterator[str]:
+    for section in sections:
+        _check_deadline(deadline)
+        yield section
+
+
+def _check_deadline(deadline: float | None) -> None:
+    if deadline is not None and time.time() >= deadline:
+        raise _DeadlineError()
+
+
+# region ConversionService
+
+
+class ConversionService:
+    """Convert documents in a pool of processes that are kept running between jobs, each one with its
+    processor, HTTP pool, diagram cache, fonts and stylesheet, as the batch workers.
+    At most workers + queue_size jobs are accepted at once, the rest are rejected until a job ends.
+    A job that times out is not waited for any more, and its worker stops it at its next diagram or section,
+    or before starting it if it waited in the queue until then."""
+
+    def __init__(
+        self,
+        cfg: PdfCfg,
+        workers: int = 1,
+        queue_size: int = Constants.SERVE_QUEUE_SIZE,
+        job_timeout: float = Constants.SERVE_JOB_TIMEOUT,
+    ) -> None:
+        self.cfg = cfg
+        self.workers = workers
+        self.queue_size = queue_size
+        self.job_timeout = job_timeout
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cfg,))
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.started = time.time()
+        self.counters = {"accepted": 0, "completed": 0, "degraded": 0, "failed": 0, "rejected": 0, "timed_out": 0}
+        self.busy_seconds = 0.0
+
+    def warm_up(self) -> None:
+        """Start every worker and convert a small document in each one."""
+        futures = [self.executor.submit(_convert_in_worker, WARM_UP_DOCUMENT) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def submit(self, markdown_content: str, timeout: float | None = None) -> "Future[JobResult] | None":
+        """Queue the conversion of the document, to end within the timeout of the job or the given one
+        if it is shorter, or return None if the queue is full."""
+        if not self.slots.acquire(blocking=False):
+            self._count("rejected")
+            return None
+        with self.lock:
+            self.pending += 1
+            self.counters["accepted"] += 1
+        start = time.perf_counter()
+        deadline = time.time() + self.timeout(timeout)
+        try:
+            future = self.executor.submit(_convert_in_worker, markdown_content, deadline)
+        except Exception:
+            self._release(0.0)
+            raise
+        future.add_done_callback(lambda _: self._release(time.perf_counter() - start))
+        return future
+
+    def convert(self, markdown_content: str, timeout: float | None = None) -> tuple[HTTPStatus, JobResult]:
+        """Convert the document, waiting at most the timeout of the job, and return the HTTP status of the result.
+        A PDF converted with errors is returned with 200 and its errors, only a job without a PDF fails."""
+        future = self.submit(markdown_content, timeout)
+        if future is None:
+            return HTTPStatus.SERVICE_UNAVAILABLE, JobResult(errors=["The queue of jobs is full"])
+        timeout = self.timeout(timeout)
+        try:
+            result = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self._count("timed_out")
+            return HTTPStatus.GATEWAY_TIMEOUT, JobResult(errors=[f"The conversion took more than {timeout:g}s"])
+        except Exception as e:
+            # A worker that dies, as killed for its memory, breaks the pool
+            result = JobResult(errors=[f"Error converting the document: {type(e).__name__}: {e}"])
+        if not result.pdf:
+            self._count("failed")
+            return HTTPStatus.UNPROCESSABLE_ENTITY, result
+        self._count("degraded" if result.errors else "completed")
+        return HTTPStatus.OK, result
+
+    def timeout(self, timeout: float | None = None) -> float:
+        """Return the timeout of a job, the given one if it is shorter than the timeout of the service."""
+        return min(timeout or self.job_timeout, self.job_timeout)
+
+    def health(self) -> dict[str, Any]:
+        """Return the state of the service and the counters of jobs since it started."""
+        with self.lock:
+            return {
+                "status": "ok",
+                "uptime": round(time.time() - self.started, 3),
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "pending": self.pending,
+                "jobs": dict(self.counters),
+                "busy_seconds": round(self.busy_seconds, 3),
+            }
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        # The workers share the cache, it is evicted once when all of them have finished
+        if cache := open_cache(self.cfg.cache_dir):
+            cache.close()
+
+    def _count(self, counter: str) -> None:
+        with self.lock:
+            self.counters[counter] += 1
+
+    def _release(self, seconds: float) -> None:
+        with self.lock:
+            self.pending -= 1
+            self.busy_seconds += seconds
+        self.slots.release()
+
+
+# region HTTP
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    """HTTP API of the service: POST /convert with the Markdown as the body returns the PDF, with the errors
+    of the conversion in the X-Conversion-Errors header, and an optional timeout query parameter shortens
+    the timeout of the job. GET /health returns the metrics."""
+
+    server: "ThreadingHTTPServer | UnixHTTPServer"
+
+    @property
+    def service(self) -> ConversionService:
+        return getattr(self.server, "service")
+
+    def do_GET(self) -> None:  # noqa: N802
+        if urlsplit(self.path).path != "/health":
+            self._send_json(HTTPStatus.NOT_FOUND, {"errors": [f"Not found: {self.path}"]})
+            return
+        self._send_json(HTTPStatus.OK, self.service.health())
+
+    def do_POST(self) -> None:  # noqa: N802
+        url = urlsplit(self.path)
+        if url.path != "/convert":
+            self._send_json(HTTPStatus.NOT_FOUND, {"errors": [f"Not found: {self.path}"]})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+            timeout = float(parse_qs(url.query).get("timeout", ["0"])[0])
+        except ValueError as e:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"errors": [f"Invalid request: {e}"]})
+            return
+        if length < 0:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"errors": [f"Invalid request: Content-Length {length}"]})
+            return
+        if timeout < 0 or not math.isfinite(timeout):
+            self._send_json(HTTPStatus.BAD_REQUEST, {"errors": [f"Invalid request: timeout {timeout}"]})
+            return
+        if length > Constants.SERVE_MAX_BYTES:
+            errors = [f"The document exceeds {Constants.SERVE_MAX_BYTES} bytes"]
+            self._send_json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"errors": errors})
+            return
+        try:
+            markdown_content = self.rfile.read(length).decode("utf-8")
+        except UnicodeDecodeError as e:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"errors": [f"The document is not UTF-8: {e}"]})
+            return
+        if not markdown_content.strip():
+            self._send_json(HTTPStatus.BAD_REQUEST, {"errors": ["The document is empty"]})
+            return
+
+        status, result = self.service.convert(markdown_content, timeout)
+        if status != HTTPStatus.OK:
+            headers = {"Retry-After": "1"} if status == HTTPStatus.SERVICE_UNAVAILABLE else {}
+            self._send_json(status, {"errors": result.errors}, headers)
+            return
+        headers = {ERRORS_HEADER: json.dumps(result.errors)} if result.errors else {}
+        self._send(status, result.pdf, "application/pdf", headers)
+
+    def address_string(self) -> str:
+        # The address of a client of a Unix socket is an empty string
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.service.cfg.is_debug:
+            print_dbg(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, status: HTTPStatus, body: dict[str, Any], headers: dict[str, str] | None = None) -> None:
+        self._send(status, json.dumps(body).encode("utf-8"), "application/json", headers)
+
+    def _send(self, status: HTTPStatus, body: bytes, content_type: str, headers: dict[str, str] | None = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP server on a Unix socket, each request in its own thread."""
+
+    daemon_threads = True
+
+
+def make_server(
+    service: ConversionService, host: str = Constants.SERVE_HOST, port: int = 0, socket_path: str | None = None
+) -> "ThreadingHTTPServer | UnixHTTPServer":
+    """Return the HTTP server of the service, on the Unix socket if it is given, or else on the host and port.
+    A socket left at the path by a previous server is replaced, any other file raises FileExistsError."""
+    server: ThreadingHTTPServer | UnixHTTPServer
+    if socket_path:
+        if os.path.lexists(socket_path):
+            if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+                raise FileExistsError(f"{socket_path} exists and is not a socket")
+            os.unlink(socket_path)
+        server = UnixHTTPServer(socket_path, ConversionHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ConversionHandler)
+    setattr(server, "service", service)
+    return server
+
+
+def serve_forever(
+    cfg: PdfCfg,
+    host: str,
+    port: int,
+    socket_path: str | None,
+    workers: int,
+    queue_size: int,
+    job_timeout: float,
+) -> None:
+    """Start the service and its workers, and serve until interrupted."""
+    service = ConversionService(cfg, workers, queue_size, job_timeout)
+    server = make_server(service, host, port, socket_path)
+    try:
+        print_dbg(f"Starting {workers} workers...")
+        service.warm_up()
+        address = socket_path or f"http://{host}:{getattr(server, 'server_port')}"
+        print(colour(Color.GREEN, f"Serving on {address}, POST /convert and GET /health"))
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print_dbg("Stopped")
+    finally:
+        server.server_close()
+        service.close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
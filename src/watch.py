@@ -0,0 +1,84 @@
+import os
+import time
+
+from src.core.color import Color, colour
+from src.core.constants import Constants
+from src.core.models import ErrorHandler, PdfCfg
+from src.core.utils import print_error
+from src.markdown.processor import MarkdownProcessor
+from src.pdf.converter import PdfConverter
+
+# region Watcher
+
+
+class Watcher:
+    """Rebuild the PDF each time the Markdown or the CSS file changes.
+    The processor is kept between builds, so only the diagrams that are new or were edited are rendered
+    again, and only the sections that changed are converted to HTML again."""
+
+    def __init__(self, cfg: PdfCfg, interval: float = Constants.WATCH_INTERVAL) -> None:
+        self.cfg = cfg
+        self.interval = interval
+        self.processor = MarkdownProcessor(cfg, incremental=True)
+        self.converter = PdfConverter(cfg, self.processor)
+        self.last: tuple[tuple[int, int] | None, ...] | None = None
+
+    def files(self) -> list[str]:
+        return [path for path in (self.cfg.md_path, self.cfg.css_path) if path]
+
+    def snapshot(self) -> tuple[tuple[int, int] | None, ...]:
+        """Return the modification time and size of the watched files, None for a missing file."""
+        stamps: list[tuple[int, int] | None] = []
+        for path in self.files():
+            try:
+                stat = os.stat(path)
+                stamps.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def changed(self) -> bool:
+        """Check if any watched file changed since the last check.
+        A missing file, as while an editor replaces it, is not a change until it is written again."""
+        snapshot = self.snapshot()
+        if snapshot == self.last or None in snapshot:
+            return False
+        self.last = snapshot
+        return True
+
+    def build(self) -> list[str]:
+        """Convert the document and return its errors instead of exiting."""
+        start = time.perf_counter()
+        with ErrorHandler.collect() as errors:
+            try:
+                # Read as a whole instead of mapped, as an editor may truncate the file while it is converted
+                with open(self.cfg.md_path) as f:
+                    markdown_content = f.read()
+                self.converter.convert_to_pdf(markdown_content)
+            except Exception as e:
+                ErrorHandler.add_error(f"Error converting {self.cfg.md_path}: {type(e).__name__}: {e}")
+
+        seconds = time.perf_counter() - start
+        for error in errors:
+            print_error(error)
+        if not errors:
+            reused = self.processor.reused
+            msg = f"Built {self.cfg.pdf_path} in {seconds:.1f}s ({reused} diagrams reused)"
+            print(colour(Color.GREEN, msg))
+        return errors
+
+    def run(self, max_builds: int | None = None) -> None:
+        """Poll the files and build the PDF on each change, until interrupted or after max_builds builds."""
+        builds = 0
+        print(colour(Color.CYAN, f"Watching {', '.join(self.files())}, press Ctrl+C to stop."))
+        try:
+            while max_builds is None or builds < max_builds:
+                if self.changed():
+                    self.build()
+                    builds += 1
+                else:
+                    time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.processor.close()
@@ -2,7 +2,6 @@ import unittest
 from typing import Any
 from unittest.mock import patch
 
-from src.core.constants import Constants
 from src.core.models import ErrorHandler, PdfCfg, PdfOptions
 
 
@@ -37,7 +36,6 @@ class TestPdfCfg(unittest.TestCase):
         self.assertEqual(cfg.pdf_path, "output.pdf")
         self.assertEqual(cfg.css_path, "style.css")
         self.assertEqual(cfg.base_url, "http://example.com")
-        self.assertEqual(cfg.tmp_md_path, f"{Constants.SCRIPT_PATH}/output/output_temp.md")
         self.assertTrue(cfg.is_debug)
 
 
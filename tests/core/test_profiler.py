@@ -0,0 +1,68 @@
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from src.core.profiler import Profiler
+
+
+class TestProfiler(unittest.TestCase):
+    def tearDown(self) -> None:
+        Profiler.disable()
+        Profiler.spans = []
+
+    def test_disabled_records_nothing(self) -> None:
+        """Comprova que amb el profiler desactivat els spans són el mateix objecte buit i no es registra res."""
+        with Profiler.span("scan") as span:
+            span.set(bytes=10)
+        self.assertIs(Profiler.span("wrap"), span)
+        self.assertEqual(Profiler.spans, [])
+
+    def test_report(self) -> None:
+        """Comprova que el report suma el temps per etapa i llista cada petició amb la seva latència i mida."""
+        Profiler.enable()
+        for _ in range(2):
+            with Profiler.span("wrap"):
+                pass
+        with Profiler.span("request", "network", attempt=0) as span:
+            span.set(status=200, bytes=42)
+
+        report = Profiler.report()
+        self.assertEqual(report["stages"]["wrap"]["count"], 2)
+        self.assertEqual(set(report["stages"]), {"wrap"})
+        self.assertEqual(len(report["requests"]), 1)
+        self.assertEqual(
+            {k: v for k, v in report["requests"][0].items() if k != "latency"},
+            {"attempt": 0, "status": 200, "bytes": 42},
+        )
+        self.assertEqual(report["diagrams"], [])
+
+    def test_write_trace(self) -> None:
+        """Comprova que s'escriu el report i una traça amb esdeveniments complets de cada fil."""
+
+        def render_diagram() -> None:
+            with Profiler.span("diagram", "diagram"):
+                pass
+
+        Profiler.enable()
+        with Profiler.span("render"):
+            thread = threading.Thread(target=render_diagram)
+            thread.start()
+            thread.join()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            trace_path = Profiler.write(str(Path(tmp) / "profile" / "report.json"))
+            report = json.loads((Path(tmp) / "profile" / "report.json").read_text())
+            trace = json.loads(Path(trace_path).read_text())
+
+        self.assertTrue(trace_path.endswith("report.trace.json"))
+        self.assertIn("render", report["stages"])
+        events = trace["traceEvents"]
+        self.assertEqual([event["name"] for event in events], ["diagram", "render"])
+        self.assertTrue(all(event["ph"] == "X" and event["dur"] >= 0 for event in events))
+        self.assertNotEqual(events[0]["tid"], events[1]["tid"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Stand-in of mermaid-cli for the tests, with the options used by MmdcRenderBackend.
+It writes an SVG with the code of each Mermaid block of the input Markdown, numbered from 1 next to the output,
+and fails as mmdc does for a block that contains "syntax error". The number of blocks of each run is appended
+to the file of the FAKE_MMDC_LOG environment variable, and every run fails with the message of the FAKE_MMDC_FAIL
+environment variable, as when the browser can not be launched."""
+
+import argparse
+import html
+import os
+import re
+import sys
+from pathlib import Path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", dest="input", required=True)
+    parser.add_argument("-o", dest="output", required=True)
+    parser.add_argument("-e", dest="format", default="svg")
+    args = parser.parse_args()
+
+    blocks = re.findall(r"```mermaid\n(.*?)\n```", Path(args.input).read_text(encoding="utf-8"), re.DOTALL)
+    if log := os.environ.get("FAKE_MMDC_LOG"):
+        with open(log, "a") as f:
+            f.write(f"{len(blocks)}\n")
+    if failure := os.environ.get("FAKE_MMDC_FAIL"):
+        sys.exit(failure)
+    output = Path(args.output)
+    for i, code in enumerate(blocks, 1):
+        if "syntax error" in code:
+            sys.exit(f"Error: Parse error on line 1 of block {i}:\n{code.strip()}")
+        svg = f'<svg xmlns="http://www.w3.org/2000/svg"><text>{html.escape(code.strip())}</text></svg>'
+        output.with_name(f"{output.stem}-{i}.{args.format}").write_text(svg, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
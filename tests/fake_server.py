@@ -0,0 +1,51 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+
+class FakeServer:
+    """Local HTTP server for the tests, as a stand-in of mermaid-ink or of a server of images.
+    Each request is answered with the next scripted response (status, body, headers), and the
+    last one is repeated when the script runs out. The requested paths are kept in order.
+    Each response can be delayed by a latency in seconds, as the one of a remote server.
+    """
+
+    def __init__(self, responses: list[tuple[int, bytes, dict[str, str]]] | None = None, latency: float = 0.0) -> None:
+        self.responses = responses or [(200, b"<svg></svg>", {})]
+        self.latency = latency
+        self.paths: list[str] = []
+        self.headers: list[dict[str, str]] = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:  # noqa: N802
+                with server.lock:
+                    server.paths.append(self.path)
+                    server.headers.append(dict(self.headers))
+                    index = min(len(server.paths), len(server.responses)) - 1
+                    status, body, headers = server.responses[index]
+                if server.latency:
+                    time.sleep(server.latency)
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:  # noqa: A002, ARG002
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self) -> "FakeServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,137 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from src.core.models import PdfCfg
+from src.markdown.assets import AssetFetcher, find_assets, resolve_url
+from src.markdown.cache import open_cache
+from src.markdown.processor import MarkdownProcessor
+from tests.fake_server import FakeServer
+
+PNG = b"\x89PNG\r\n\x1a\nimage"
+
+
+class TestFindAssets(unittest.TestCase):
+    def test_markdown_and_html_images(self) -> None:
+        """Comprova que es troben les imatges escrites en Markdown i en HTML, amb títol o sense."""
+        section = (
+            '![Logo](img/logo.png "The logo") and ![](<with space.png>)\n'
+            '<img class="wide" src="https://example.com/a.svg"> [a link](page.html)\n'
+        )
+        self.assertEqual(find_assets(section), ["img/logo.png", "with space.png", "https://example.com/a.svg"])
+
+    def test_images_in_code_are_skipped(self) -> None:
+        """Comprova que les imatges dins de blocs i fragments de codi no es prenen per imatges del document."""
+        section = (
+            "Use `![alt](inline.png)` to add ![Logo](logo.png)\n"
+            "```markdown\n![Example](fenced.png)\n```\n"
+            '~~~\n<img src="tilde.png">\n~~~\n'
+            "![After](after.png)\n"
+            "```\n![Unclosed](unclosed.png)\n"
+        )
+        self.assertEqual(find_assets(section), ["logo.png", "after.png"])
+
+    def test_resolve_url(self) -> None:
+        """Comprova que les URL relatives es resolen respecte al directori o al fitxer de base_url."""
+        with tempfile.TemporaryDirectory() as tmp:
+            base = Path(tmp).resolve()
+            self.assertEqual(resolve_url("img/a.png", tmp), (base / "img" / "a.png").as_uri())
+            self.assertEqual(resolve_url("a.png", str(base / "doc.md")), (base / "a.png").as_uri())
+        self.assertEqual(resolve_url("a.png", "https://example.com/docs/"), "https://example.com/docs/a.png")
+        self.assertEqual(resolve_url("data:image/png;base64,AA", "/tmp"), "data:image/png;base64,AA")
+
+
+class TestAssetFetcher(unittest.TestCase):
+    def test_revalidate_with_etag(self) -> None:
+        """Comprova que una imatge en la memòria cau es torna a demanar amb If-None-Match
+        i que amb un 304 se serveix sense tornar-la a descarregar, també en una altra execució."""
+        responses = [
+            (200, PNG, {"Content-Type": "image/png", "ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}),
+            (304, b"", {}),
+        ]
+        with tempfile.TemporaryDirectory() as tmp, FakeServer(responses) as server:
+            url = f"{server.url}/logo.png"
+            assets = AssetFetcher(open_cache(tmp))
+            assets.prefetch([url], "")
+            self.assertEqual(assets.get(url).body, PNG)  # type: ignore[union-attr]
+            self.assertEqual(assets.downloaded, 1)
+            assets.close()
+
+            assets = AssetFetcher(open_cache(tmp))
+            assets.prefetch([url, url], "")
+            asset = assets.get(url)
+            assets.close()
+
+        self.assertEqual(len(server.paths), 2)
+        self.assertNotIn("If-None-Match", server.headers[0])
+        self.assertEqual(server.headers[1]["If-None-Match"], '"v1"')
+        self.assertEqual(server.headers[1]["If-Modified-Since"], "Mon, 01 Jan 2024 00:00:00 GMT")
+        self.assertEqual((asset.body, asset.content_type), (PNG, "image/png"))  # type: ignore[union-attr]
+        self.assertEqual((assets.downloaded, assets.revalidated), (0, 1))
+
+    def test_failed_asset_is_left_to_weasyprint(self) -> None:
+        """Comprova que una imatge que no es pot obtenir no se serveix, i que les no demanades tampoc."""
+        with FakeServer([(404, b"", {})]) as server:
+            assets = AssetFetcher()
+            assets.prefetch([f"{server.url}/missing.png", "missing.png"], "/nonexistent")
+            self.assertIsNone(assets.get(f"{server.url}/missing.png"))
+            self.assertIsNone(assets.get("file:///nonexistent/missing.png"))
+            self.assertIsNone(assets.get(f"{server.url}/other.png"))
+            assets.close()
+
+    def test_memory_is_bounded(self) -> None:
+        """Comprova que en memòria només es guarden les imatges més recents fins a la mida màxima."""
+        responses = [(200, b"x" * 40, {"ETag": '"a"'})]
+        with FakeServer(responses) as server:
+            assets = AssetFetcher(jobs=1, max_bytes=100)
+            urls = [f"{server.url}/{i}.png" for i in range(4)]
+            assets.prefetch(urls, "")
+            for url in urls:
+                assets.get(url)
+            assets.close()
+        self.assertEqual(list(assets.memory), urls[2:])
+        self.assertEqual(assets.memory_bytes, 80)
+
+    def test_document_assets_are_bounded(self) -> None:
+        """Comprova que les imatges d'un document només es guarden fins a la mida màxima
+        i que les que no hi caben es deixen a WeasyPrint."""
+        with tempfile.TemporaryDirectory() as tmp:
+            urls = []
+            for i in range(3):
+                Path(tmp, f"{i}.png").write_bytes(b"x" * 40)
+                urls.append(Path(tmp, f"{i}.png").resolve().as_uri())
+            assets = AssetFetcher(jobs=1, max_bytes=100)
+            assets.prefetch(urls, "")
+            kept = [assets.get(url) is not None for url in urls]
+            assets.close()
+        self.assertEqual(kept, [True, True, False])
+        self.assertEqual(assets.kept_bytes, 80)
+
+
+class TestProcessorAssets(unittest.TestCase):
+    def test_assets_are_prefetched_with_the_diagrams(self) -> None:
+        """Comprova que el processador recull les imatges del document en la mateixa passada que els diagrames
+        i les obté per avançat."""
+        with tempfile.TemporaryDirectory() as tmp:
+            Path(tmp, "logo.png").write_bytes(PNG)
+            processor = MarkdownProcessor(PdfCfg("", "", "", tmp, debug=False))
+            processor.process_sections("# Title\n\n![Logo](logo.png)\n\n![Inline](data:image/png;base64,AA)\n")
+            self.assertEqual(processor.asset_urls, ["logo.png", "data:image/png;base64,AA"])
+            self.assertEqual(processor.assets.get(Path(tmp, "logo.png").resolve().as_uri()).body, PNG)  # type: ignore
+            self.assertEqual(list(processor.assets.futures), [Path(tmp, "logo.png").resolve().as_uri()])
+            processor.close()
+
+    def test_renderer_shares_the_cache(self) -> None:
+        """Comprova que el renderitzador fa servir la cache del processador i que només el processador la tanca."""
+        with tempfile.TemporaryDirectory() as tmp:
+            processor = MarkdownProcessor(PdfCfg("", "", "", tmp, debug=False, cache_dir=tmp))
+            cache = processor.cache
+            self.assertIs(processor.renderer.cache, cache)
+            with patch.object(cache, "close") as close:
+                processor.close()
+            close.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
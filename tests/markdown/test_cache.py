@@ -0,0 +1,117 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from src.core.constants import Constants
+from src.markdown.cache import DiagramCache, DirectoryStore, SqliteStore, open_cache
+
+
+class TestDiagramCache(unittest.TestCase):
+    def test_key_ignores_whitespace_changes(self) -> None:
+        """Comprova que la clau no canvia amb finals de línia ni espais sobrants."""
+        key = DiagramCache.key("graph TD;\nA-->B;", "https://mermaid.ink")
+        self.assertEqual(key, DiagramCache.key("\ngraph TD;  \r\nA-->B;\n", "https://mermaid.ink"))
+
+    def test_key_depends_on_settings(self) -> None:
+        """Comprova que la clau depèn del servidor i de la resta de paràmetres."""
+        key = DiagramCache.key("graph TD;\nA-->B;", "https://mermaid.ink")
+        self.assertNotEqual(key, DiagramCache.key("graph TD;\nA-->B;", "http://localhost:3000"))
+        self.assertNotEqual(key, DiagramCache.key("graph TD;\nA-->C;", "https://mermaid.ink"))
+
+    def test_open_cache(self) -> None:
+        """Comprova que open_cache tria el magatzem segons el camí."""
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertIsNone(open_cache(None))
+            dir_cache = open_cache(os.path.join(tmp, "diagrams"))
+            sqlite_cache = open_cache(os.path.join(tmp, "diagrams.sqlite"))
+            assert dir_cache is not None and sqlite_cache is not None
+            self.assertIsInstance(dir_cache.store, DirectoryStore)
+            self.assertIsInstance(sqlite_cache.store, SqliteStore)
+            dir_cache.close()
+            sqlite_cache.close()
+
+    def test_evicted_once_per_process(self) -> None:
+        """Comprova que una ubicació només s'esborra en tancar-la per primer cop en el procés
+        i que torna a tocar passat l'interval."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "diagrams")
+            with patch.object(DirectoryStore, "evict", return_value=0) as evict:
+                for _ in range(3):
+                    DiagramCache(DirectoryStore(path)).close()
+                self.assertEqual(evict.call_count, 1)
+
+                with patch("time.monotonic", return_value=time.monotonic() + Constants.CACHE_EVICT_INTERVAL):
+                    DiagramCache(DirectoryStore(path)).close()
+                self.assertEqual(evict.call_count, 2)
+
+
+class StoreTests(unittest.TestCase):
+    """Tests comuns per a tots els magatzems de la cache."""
+
+    def make_store(self, tmp: str) -> DirectoryStore | SqliteStore:
+        raise NotImplementedError
+
+    def set_accessed(self, store: DirectoryStore | SqliteStore, key: str, accessed: float) -> None:
+        raise NotImplementedError
+
+    def setUp(self) -> None:
+        if type(self) is StoreTests:
+            self.skipTest("Classe base sense magatzem")
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = self.make_store(self.tmp.name)
+
+    def tearDown(self) -> None:
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_get_put(self) -> None:
+        """Comprova que es recupera el contingut desat i que una clau desconeguda retorna None."""
+        self.assertIsNone(self.store.get("ab12"))
+        self.store.put("ab12", b"<svg></svg>")
+        self.assertEqual(self.store.get("ab12"), b"<svg></svg>")
+
+    def test_evict_by_size(self) -> None:
+        """Comprova que s'eliminen les entrades menys usades fins a cabre a la mida màxima."""
+        now = time.time()
+        for i, key in enumerate(["aa01", "bb02", "cc03"]):
+            self.store.put(key, b"x" * 10)
+            self.set_accessed(self.store, key, now - 100 + i)
+        removed = self.store.evict(max_bytes=20, max_age=3600)
+        self.assertEqual(removed, 1)
+        self.assertIsNone(self.store.get("aa01"))
+        self.assertIsNotNone(self.store.get("cc03"))
+
+    def test_evict_by_age(self) -> None:
+        """Comprova que s'eliminen les entrades que no s'han usat en max_age segons."""
+        self.store.put("aa01", b"old")
+        self.store.put("bb02", b"new")
+        self.set_accessed(self.store, "aa01", time.time() - 7200)
+        removed = self.store.evict(max_bytes=1024, max_age=3600)
+        self.assertEqual(removed, 1)
+        self.assertIsNone(self.store.get("aa01"))
+        self.assertEqual(self.store.get("bb02"), b"new")
+
+
+class TestDirectoryStore(StoreTests):
+    def make_store(self, tmp: str) -> DirectoryStore:
+        return DirectoryStore(os.path.join(tmp, "diagrams"))
+
+    def set_accessed(self, store: DirectoryStore | SqliteStore, key: str, accessed: float) -> None:
+        assert isinstance(store, DirectoryStore)
+        os.utime(store._file(key), (accessed, accessed))
+
+
+class TestSqliteStore(StoreTests):
+    def make_store(self, tmp: str) -> SqliteStore:
+        return SqliteStore(os.path.join(tmp, "diagrams.sqlite"))
+
+    def set_accessed(self, store: DirectoryStore | SqliteStore, key: str, accessed: float) -> None:
+        assert isinstance(store, SqliteStore)
+        with store.conn:
+            store.conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (accessed, key))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import markdown2
+
+from src.core.constants import Constants
+from src.core.models import PdfCfg
+from src.markdown.cache import open_cache
+from src.markdown.html_sections import HtmlSections, markdown_to_html
+from src.markdown.processor import MarkdownProcessor
+from src.pdf.converter import MARKDOWN_EXTRAS, PdfConverter
+
+LARGE = "## Section\n\n" + "Some *text* in a long paragraph. " * 100
+SMALL = "Short *text*"
+
+
+class TestHtmlSections(unittest.TestCase):
+    def test_large_sections_are_cached_on_disk(self) -> None:
+        """Comprova que l'HTML de les seccions grans es llegeix de la memòria cau en una altra execució,
+        i que les petites es tornen a convertir."""
+        with tempfile.TemporaryDirectory() as tmp:
+            html = HtmlSections(open_cache(tmp))
+            expected = [html.convert(LARGE), html.convert(SMALL, MARKDOWN_EXTRAS)]
+            html.close()
+
+            html = HtmlSections(open_cache(tmp))
+            with patch("markdown2.markdown", wraps=markdown2.markdown) as mock_markdown:
+                self.assertEqual([html.convert(LARGE), html.convert(SMALL, MARKDOWN_EXTRAS)], expected)
+            mock_markdown.assert_called_once_with(SMALL, extras=MARKDOWN_EXTRAS)
+            self.assertNotEqual(HtmlSections.key(LARGE), HtmlSections.key(LARGE, MARKDOWN_EXTRAS))
+            html.close()
+
+    def test_prefetch_in_a_pool(self) -> None:
+        """Comprova que amb diversos processos les seccions desconegudes es converteixen per avançat,
+        amb el mateix resultat i una sola vegada cadascuna."""
+        contents = [Constants.DIV_BREAK_AFTER.join([f"# Page {i}", f"Text *{i}*"]) for i in range(20)]
+        html = HtmlSections(jobs=2)
+        prefetched = []
+        for content in html.prefetch(contents, separator=Constants.DIV_BREAK_AFTER):
+            prefetched.append([html.convert(section) for section in content.split(Constants.DIV_BREAK_AFTER)])
+        html.close()
+
+        expected = [
+            [markdown_to_html(section) for section in content.split(Constants.DIV_BREAK_AFTER)] for content in contents
+        ]
+        self.assertEqual(prefetched, expected)
+        self.assertEqual(html.converted, 40)
+        self.assertEqual(html.prefetched, {})
+
+    def test_one_section_edit(self) -> None:
+        """Comprova que en editar una secció només es torna a convertir aquesta secció, en les dues passades."""
+        cfg = PdfCfg("", "", "", "", debug=False)
+        processor = MarkdownProcessor(cfg, incremental=True)
+        converter = PdfConverter(cfg, processor)
+        sections = [f"# Section {i}\n\nSome text." for i in range(10)]
+        _, pages = processor.process_sections(Constants.DIV_BREAK_AFTER.join(sections))
+        converter.to_html(pages)
+        self.assertEqual(processor.html.converted, 20)
+
+        sections[4] = "# Section 4\n\nSome *edited* text."
+        _, pages = processor.process_sections(Constants.DIV_BREAK_AFTER.join(sections))
+        self.assertIn("<em>edited</em>", converter.to_html(pages))
+        self.assertEqual(processor.html.converted, 2)
+        processor.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
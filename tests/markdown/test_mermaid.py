@@ -1,36 +1,148 @@
+import base64
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
+import zlib
 from typing import Any
-from unittest.mock import MagicMock, patch
+from unittest.mock import patch
 
-from src.core.models import PdfCfg
-from src.markdown.mermaid import MermaidRenderer, MermaidWrapper
+from src.core.constants import Constants
+from src.core.models import ErrorHandler, PdfCfg
+from src.markdown.mermaid import (
+    PLACEHOLDER_SVG,
+    CircuitBreaker,
+    DiagramChunk,
+    HttpRenderBackend,
+    MermaidRenderer,
+    MermaidWrapper,
+    MmdcRenderBackend,
+    RenderBackend,
+    RenderResult,
+)
+from tests.fake_server import FakeServer
+
+
+class StaticBackend(RenderBackend):
+    def __init__(self, result: RenderResult) -> None:
+        self.result = result
+        self.codes: list[str] = []
+
+    def render_svg(self, code: str) -> RenderResult:
+        self.codes.append(code)
+        return self.result
+
+    def identity(self) -> str:
+        return "static"
+
+
+class SlowBackend(StaticBackend):
+    def __init__(self, result: RenderResult, delay: float) -> None:
+        super().__init__(result)
+        self.delay = delay
+
+    def render_svg(self, code: str) -> RenderResult:
+        time.sleep(self.delay)
+        return super().render_svg(code)
+
+
+def render_svgs(renderer: MermaidRenderer, chunks: list[DiagramChunk], jobs: int | None = None) -> list[str]:
+    """Render the code of each chunk as a diagram of its own and return the SVGs in the same order."""
+    diagrams = [(chunk.image_number, chunk.code, chunk.endpoint) for chunk in chunks]
+    return [svg for diagram in renderer.render_diagrams(diagrams, jobs) for _, svg in diagram]
 
 
 class TestMermaidWrapper(unittest.TestCase):
-    @patch("src.markdown.mermaid.Mermaid")
     @patch("src.core.models.ErrorHandler.add_error")
-    def test_render_to_svg_success(self, mock_add_error: Any, mock_mermaid: Any) -> None:
+    def test_render_to_svg_success(self, mock_add_error: Any) -> None:
         """Comprova que render_to_svg funciona correctament quan la resposta és 200."""
-        mock_mermaid_instance = mock_mermaid.return_value
-        mock_mermaid_instance.svg_response = MagicMock(status_code=200)
+        backend = StaticBackend(RenderResult(200, "<svg></svg>", "OK"))
+        wrapper = MermaidWrapper("graph TD; A-->B;", is_debug=False, backend=backend)
+        svg = wrapper.render_to_svg("http://example.com")
 
-        wrapper = MermaidWrapper("graph TD; A-->B;", is_debug=False)
-        svg_path = wrapper.render_to_svg("test.svg", "http://example.com")
-
-        mock_mermaid_instance.to_svg.assert_called_once_with("test.svg")
-        self.assertEqual(svg_path, "test.svg")
+        self.assertEqual(svg, "<svg></svg>")
+        self.assertEqual(backend.codes, ["graph TD; A-->B;"])
+        self.assertEqual(wrapper.svg, "<svg></svg>")
+        self.assertEqual(wrapper.errors, [])
         mock_add_error.assert_not_called()
 
-    @patch("src.markdown.mermaid.Mermaid")
-    def test_render_to_svg_error(self, mock_mermaid: Any) -> None:
+    def test_render_to_svg_error(self) -> None:
         """Comprova que render_to_svg afegeix errors quan la resposta no és 200."""
-        mock_mermaid_instance = mock_mermaid.return_value
-        mock_mermaid_instance.svg_response = MagicMock(status_code=404, reason="Not Found", text="Error text")
-        mock_mermaid_instance.to_svg.assert_not_called()
+        backend = StaticBackend(RenderResult(404, "Error text", "Not Found"))
+        wrapper = MermaidWrapper("graph TD; A-->B;", is_debug=False, backend=backend)
+        svg = wrapper.render_to_svg("http://example.com")
+        self.assertEqual(svg, "Error text")
+        self.assertIsNone(wrapper.svg)
+        self.assertEqual(len(wrapper.errors), 1)
+        self.assertIn("404 Not Found", wrapper.errors[0])
+
+    def test_render_to_svg_no_response(self) -> None:
+        """Comprova que render_to_svg afegeix un error quan el servidor no respon."""
+        backend = StaticBackend(RenderResult(0, "", "No response from http://localhost"))
+        wrapper = MermaidWrapper("graph TD; A-->B;", is_debug=False, backend=backend)
+        wrapper.render_to_svg("E1")
+        self.assertEqual(wrapper.errors, ["Error for E1: No response from http://localhost"])
 
-        wrapper = MermaidWrapper("graph TD; A-->B;", is_debug=False)
-        svg_path = wrapper.render_to_svg("test.svg", "http://example.com")
-        self.assertEqual(svg_path, "test.svg")
+
+class TestHttpRenderBackend(unittest.TestCase):
+    def test_render_svg(self) -> None:
+        """Comprova que el diagrama s'envia codificat en base64 al servidor configurat."""
+        with FakeServer([(200, b"<svg>ok</svg>", {})]) as server:
+            backend = HttpRenderBackend(server.url + "/", retries=0)
+            result = backend.render_svg("graph TD; A-->B;")
+            backend.close()
+        self.assertEqual((result.status_code, result.text), (200, "<svg>ok</svg>"))
+        self.assertEqual(server.paths, ["/svg/" + HttpRenderBackend.encode("graph TD; A-->B;")])
+        self.assertEqual(backend.identity(), server.url)
+
+    def test_encode_pako(self) -> None:
+        """Comprova que el codi es codifica comprimit en el format pako que accepta mermaid-ink."""
+        code = "graph TD;\n" + "\n".join(f"A{i}-->B{i};" for i in range(100))
+        encoded = HttpRenderBackend.encode(code)
+        self.assertTrue(encoded.startswith("pako:"))
+        data = base64.urlsafe_b64decode(encoded[5:] + "=" * (-len(encoded[5:]) % 4))
+        self.assertEqual(json.loads(zlib.decompress(data))["code"], code)
+        self.assertLess(HttpRenderBackend(retries=0).payload_size(code), len(code))
+
+    def test_retries_on_server_errors(self) -> None:
+        """Comprova que es reintenta amb 503 i 429, respectant Retry-After, fins a obtenir resposta."""
+        responses = [(503, b"busy", {}), (429, b"slow down", {"Retry-After": "0"}), (200, b"<svg></svg>", {})]
+        with FakeServer(responses) as server:
+            backend = HttpRenderBackend(server.url, retries=3, backoff=0.01)
+            result = backend.render_svg("graph TD; A-->B;")
+            backend.close()
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(len(server.paths), 3)
+
+    def test_no_retry_on_client_errors(self) -> None:
+        """Comprova que un 404 no es reintenta."""
+        with FakeServer([(404, b"bad diagram", {})]) as server:
+            backend = HttpRenderBackend(server.url, retries=3, backoff=0.01)
+            result = backend.render_svg("graph TD; A-->B;")
+            backend.close()
+        self.assertEqual((result.status_code, result.text), (404, "bad diagram"))
+        self.assertEqual(len(server.paths), 1)
+
+    def test_gives_up_after_retries(self) -> None:
+        """Comprova que es retorna l'últim error quan s'esgoten els reintents."""
+        with FakeServer([(500, b"boom", {})]) as server:
+            backend = HttpRenderBackend(server.url, retries=2, backoff=0.01)
+            result = backend.render_svg("graph TD; A-->B;")
+            backend.close()
+        self.assertEqual(result.status_code, 500)
+        self.assertEqual(len(server.paths), 3)
+
+    def test_connection_error(self) -> None:
+        """Comprova que un servidor inaccessible retorna l'estat 0 en lloc d'una excepció."""
+        with FakeServer() as server:
+            url = server.url
+        backend = HttpRenderBackend(url, connect_timeout=0.5, retries=1, backoff=0.01)
+        result = backend.render_svg("graph TD; A-->B;")
+        backend.close()
+        self.assertEqual(result.status_code, 0)
+        self.assertIn("No response", result.reason)
 
 
 class TestMermaidRenderer(unittest.TestCase):
@@ -38,32 +150,448 @@ class TestMermaidRenderer(unittest.TestCase):
     def test_render_single_chunk(self, mock_mermaid_wrapper: Any) -> None:
         """Comprova que render funciona correctament amb un únic chunk."""
         mock_wrapper_instance = mock_mermaid_wrapper.return_value
-        mock_wrapper_instance.render_to_svg.return_value = "diagram_0.svg"
+        mock_wrapper_instance.render_to_svg.return_value = "<svg>0</svg>"
+        mock_wrapper_instance.response = RenderResult(200, "<svg>0</svg>")
 
         cfg = PdfCfg("test.md", "output.pdf", "style.css", "http://example.com", debug=False)
         renderer = MermaidRenderer(cfg)
 
-        svg_files, heights = renderer.render(0, "graph TD; A-->B;", "http://example.com", "endpoint")
-        self.assertEqual(svg_files, ["diagram_0.svg"])
+        svgs, heights = renderer.render(0, "graph TD; A-->B;", "endpoint")
+        self.assertEqual(svgs, ["<svg>0</svg>"])
         self.assertEqual(heights, [-126])
         self.assertEqual(mock_wrapper_instance.render_to_svg.call_count, 1)
-        mock_wrapper_instance.render_to_svg.assert_called_once_with("http://example.com/diagram_0.svg", "endpoint")
+        mock_wrapper_instance.render_to_svg.assert_called_once_with("endpoint")
+        self.assertEqual(renderer.split(0, "graph TD; A-->B;", "endpoint")[0].uri, "mermaid://diagrams/diagram_0.svg")
+
+    def test_render_multiple_chunks(self) -> None:
+        """Comprova que render divideix el codi en chunks que caben en el pressupost, repetint la capçalera."""
+        backend = StaticBackend(RenderResult(200, "<svg></svg>"))
+        cfg = PdfCfg("test.md", "output.pdf", "style.css", "http://example.com", debug=False, payload_budget=300)
+        renderer = MermaidRenderer(cfg, backend)
+
+        header = "sequenceDiagram\nparticipant A\nparticipant B"
+        code = header + "\n" + "\n".join(f"A->>B: message {i:02}" for i in range(30))  # 17 bytes per line
+        svgs, heights = renderer.render(0, code, "endpoint")
+        chunks = renderer.split(0, code, "endpoint")
+
+        self.assertEqual(len(svgs), 3)
+        self.assertEqual(backend.codes, [chunk.code for chunk in chunks])
+        self.assertEqual([chunk.uri for chunk in chunks], [f"mermaid://diagrams/diagram_0_{i}.svg" for i in range(3)])
+        self.assertTrue(all(len(chunk.code) <= 300 for chunk in chunks))
+        self.assertTrue(all(chunk.code.startswith(header) for chunk in chunks))
+        self.assertEqual(
+            "\n".join(chunk.code.removeprefix(header + "\n") for chunk in chunks[1:]), code[len(chunks[0].code) + 1 :]
+        )
+        self.assertEqual(heights, [chunk.height for chunk in chunks])
+
+    def test_split_fits_in_budget(self) -> None:
+        """Comprova que un diagrama que cap en el pressupost no es divideix, encara que tingui més de 50 línies."""
+        cfg = PdfCfg("test.md", "output.pdf", "style.css", "http://example.com", debug=False)
+        renderer = MermaidRenderer(cfg)
+        code = "graph TD;\n" + "\n".join(f"A{i}-->B{i};" for i in range(120))
+
+        chunks = renderer.split(0, code, "endpoint")
+        self.assertEqual([chunk.code for chunk in chunks], [code])
+        self.assertEqual(chunks[0].uri, "mermaid://diagrams/diagram_0.svg")
+
+    def test_render_diagrams_splits_rejected_diagrams(self) -> None:
+        """Comprova que un diagrama rebutjat per massa gran es torna a dividir sense reportar l'error."""
+        ErrorHandler.errors = []
+
+        class LimitedBackend(StaticBackend):
+            def render_svg(self, code: str) -> RenderResult:
+                self.codes.append(code)
+                if len(code) > 200:
+                    return RenderResult(414, "", "URI Too Long")
+                return RenderResult(200, f"<svg>{len(self.codes)}</svg>")
+
+        backend = LimitedBackend(RenderResult(200, ""))
+        cfg = PdfCfg("test.md", "output.pdf", "style.css", "img", debug=False, payload_budget=1000)
+        renderer = MermaidRenderer(cfg, backend)
+        code = "graph TD;\n" + "\n".join(f"A{i}-->B{i};" for i in range(40))
+        [small, large] = renderer.render_diagrams([(0, "graph TD; A-->B;", "E0"), (1, code, "E1")], jobs=1)
+
+        self.assertEqual(ErrorHandler.errors, [])
+        self.assertEqual(len(small), 1)
+        self.assertGreater(len(large), 1)
+        self.assertTrue(all(len(chunk.code) <= 200 for chunk, _ in large))
+        self.assertTrue(all(chunk.code.startswith("graph TD\n") for chunk, _ in large[1:]))
+        self.assertEqual("\n".join(chunk.code.removeprefix("graph TD\n") for chunk, _ in large), code)
+
+    def test_render_diagrams_reports_unsplittable_diagrams(self) -> None:
+        """Comprova que un diagrama massa gran que no es pot dividir més es reporta com a error."""
+        ErrorHandler.errors = []
+        backend = StaticBackend(RenderResult(413, "", "Payload Too Large"))
+        cfg = PdfCfg("test.md", "output.pdf", "style.css", "img", debug=False)
+        renderer = MermaidRenderer(cfg, backend)
+        renderer.render_diagrams([(0, "graph TD; A-->B;", "E0")])
+
+        self.assertEqual(len(backend.codes), 1)
+        self.assertEqual(ErrorHandler.errors, ["Error for E0: 413 Payload Too Large, the diagram is too large"])
+
+    def test_split_between_blocks(self) -> None:
+        """Comprova que un diagrama de seqüència es divideix només entre blocs, amb els participants a cada tros."""
+        backend = StaticBackend(RenderResult(200, "<svg></svg>"))
+        cfg = PdfCfg("test.md", "output.pdf", "style.css", "img", debug=False, payload_budget=300)
+        renderer = MermaidRenderer(cfg, backend)
+        blocks = [
+            f"loop Retry {i}\nA->>B: request {i}\nalt ok\nB-->>A: response {i}\nelse\nB-->>A: error\nend\nend"
+            for i in range(8)
+        ]
+        code = "sequenceDiagram\nparticipant A\nparticipant B\n" + "\n".join(blocks)
+
+        chunks = renderer.split(0, code, "endpoint")
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertTrue(chunk.code.startswith("sequenceDiagram\nparticipant A\nparticipant B\n"))
+            self.assertEqual(chunk.code.count("loop Retry"), chunk.code.count("end\nend"))
+            self.assertTrue(chunk.code.endswith("end\nend"))
+        self.assertEqual(renderer.invalid, {})
+
+    def test_split_keeps_the_directives(self) -> None:
+        """Comprova que una directiva de diverses línies es repeteix a cada tros i que mai es talla per dins."""
+        backend = StaticBackend(RenderResult(200, "<svg></svg>"))
+        cfg = PdfCfg("test.md", "output.pdf", "style.css", "img", debug=False, payload_budget=300)
+        renderer = MermaidRenderer(cfg, backend)
+        directive = "%%{init:\n{'theme': 'default',\n'sequence':{ 'mirrorActors': true}\n}}%%"
+        messages = "\n".join(f"A->>B: request {i}" for i in range(40))
+        code = f"sequenceDiagram\n{directive}\nparticipant A\nparticipant B\n{messages}"
+
+        chunks = renderer.split(0, code, "endpoint")
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(chunks[0].code.startswith(f"sequenceDiagram\n{directive}\nparticipant A\n"))
+        for chunk in chunks[1:]:
+            self.assertTrue(chunk.code.startswith(f"sequenceDiagram\n{directive}\nparticipant A\nparticipant B\n"))
+            self.assertEqual(chunk.code.count("%%{init"), 1)
+        bodies = [chunks[0].code] + [chunk.code.split("participant B\n", 1)[1] for chunk in chunks[1:]]
+        self.assertEqual("\n".join(bodies), code)
+
+    def test_invalid_diagram_is_not_sent(self) -> None:
+        """Comprova que un diagrama amb errors de sintaxi es reporta sense enviar-lo al servidor."""
+        ErrorHandler.errors = []
+        backend = StaticBackend(RenderResult(200, "<svg></svg>"))
+        cfg = PdfCfg("test.md", "output.pdf", "style.css", "img", debug=False)
+        renderer = MermaidRenderer(cfg, backend)
+        code = "sequenceDiagram\nA->>B: request\nalt ok\nB-->>A: response"
+        [[(_, svg)], [(_, valid)]] = renderer.render_diagrams([(0, code, "E0"), (1, "graph TD; A-->B;", "E1")], jobs=1)
+
+        self.assertEqual(svg, PLACEHOLDER_SVG)
+        self.assertEqual(valid, "<svg></svg>")
+        self.assertEqual(backend.codes, ["graph TD; A-->B;"])
+        self.assertEqual(ErrorHandler.errors, ["Error for E0: invalid diagram, line 3: alt is never closed"])
+        ErrorHandler.errors = []
 
     @patch("src.markdown.mermaid.MermaidWrapper")
-    def test_render_multiple_chunks(self, mock_mermaid_wrapper: Any) -> None:
-        """Comprova que render divideix el codi en múltiples chunks."""
+    def test_render_uses_cache(self, mock_mermaid_wrapper: Any) -> None:
+        """Comprova que un diagrama ja renderitzat es llegeix de la cache sense cridar el servidor."""
         mock_wrapper_instance = mock_mermaid_wrapper.return_value
-        mock_wrapper_instance.render_to_svg.side_effect = ["diagram_0.svg", "diagram_1.svg"]
+        mock_wrapper_instance.svg = "<svg>A-->B</svg>"
+        mock_wrapper_instance.response = RenderResult(200, "<svg>A-->B</svg>")
 
-        cfg = PdfCfg("test.md", "output.pdf", "style.css", "http://example.com", debug=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            cfg = PdfCfg("test.md", "output.pdf", "style.css", tmp, debug=False, cache_dir=f"{tmp}/cache")
+            renderer = MermaidRenderer(cfg)
+            renderer.render(0, "graph TD; A-->B;", "endpoint")
+            svgs, _ = renderer.render(0, "graph TD; A-->B;", "endpoint")
+            renderer.close()
+
+        self.assertEqual(mock_wrapper_instance.render_to_svg.call_count, 1)
+        self.assertEqual(svgs, ["<svg>A-->B</svg>"])
+
+
+class TestRenderChunks(unittest.TestCase):
+    def setUp(self) -> None:
+        ErrorHandler.errors = []
+        self.cfg = PdfCfg(
+            "test.md", "output.pdf", "style.css", "img", debug=False, jobs=4, render_timeout=1, render_retries=0
+        )
+        self.renderer = MermaidRenderer(self.cfg)
+        self.chunks = [
+            DiagramChunk(i, f"graph TD; A{i}-->B;", f"mermaid://diagrams/diagram_{i}.svg", f"E{i}", 100)
+            for i in range(6)
+        ]
+
+    def test_render_diagrams_keeps_order(self) -> None:
+        """Comprova que els resultats i els errors segueixen l'ordre del document encara que acabin desordenats."""
+        active = []
+        lock = threading.Lock()
+
+        def render(code: str, endpoint: str) -> tuple[str, list[str]]:
+            with lock:
+                active.append(threading.get_ident())
+            time.sleep(0.05 * (6 - int(endpoint[1:])))
+            return f"<svg>{code}</svg>", [f"Error for {endpoint}"]
+
+        with patch.object(self.renderer, "_render_mermaid", side_effect=render):
+            svgs = render_svgs(self.renderer, self.chunks)
+
+        self.assertEqual(svgs, [f"<svg>graph TD; A{i}-->B;</svg>" for i in range(6)])
+        self.assertEqual(ErrorHandler.errors, [f"Error for E{i}" for i in range(6)])
+        self.assertGreater(len(set(active)), 1)
+
+    def test_render_diagrams_timeout(self) -> None:
+        """Comprova que un diagrama que supera el timeout es reporta com a error sense aturar la resta."""
+        release = threading.Event()
+
+        def render(_code: str, endpoint: str) -> tuple[str, list[str]]:
+            if endpoint == "E2":
+                release.wait(5)
+            return "<svg></svg>", []
+
+        self.cfg.render_timeout = 0.2
+        with (
+            patch.object(Constants, "RENDER_MAX_BACKOFF", 0),
+            patch.object(self.renderer, "_render_mermaid", side_effect=render),
+        ):
+            svgs = render_svgs(self.renderer, self.chunks)
+        release.set()
+
+        self.assertEqual(svgs[1:3], ["<svg></svg>", ""])
+        self.assertEqual(ErrorHandler.errors, ["Error for E2: timeout after 0.2s"])
+
+    def test_render_diagrams_reuses_previous_document(self) -> None:
+        """Comprova que només es tornen a renderitzar els diagrames nous o modificats respecte l'anterior document."""
+        backend = StaticBackend(RenderResult(200, "<svg></svg>"))
+        renderer = MermaidRenderer(self.cfg, backend)
+        render_svgs(renderer, self.chunks[:3])
+        edited = DiagramChunk(1, "graph TD; A1-->C;", "mermaid://diagrams/diagram_1.svg", "E1", 100)
+        svgs = render_svgs(renderer, [self.chunks[0], edited, self.chunks[2], self.chunks[3]])
+
+        self.assertEqual(svgs, ["<svg></svg>"] * 4)
+        self.assertEqual(backend.codes[3:], ["graph TD; A1-->C;", "graph TD; A3-->B;"])
+        self.assertEqual(renderer.reused, 2)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_failures_in_a_row(self) -> None:
+        """Comprova que el circuit s'obre després de les fallades seguides i que un diagrama erroni no compta."""
+        breaker = CircuitBreaker(failures=2, cooldown=60)
+        breaker.record(RenderResult(503, "", "Service Unavailable"))
+        breaker.record(RenderResult(404, "", "Not Found"))
+        breaker.record(RenderResult(0, "", "Connection refused"))
+        self.assertTrue(breaker.allow())
+        breaker.record(RenderResult(0, "", "Connection refused"))
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allow())
+
+    def test_backend_failures_count(self) -> None:
+        """Comprova que compten les fallades de qualsevol backend, com un mmdc que no pot obrir el navegador
+        o un 401, i que un diagrama massa gran no compta."""
+        breaker = CircuitBreaker(failures=2, cooldown=60)
+        breaker.record(RenderResult(503, "Failed to launch the browser process", "mmdc failed"))
+        breaker.record(RenderResult(413, "", "Payload Too Large"))
+        self.assertFalse(breaker.is_open)
+        breaker.record(RenderResult(401, "", "Unauthorized"))
+        breaker.record(RenderResult(500, "", "mmdc did not write out-1.svg"))
+        self.assertTrue(breaker.is_open)
+
+    def test_half_open_after_cooldown(self) -> None:
+        """Comprova que passat el temps d'espera només es prova un diagrama, i que si va bé el circuit es tanca."""
+        breaker = CircuitBreaker(failures=1, cooldown=0)
+        breaker.record(RenderResult(0, "", "Connection refused"))
+        breaker.cooldown = 60
+        breaker.opened_at = time.monotonic() - 60
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record(RenderResult(200, "<svg></svg>"))
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow())
+
+
+class TestRenderFailures(unittest.TestCase):
+    def setUp(self) -> None:
+        ErrorHandler.errors = []
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cfg = PdfCfg("test.md", "output.pdf", "style.css", "img", debug=False, jobs=1, cache_dir=self.tmp.name)
+        self.chunks = [
+            DiagramChunk(i, f"graph TD; A{i}-->B;", f"mermaid://diagrams/diagram_{i}.svg", f"E{i}", 100)
+            for i in range(5)
+        ]
+
+    def tearDown(self) -> None:
+        ErrorHandler.errors = []
+        self.tmp.cleanup()
+
+    def test_breaker_skips_the_remaining_diagrams(self) -> None:
+        """Comprova que amb el servidor caigut només es proven els primers diagrames, i que la resta
+        es substitueixen per un marcador i es reporten amb un sol error."""
+        backend = StaticBackend(RenderResult(0, "", "Connection refused"))
+        renderer = MermaidRenderer(self.cfg, backend)
+        renderer.breaker = CircuitBreaker(failures=2)
+        svgs = render_svgs(renderer, self.chunks)
+
+        self.assertEqual(len(backend.codes), 2)
+        self.assertEqual(svgs[2:], [PLACEHOLDER_SVG] * 3)
+        self.assertEqual(
+            ErrorHandler.errors,
+            [
+                "Error for E0: Connection refused",
+                "Error for E1: Connection refused",
+                "Error: the Mermaid renderer failed 2 times in a row, "
+                "3 diagrams were not rendered and show a placeholder",
+            ],
+        )
+        self.assertEqual(renderer.previous, {})
+        renderer.close()
+
+    def test_bad_diagrams_are_cached(self) -> None:
+        """Comprova que un diagrama erroni no es torna a enviar mentre dura el TTL, però se'n reporta l'error."""
+        backend = StaticBackend(RenderResult(400, "Parse error", "Bad Request"))
+        renderer = MermaidRenderer(self.cfg, backend)
+        render_svgs(renderer, self.chunks[:1])
+        renderer.close()
+        self.assertEqual(ErrorHandler.errors, ["Error for E0: Bad Request: Parse error"])
+
+        ErrorHandler.errors = []
+        renderer = MermaidRenderer(self.cfg, backend)
+        self.assertEqual(render_svgs(renderer, self.chunks[:1]), ["Parse error"])
+        self.assertEqual(len(backend.codes), 1)
+        self.assertEqual(ErrorHandler.errors, ["Error for E0: Bad Request (cached failure): Parse error"])
+        self.assertFalse(renderer.breaker.is_open)
+
+        renderer.failure_ttl = 0
+        render_svgs(renderer, self.chunks[:1])
+        self.assertEqual(len(backend.codes), 2)
+        renderer.close()
+
+    def test_render_deadline(self) -> None:
+        """Comprova que els diagrames que no s'han renderitzat abans del termini mostren un marcador,
+        es reporten amb un sol error i no es guarden per al document següent."""
+        backend = SlowBackend(RenderResult(200, "<svg>ok</svg>"), delay=0.1)
+        self.cfg.render_deadline = 0.15
+        for jobs in [1, 2]:
+            ErrorHandler.errors = []
+            self.cfg.cache_dir = None
+            renderer = MermaidRenderer(self.cfg, backend)
+            svgs = render_svgs(renderer, self.chunks, jobs=jobs)
+
+            self.assertEqual(svgs[:2], ["<svg>ok</svg>"] * 2)
+            self.assertEqual(svgs[2:], [PLACEHOLDER_SVG] * 3)
+            self.assertEqual(
+                ErrorHandler.errors,
+                [
+                    "Error: the diagrams took longer than the render deadline of 0.15s, "
+                    "3 diagrams were not rendered and show a placeholder"
+                ],
+            )
+            self.assertEqual(len(renderer.previous), 2)
+            renderer.close()
+
+    def test_failure_cancels_the_pending_diagrams(self) -> None:
+        """Comprova que si un diagrama llança una excepció, els que encara no han començat es cancel·len."""
+
+        class FailingBackend(SlowBackend):
+            def render_svg(self, code: str) -> RenderResult:
+                if "A0" in code:
+                    raise RuntimeError("cancelled")
+                return super().render_svg(code)
+
+        backend = FailingBackend(RenderResult(200, "<svg>ok</svg>"), delay=0.2)
+        renderer = MermaidRenderer(self.cfg, backend)
+        diagrams = [(i, f"graph TD; A{i}-->B;", f"E{i}") for i in range(8)]
+        with self.assertRaisesRegex(RuntimeError, "cancelled"):
+            renderer.render_diagrams(diagrams, jobs=2)
+        time.sleep(0.5)
+        self.assertLess(len(backend.codes), 4)
+        renderer.close()
+
+
+class TestMmdcRenderBackend(unittest.TestCase):
+    def setUp(self) -> None:
+        ErrorHandler.errors = []
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.tmp.name, "runs.log")
+        patcher = patch.dict(os.environ, {"FAKE_MMDC_LOG": self.log})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+        self.executable = str(Constants.SCRIPT_PATH / "tests" / "fake_mmdc.py")
+
+    def runs(self) -> list[int]:
+        with open(self.log) as f:
+            return [int(line) for line in f]
+
+    def test_render_batch_in_one_run(self) -> None:
+        """Comprova que tots els diagrames d'un lot es generen amb una sola execució."""
+        backend = MmdcRenderBackend(self.executable)
+        results = backend.render_batch(["graph TD; A-->B;", "graph TD; B-->C;", "graph TD; C-->D;"])
+
+        self.assertEqual([result.status_code for result in results], [200, 200, 200])
+        self.assertIn("B--&gt;C;", results[1].text)
+        self.assertEqual(self.runs(), [3])
+
+    def test_failing_diagram(self) -> None:
+        """Comprova que un lot que falla es torna a generar per meitats per trobar el diagrama amb errors."""
+        backend = MmdcRenderBackend(self.executable)
+        results = backend.render_batch(["graph TD; A-->B;", "graph TD; syntax error", "graph TD; C-->D;"])
+
+        self.assertEqual([result.status_code for result in results], [200, 422, 200])
+        self.assertIn("Parse error", results[1].text)
+        self.assertEqual(self.runs(), [3, 1, 2, 1, 1])
+
+    def test_environment_failure(self) -> None:
+        """Comprova que quan mmdc falla per l'entorn no es busquen diagrams erronis més enllà de la primera
+        divisió, i que es respon amb 503 en lloc d'un error del diagrama."""
+        backend = MmdcRenderBackend(self.executable)
+        codes = [f"graph TD; A{i}-->B;" for i in range(8)]
+        with patch.dict(os.environ, {"FAKE_MMDC_FAIL": "Error: something broke"}):
+            results = backend.render_batch(codes)
+        self.assertEqual({result.status_code for result in results}, {503})
+        self.assertEqual(self.runs(), [8, 4, 4])
+
+        with patch.dict(os.environ, {"FAKE_MMDC_FAIL": "Error: Failed to launch the browser process!"}):
+            results = backend.render_batch(codes)
+        self.assertEqual({result.status_code for result in results}, {503})
+        self.assertEqual(self.runs(), [8, 4, 4, 8])
+
+    def test_environment_failure_is_not_cached(self) -> None:
+        """Comprova que els diagrames que han fallat per l'entorn de mmdc no es guarden com a erronis
+        i es tornen a generar quan l'entorn s'arregla."""
+        cfg = PdfCfg("test.md", "output.pdf", "style.css", "img", debug=False, mmdc_path=self.executable)
+        cfg.cache_dir = self.tmp.name
+        chunks = [
+            DiagramChunk(i, f"graph TD; A{i}-->B;", f"mermaid://diagrams/diagram_{i}.svg", f"E{i}", 100)
+            for i in range(2)
+        ]
+        renderer = MermaidRenderer(cfg)
+        with patch.dict(os.environ, {"FAKE_MMDC_FAIL": "Error: Failed to launch the browser process!"}):
+            render_svgs(renderer, chunks)
+        self.assertEqual(len(ErrorHandler.errors), 2)
+        renderer.close()
+
+        ErrorHandler.errors = []
         renderer = MermaidRenderer(cfg)
+        svgs = render_svgs(renderer, chunks)
+        self.assertTrue(all(f"A{i}--&gt;B;" in svg for i, svg in enumerate(svgs)))
+        self.assertEqual(ErrorHandler.errors, [])
+        renderer.close()
 
-        code = "\n".join([f"line {i}" for i in range(100)])  # 100 línies de codi
-        svg_files, heights = renderer.render(0, code, "http://example.com", "endpoint")
+    def test_missing_executable(self) -> None:
+        """Comprova que un executable que no existeix és un error de tots els diagrames, sense tornar-ho a provar."""
+        backend = MmdcRenderBackend(os.path.join(self.tmp.name, "mmdc"))
+        results = backend.render_batch(["graph TD; A-->B;", "graph TD; B-->C;"])
+        self.assertEqual([result.status_code for result in results], [0, 0])
+        self.assertIn("Could not run", results[0].reason)
+
+    def test_renderer_spreads_batches_over_workers(self) -> None:
+        """Comprova que el renderer reparteix els diagrames nous en un lot per treballador i reaprofita els coneguts."""
+        cfg = PdfCfg("test.md", "output.pdf", "style.css", "img", debug=False, mmdc_path=self.executable)
+        renderer = MermaidRenderer(cfg)
+        self.assertIsInstance(renderer.backend, MmdcRenderBackend)
+        chunks = [
+            DiagramChunk(i, f"graph TD; A{i}-->B;", f"mermaid://diagrams/diagram_{i}.svg", f"E{i}", 100)
+            for i in range(5)
+        ]
+        svgs = render_svgs(renderer, chunks)
+        self.assertTrue(all(f"A{i}--&gt;B;" in svg for i, svg in enumerate(svgs)))
+        self.assertEqual(sorted(self.runs()), [2, 3])
 
-        self.assertEqual(svg_files, ["diagram_0.svg", "diagram_1.svg"])
-        self.assertEqual(heights, [560, 560])  # (50 - 10) * 14 per chunk
-        self.assertEqual(mock_wrapper_instance.render_to_svg.call_count, 2)
+        chunks[4].code = "graph TD; syntax error"
+        render_svgs(renderer, chunks)
+        self.assertEqual(sorted(self.runs()), [1, 2, 3])
+        self.assertEqual(len(ErrorHandler.errors), 1)
+        self.assertTrue(ErrorHandler.errors[0].startswith("Error for E4: "))
+        renderer.close()
 
 
 if __name__ == "__main__":
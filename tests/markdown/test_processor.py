@@ -1,8 +1,17 @@
+import json
+import tempfile
+import textwrap
 import unittest
 from unittest.mock import MagicMock, patch
 
-from src.core.models import PdfCfg
-from src.markdown.processor import MarkdownProcessor
+import markdown2
+
+from src.core.constants import Constants
+from src.core.models import ErrorHandler, PdfCfg
+from src.markdown.image import PLACEHOLDER_SVG
+from src.markdown.mermaid import DiagramChunk
+from src.markdown.processor import MARKDOWN_EXTRAS, MarkdownProcessor
+from src.markdown.scanner import scan_markdown
 
 
 class TestMarkdownProcessor(unittest.TestCase):
@@ -17,27 +26,28 @@ class TestMarkdownProcessor(unittest.TestCase):
         )
         self.processor = MarkdownProcessor(self.cfg)
 
-    @patch("src.markdown.processor.MermaidRenderer")
-    def test_process_markdown(self, mock_mermaid_renderer: MagicMock) -> None:
+    @patch("src.markdown.mermaid.MermaidRenderer._render_all")
+    def test_process_markdown(self, mock_render_all: MagicMock) -> None:
         """Comprova que process_markdown processa correctament el contingut Markdown."""
-        mock_renderer_instance = mock_mermaid_renderer.return_value
-        mock_renderer_instance.render.return_value = (["diagram_0.svg"], [400])
+        mock_render_all.return_value = [("<svg></svg>", [])]
 
-        md_content = """
-        # Test Markdown
+        md_content = textwrap.dedent(
+            """
+            # Test Markdown
 
-        ```mermaid
-        graph TD;
-        A-->B;
-        ```
+            ```mermaid
+            graph TD;
+            A-->B;
+            ```
 
-        Some other content.
-        """
-        processed_content, svg_files = self.processor.process_markdown(md_content)
+            Some other content.
+            """
+        )
+        processed_content, svgs = self.processor.process_markdown(md_content)
 
         # Comprova que el contingut Markdown s'ha processat correctament
-        self.assertIn('<img src="diagram_0.svg"', processed_content)
-        self.assertEqual(svg_files, ["diagram_0.svg"])
+        self.assertIn('<img src="mermaid://diagrams/diagram_0.svg"', processed_content)
+        self.assertEqual(svgs, {"mermaid://diagrams/diagram_0.svg": "<svg></svg>"})
 
     def test_get_clean_code(self) -> None:
         """Comprova que _get_clean_code neteja correctament el codi."""
@@ -54,9 +64,16 @@ class TestMarkdownProcessor(unittest.TestCase):
         A-->B;
         ```
         """
-        endpoint = self.processor._get_current_enpoint(md_content, "graph TD;\nA-->B;", "Endpoint:", 0)
+        document = scan_markdown(md_content, "Endpoint:")
+        endpoint = self.processor._get_current_enpoint(document, document.fences[0].line, 0)
         self.assertEqual(endpoint, "http://example.com")
 
+    def test_get_current_enpoint_without_label(self) -> None:
+        """Comprova que _get_current_enpoint numera el diagrama quan no hi ha cap endpoint abans."""
+        document = scan_markdown("```mermaid\ngraph TD;\n```\nEndpoint: /users\n", "Endpoint:")
+        endpoint = self.processor._get_current_enpoint(document, document.fences[0].line, 3)
+        self.assertEqual(endpoint, "Endpoint_3")
+
     def test_wrap_intervals_with_div(self) -> None:
         """Comprova que _wrap_intervals_with_div embolcalla correctament el contingut."""
         content = "Some content\n\n<div style='page-break-before: always;'></div>\n\nMore content"
@@ -64,6 +81,67 @@ class TestMarkdownProcessor(unittest.TestCase):
         wrapped_content = self.processor._wrap_intervals_with_div(content, length_mermaid)
         self.assertIn('<div class="normal-page">', wrapped_content)
 
+    def test_wrap_intervals_with_div_keeps_last_page(self) -> None:
+        """Comprova que es conserva la darrera pàgina i que no s'afegeixen pàgines buides."""
+        content = Constants.DIV_BREAK_AFTER.join(["First", "Second", "\n", "Last"])
+        wrapped_content = self.processor._wrap_intervals_with_div(content, {})
+        self.assertEqual(wrapped_content.count('<div class="normal-page">'), 3)
+        self.assertEqual(wrapped_content.count(Constants.DIV_BREAK_AFTER), 2)
+        self.assertIn("<p>Last</p>", wrapped_content)
+
+    @patch("src.markdown.mermaid.MermaidRenderer._render_all")
+    def test_process_sections(self, mock_render_all: MagicMock) -> None:
+        """Comprova que un document en bytes es processa per seccions i que l'endpoint passa d'una secció a l'altra."""
+        mock_render_all.return_value = [("<svg></svg>", []), ("<svg></svg>", [])]
+        fence = "```mermaid\ngraph TD;\nA-->B;\n```\n"
+        md_content = "Endpoint: /users\n" + fence + Constants.DIV_BREAK_AFTER + "Más texto\n" + fence
+
+        with patch.object(self.processor.renderer, "render_diagrams", wraps=self.processor.renderer.render_diagrams):
+            svgs, sections = self.processor.process_sections(md_content.encode("utf-8"))
+            diagrams = self.processor.renderer.render_diagrams.call_args.args[0]  # type: ignore[attr-defined]
+
+        self.assertEqual([endpoint for _, _, endpoint in diagrams], ["/users", "/users"])
+        self.assertEqual(len(svgs), 2)
+        pages = list(sections)
+        self.assertEqual(len(pages), 2)
+        self.assertIn("diagram_0.svg", pages[0])
+        self.assertIn("diagram_1.svg", pages[1])
+        self.assertIn("Más texto", pages[1])
+        self.assertTrue(pages[1].startswith(Constants.DIV_BREAK_AFTER))
+
+    def test_convert_markdown_to_html_reuses_sections(self) -> None:
+        """Comprova que només es tornen a convertir les seccions que han canviat respecte l'anterior document."""
+        processor = MarkdownProcessor(self.cfg, incremental=True)
+        sections = ["# One", "Two *words*", "Three"]
+        html, _ = processor.process_markdown(Constants.DIV_BREAK_AFTER.join(sections))
+        sections[1] = "Two *other words*"
+        with patch("markdown2.markdown", wraps=markdown2.markdown) as mock_markdown:
+            edited_html, _ = processor.process_markdown(Constants.DIV_BREAK_AFTER.join(sections))
+
+        mock_markdown.assert_called_once_with("Two *other words*", extras=MARKDOWN_EXTRAS)
+        self.assertEqual(edited_html.split(Constants.DIV_BREAK_AFTER)[::2], html.split(Constants.DIV_BREAK_AFTER)[::2])
+        self.assertIn("<em>other words</em>", edited_html)
+
+    def test_definitions_of_other_sections(self) -> None:
+        """Comprova que un enllaç per referència i una nota al peu es resolen encara que es defineixin en una
+        altra secció, i que la nota es mostra."""
+        sections = [
+            "See the [API guide][guide] and a note[^n].",
+            "[guide]: https://example.com/guide\n\n[^n]: The note text.\n    More of it.\n",
+        ]
+        html, _ = self.processor.process_markdown(Constants.DIV_BREAK_AFTER.join(sections))
+        first = html.split(Constants.DIV_BREAK_AFTER)[0]
+
+        self.assertIn('<a href="https://example.com/guide">API guide</a>', first)
+        self.assertIn('<a href="#fn-n">', first)
+        self.assertIn("More of it.", first)
+        self.assertNotIn("[guide]", html)
+
+    def test_convert_markdown_to_html_without_memory(self) -> None:
+        """Comprova que sense el mode incremental no es guarda l'HTML de les seccions."""
+        self.processor.process_markdown(Constants.DIV_BREAK_AFTER.join(["# One", "Two"]))
+        self.assertEqual((self.processor.html.memo, self.processor.html.next_memo), ({}, {}))
+
     def test_image_skeleton(self) -> None:
         """Comprova que image_skeleton retorna correctament l'esquelet d'una imatge."""
         skeleton = self.processor.image_skeleton("diagram_0.svg", 400, 1)
@@ -92,12 +170,95 @@ class TestMarkdownProcessor(unittest.TestCase):
         self.assertNotIn("<details open>", cleaned_content)
         self.assertNotIn("<summary>diagrams</summary>", cleaned_content)
 
-    def test_enhance_to_html_links(self) -> None:
-        """Comprova que _enhance_to_html_links converteix correctament els enllaços a HTML."""
+    def test_clean_content_links(self) -> None:
+        """Comprova que _clean_content converteix correctament els enllaços a HTML."""
         content = "Documentation for the API: http://example.com<br>"
-        enhanced_content = self.processor._enhance_to_html_links(content)
+        enhanced_content = self.processor._clean_content(content)
         self.assertIn('<a href="http://example.com"', enhanced_content)
 
+    def test_user_rules(self) -> None:
+        """Comprova que les regles del fitxer de configuració s'apliquen després de les de neteja."""
+        with tempfile.TemporaryDirectory() as tmp:
+            rules_path = f"{tmp}/rules.json"
+            with open(rules_path, "w") as f:
+                json.dump([{"pattern": "Internal: .*\\n", "replacement": ""}], f)
+            self.cfg.rules_path = rules_path
+            processor = MarkdownProcessor(self.cfg)
+
+        cleaned_content = processor._clean_content("<details open>\nInternal: secret\nPublic\n")
+        self.assertEqual(cleaned_content, "\nPublic\n")
+
+
+class TestLimits(unittest.TestCase):
+    def setUp(self) -> None:
+        ErrorHandler.errors = []
+        self.cfg = PdfCfg("test.md", "output.pdf", "style.css", "img", debug=False)
+
+    def tearDown(self) -> None:
+        ErrorHandler.errors = []
+
+    @patch("src.markdown.mermaid.MermaidRenderer.render_diagrams")
+    def test_diagrams_over_the_limits(self, mock_render_diagrams: MagicMock) -> None:
+        """Comprova que els diagrames massa llargs, massa grans o més enllà del nombre màxim no es renderitzen,
+        que mostren un marcador i que cadascun es reporta, però el document es converteix."""
+        self.cfg.max_diagrams = 3
+        self.cfg.max_diagram_lines = 3
+        self.cfg.max_diagram_bytes = 40
+        codes = [
+            "graph TD; A-->B;",
+            "graph TD\nA-->B\nB-->C\nC-->D",
+            f"graph TD; {'A' * 40}-->B;",
+            "graph TD; C-->D;",
+            "graph TD; E-->F;",
+        ]
+        markdown = "".join(f"Endpoint: E{i}\n```mermaid\n{code}\n```\n\n" for i, code in enumerate(codes))
+
+        def render_diagrams(diagrams: list[tuple[int, str, str]]) -> list[list[tuple[DiagramChunk, str]]]:
+            return [
+                [(DiagramChunk(i, code, f"mermaid://diagrams/diagram_{i}.svg", e, 100), "<svg/>")]
+                for i, code, e in diagrams
+            ]
+
+        mock_render_diagrams.side_effect = render_diagrams
+        content, svgs = MarkdownProcessor(self.cfg).process_markdown(markdown)
+
+        self.assertEqual([diagram[0] for diagram in mock_render_diagrams.call_args.args[0]], [0])
+        self.assertEqual(svgs["mermaid://diagrams/diagram_0.svg"], "<svg/>")
+        for i in range(1, 5):
+            self.assertEqual(svgs[f"mermaid://diagrams/diagram_{i}.svg"], PLACEHOLDER_SVG)
+            self.assertIn(f'<img src="mermaid://diagrams/diagram_{i}.svg"', content)
+        self.assertEqual(
+            ErrorHandler.errors,
+            [
+                "Error for E1: the diagram has 4 lines, more than the limit of 3, "
+                "it was not rendered and shows a placeholder",
+                "Error for E2: the diagram has 55 bytes, more than the limit of 40, "
+                "it was not rendered and shows a placeholder",
+                "Error: the document has 5 diagrams, more than the limit of 3, "
+                "the last 2 were not rendered and show a placeholder",
+            ],
+        )
+
+    def test_input_over_the_limit(self) -> None:
+        """Comprova que d'un document massa gran només es converteixen les línies que caben en el límit."""
+        self.cfg.max_input_bytes = 30
+        processor = MarkdownProcessor(self.cfg)
+        content, _ = processor.process_markdown("# Title\n\nFirst line.\nSecond line.\n")
+        self.assertIn("First line.", content)
+        self.assertNotIn("Second", content)
+        self.assertEqual(
+            ErrorHandler.errors,
+            ["Error: the document has 34 bytes, more than the limit of 30, only the first 21 were converted"],
+        )
+        self.assertEqual(processor._limit_input("é" * 15 + "\n"), "é" * 15)
+        self.assertEqual(processor._limit_input("é" * 20 + "\n"), "é" * 15)
+        self.assertEqual(processor._limit_input("é".encode("utf-8") * 20), "é".encode("utf-8") * 15)
+        self.assertEqual(
+            ErrorHandler.errors[-1],
+            "Error: the document has 40 bytes, more than the limit of 30, only the first 30 were converted",
+        )
+        processor.close()
+
 
 if __name__ == "__main__":
     unittest.main()
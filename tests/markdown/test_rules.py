@@ -0,0 +1,77 @@
+import json
+import tempfile
+import unittest
+
+from src.markdown.rules import DEFAULT_RULES, Rule, RuleEngine, load_rules
+
+
+class TestRuleEngine(unittest.TestCase):
+    def test_default_rules(self) -> None:
+        """Comprova que les regles per defecte netegen el document com els reemplaçaments per separat."""
+        page_break = '<br><div style="page-break-before: always;"></div>\n'
+        content = (
+            "<details open>\n<summary>diagrams</summary>\nMethod: GET <br>\nPath: /users<br>\n</details>\n"
+            + page_break * 3
+            + "Documentation for the API: https://example.com/docs<br>\n"
+        )
+        expected = (
+            "\n\nGET /users<br>\n\n"
+            + '<br/><div style="page-break-before: always;"></div>\n\n'
+            + 'Documentation for the API: <a href="https://example.com/docs" class="modern-link">'
+            + "https://example.com/docs</a><br>\n"
+        )
+        self.assertEqual(RuleEngine(DEFAULT_RULES).apply(content), expected)
+
+    def test_literal_and_regex_rules(self) -> None:
+        """Comprova que una regla literal no interpreta el patró ni el reemplaçament, i una regex fa servir grups."""
+        engine = RuleEngine([Rule("a.b", r"\1", literal=True), Rule(r"(\w+)@(\w+)", r"\2 at \1")])
+        self.assertEqual(engine.apply("a.b axb user@host"), r"\1 axb host at user")
+
+    def test_ignore_case(self) -> None:
+        """Comprova que ignore_case només afecta la seva regla."""
+        engine = RuleEngine([Rule("secret", "***", literal=True, ignore_case=True), Rule("Keep", "kept")])
+        self.assertEqual(engine.apply("SECRET Secret Keep KEEP"), "*** *** kept KEEP")
+
+    def test_backreferences(self) -> None:
+        """Comprova que una regla amb referències als seus grups o amb noms de grup repetits
+        s'aplica amb els seus propis grups, després de les anteriors."""
+        engine = RuleEngine(
+            [
+                *DEFAULT_RULES,
+                Rule(r"\b(\w+) \1\b", r"\1"),
+                Rule(r"(?P<word>cat)", r"\g<word>s"),
+                Rule(r"(?P<word>dog)", r"\g<word>gy"),
+            ]
+        )
+        self.assertEqual(engine.apply("the the cat and dog"), "the cats and doggy")
+        self.assertEqual(len(engine.groups), 4)
+
+    def test_no_rules(self) -> None:
+        """Comprova que sense regles el contingut no canvia."""
+        self.assertEqual(RuleEngine().apply("content"), "content")
+
+    def test_invalid_pattern(self) -> None:
+        """Comprova que un patró invàlid es reporta com a ValueError."""
+        with self.assertRaises(ValueError):
+            RuleEngine([Rule("(unclosed")])
+
+
+class TestLoadRules(unittest.TestCase):
+    def test_load_rules(self) -> None:
+        """Comprova que es llegeixen les regles d'un fitxer JSON i que un fitxer invàlid es reporta."""
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            json.dump([{"pattern": "ACME", "replacement": "Acme", "literal": True}], f)
+            f.flush()
+            self.assertEqual(load_rules(f.name), [Rule("ACME", "Acme", literal=True)])
+        self.assertEqual(load_rules(None), [])
+
+        for content in ['{"pattern": "a"}', '[{"regex": "a"}]', '[{"pattern": "("}]', "not json"]:
+            with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+                f.write(content)
+                f.flush()
+                with self.assertRaises(ValueError):
+                    load_rules(f.name)
+
+
+if __name__ == "__main__":
+    unittest.main()
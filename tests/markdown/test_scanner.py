@@ -0,0 +1,45 @@
+import unittest
+
+from src.markdown.scanner import FenceSegment, TextSegment, scan_markdown
+
+
+class TestScanMarkdown(unittest.TestCase):
+    def test_segments(self) -> None:
+        """Comprova que el document es divideix en trossos de text i blocs Mermaid amb els seus offsets."""
+        content = "# Title\n```mermaid\ngraph TD;\n```\nText\n"
+        document = scan_markdown(content)
+        self.assertEqual([type(s) for s in document.segments], [TextSegment, FenceSegment, TextSegment])
+        fence = document.fences[0]
+        self.assertEqual(content[fence.start : fence.end], "```mermaid\ngraph TD;\n```")
+        self.assertEqual(fence.code, "\ngraph TD;\n")
+        self.assertEqual(fence.line, 1)
+
+    def test_tilde_and_indented_fences(self) -> None:
+        """Comprova que es detecten els blocs amb ~~~ i els blocs indentats, i que el codi es desindenta."""
+        content = "~~~mermaid\ngraph TD;\n~~~\n- item\n    ```mermaid\n    graph LR;\n      A-->B;\n    ```\n"
+        document = scan_markdown(content)
+        self.assertEqual([f.code for f in document.fences], ["\ngraph TD;\n", "\ngraph LR;\n  A-->B;\n"])
+
+    def test_other_fences_are_text(self) -> None:
+        """Comprova que els blocs d'altres llenguatges i els blocs sense tancar no són diagrames."""
+        content = "````markdown\n```mermaid\ngraph TD;\n```\n````\n```mermaid\ngraph TD;\n"
+        document = scan_markdown(content)
+        self.assertEqual(document.fences, [])
+        self.assertEqual(document.join([]), content)
+
+    def test_label_before(self) -> None:
+        """Comprova que es troba l'última línia amb l'etiqueta abans de cada diagrama."""
+        content = "Endpoint: /a\n```mermaid\nA\n```\nEndpoint: /b\n```mermaid\nB\n```\n"
+        document = scan_markdown(content, "Endpoint:")
+        self.assertIsNone(document.label_before(0))
+        self.assertEqual([document.label_before(f.line) for f in document.fences], ["Endpoint: /a", "Endpoint: /b"])
+
+    def test_join(self) -> None:
+        """Comprova que join substitueix cada bloc pel seu reemplaçament mantenint la resta del text."""
+        content = "A\n```mermaid\nX\n```\nB\n```mermaid\nX\n```\nC"
+        document = scan_markdown(content)
+        self.assertEqual(document.join(["<img 0>", "<img 1>"]), "A\n<img 0>\nB\n<img 1>\nC")
+
+
+if __name__ == "__main__":
+    unittest.main()
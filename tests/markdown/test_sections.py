@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from src.core.constants import Constants
+from src.markdown.sections import find_definitions, iter_sections, open_markdown
+
+
+class TestSections(unittest.TestCase):
+    def test_iter_sections(self) -> None:
+        """Comprova que el document es divideix per salts de pàgina, sense els salts."""
+        content = Constants.DIV_BREAK_AFTER.join(["# One\n", "Two\n", ""])
+        self.assertEqual(list(iter_sections(content)), ["# One\n", "Two\n", ""])
+        self.assertEqual(list(iter_sections("")), [""])
+
+    def test_iter_sections_bytes(self) -> None:
+        """Comprova que un document en bytes es descodifica secció a secció."""
+        content = Constants.DIV_BREAK_AFTER.join(["Àlgebra\n", "Geometria\n"])
+        self.assertEqual(list(iter_sections(content.encode("utf-8"))), ["Àlgebra\n", "Geometria\n"])
+
+    def test_find_definitions(self) -> None:
+        """Comprova que es troben les definicions d'enllaços i de notes, amb els seus paràgrafs sagnats,
+        però no les que són dins de codi."""
+        section = (
+            "[Guide]: https://example.com\n[^n]: Note.\n\n    More.\nText\n"
+            "```\n[code]: https://example.com/code\n```\n[guide]: https://example.com/other\n"
+        )
+        self.assertEqual(
+            find_definitions(section),
+            {"guide": "[Guide]: https://example.com", "^n": "[^n]: Note.\n\n    More."},
+        )
+
+    def test_open_markdown(self) -> None:
+        """Comprova que el fitxer es mapeja en memòria i que un fitxer buit es llegeix com a bytes buits."""
+        content = Constants.DIV_BREAK_AFTER.join(["# One\n", "Dos\n"])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "doc.md")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+            with open_markdown(path) as source:
+                self.assertEqual(list(iter_sections(source)), ["# One\n", "Dos\n"])
+
+            open(path, "w").close()
+            with open_markdown(path) as source:
+                self.assertEqual(source, b"")
+
+
+if __name__ == "__main__":
+    unittest.main()
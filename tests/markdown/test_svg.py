@@ -0,0 +1,92 @@
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.core.models import ErrorHandler, PdfCfg
+from src.markdown.cache import open_cache
+from src.markdown.mermaid import DiagramChunk, MermaidRenderer, RenderResult
+from src.markdown.svg import SvgOptimizer, optimize_svg
+from tests.markdown.test_mermaid import StaticBackend, render_svgs
+
+SVG = """<?xml version="1.0" encoding="UTF-8"?>
+<!-- Generated by Mermaid -->
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" viewBox="0 0 120.123456 80.5">
+  <metadata><generator>mermaid</generator></metadata>
+  <style>.node { fill: #eee; }</style>
+  <style>.node { fill: #eee; }</style>
+  <defs>
+    <linearGradient id="unused-gradient"><stop offset="0"/></linearGradient>
+    <linearGradient id="fill"><stop offset="1"/></linearGradient>
+  </defs>
+  <g data-id="A" data-look="classic">
+    <marker id="pointEnd" refX="6.000001"><path d="M 0 0 L 10 5 z"/></marker>
+    <marker id="crossEnd"><path d="M 1 1 L 9 9"/></marker>
+    <path d="M10.123456,20.98765L-0.0001,30.5" marker-end="url(#pointEnd)" fill="url(#fill)"/>
+    <use xlink:href="#pointEnd" x="1.005"/>
+  </g>
+</svg>
+"""
+
+
+class TestOptimizeSvg(unittest.TestCase):
+    def test_optimize_svg(self) -> None:
+        """Comprova que s'eliminen les metadades, els estils repetits i les definicions sense referències,
+        i que s'arrodoneixen les coordenades."""
+        optimized = optimize_svg(SVG)
+
+        self.assertNotIn("metadata", optimized)
+        self.assertNotIn("Generated by Mermaid", optimized)
+        self.assertNotIn("data-", optimized)
+        self.assertEqual(optimized.count("<style>"), 1)
+        self.assertNotIn("unused-gradient", optimized)
+        self.assertNotIn("crossEnd", optimized)
+        self.assertIn('id="fill"', optimized)
+        self.assertIn('id="pointEnd" refX="6"', optimized)
+        self.assertIn('viewBox="0 0 120.12 80.5"', optimized)
+        self.assertIn('d="M10.12,20.99L0,30.5"', optimized)
+        self.assertIn('xlink:href="#pointEnd"', optimized)
+        self.assertLess(len(optimized), len(SVG))
+        self.assertEqual(optimize_svg(optimized), optimized)
+
+    def test_compact_numbers(self) -> None:
+        """Comprova que els números escrits junts, sense separador, no es fusionen en arrodonir-los."""
+        svg = '<svg xmlns="http://www.w3.org/2000/svg"><path d="M1.001.5L2.0.25-.5"/><polygon points="1.0.5"/></svg>'
+        optimized = optimize_svg(svg)
+
+        self.assertIn('d="M1 0.5L2 0.25-0.5"', optimized)
+        self.assertIn('points="1 0.5"', optimized)
+        self.assertEqual(optimize_svg(optimized), optimized)
+
+    def test_invalid_svg(self) -> None:
+        """Comprova que un SVG que no es pot llegir es retorna tal com és."""
+        self.assertEqual(optimize_svg("<svg><g></svg>"), "<svg><g></svg>")
+
+
+class TestSvgOptimizer(unittest.TestCase):
+    def test_results_by_input_hash(self) -> None:
+        """Comprova que cada SVG s'optimitza una sola vegada, també entre execucions amb la memòria cau."""
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = open_cache(tmp)
+            optimizer = SvgOptimizer(cache=cache)
+            with patch("src.markdown.svg.optimize_svg", wraps=optimize_svg) as mock_optimize:
+                optimized = optimizer.optimize(SVG)
+                self.assertEqual(optimizer.optimize(SVG), optimized)
+                self.assertEqual(optimizer.optimize(optimized), optimized)
+                self.assertEqual(SvgOptimizer(cache=cache).optimize(SVG), optimized)
+            mock_optimize.assert_called_once()
+
+    def test_renderer_optimizes_svgs(self) -> None:
+        """Comprova que el renderer optimitza els SVG generats però no les respostes amb errors."""
+        ErrorHandler.errors = []
+        cfg = PdfCfg("test.md", "output.pdf", "style.css", "img", debug=False, optimize_svg=True)
+        chunk = DiagramChunk(0, "graph TD; A-->B;", "mermaid://diagrams/diagram_0.svg", "E0", 100)
+
+        renderer = MermaidRenderer(cfg, StaticBackend(RenderResult(200, SVG)))
+        self.assertEqual(render_svgs(renderer, [chunk]), [optimize_svg(SVG)])
+        renderer = MermaidRenderer(cfg, StaticBackend(RenderResult(500, "<p>1.23456</p>", "Server Error")))
+        self.assertEqual(render_svgs(renderer, [chunk]), ["<p>1.23456</p>"])
+        ErrorHandler.errors = []
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+
+from src.markdown.syntax import CLASS, FLOWCHART, SEQUENCE, parse_diagram
+
+SEQUENCE_CODE = """%%{init: {"theme": "forest"}}%%
+sequenceDiagram
+    participant A
+    box Backend
+    participant B
+    end
+    A->>B: request
+    loop Retry
+        B-->>A: retry
+    end
+    participant C
+    C->>A: notify"""
+
+
+class TestParseDiagram(unittest.TestCase):
+    def test_sequence(self) -> None:
+        """Comprova que es troben la capçalera, les declaracions i els talls fora dels blocs en un diagrama
+        de seqüència."""
+        diagram = parse_diagram(SEQUENCE_CODE)
+
+        self.assertEqual(diagram.kind, SEQUENCE)
+        self.assertEqual(diagram.header, '%%{init: {"theme": "forest"}}%%\nsequenceDiagram')
+        self.assertEqual(diagram.declarations, [2, 3, 4, 5, 10])
+        self.assertEqual(diagram.cuts, [0, 3, 6, 7, 10, 11, 12])
+        self.assertEqual(diagram.errors, [])
+        self.assertEqual(
+            diagram.header_before(7),
+            '%%{init: {"theme": "forest"}}%%\nsequenceDiagram\n    participant A\n    box Backend\n'
+            "    participant B\n    end\n",
+        )
+        self.assertEqual(diagram.header_before(0), "")
+
+    def test_flowchart(self) -> None:
+        """Comprova que en un diagrama de flux no es talla dins d'un subgraph i que la capçalera és només el tipus."""
+        diagram = parse_diagram("graph TD; A-->B;\nsubgraph one\nB-->C\nend\nC-->D")
+
+        self.assertEqual(diagram.kind, FLOWCHART)
+        self.assertEqual(diagram.header, "graph TD")
+        self.assertEqual(diagram.cuts, [0, 4, 5])
+        self.assertEqual(diagram.errors, [])
+
+    def test_class(self) -> None:
+        """Comprova que en un diagrama de classes no es talla dins de les claus."""
+        diagram = parse_diagram("classDiagram\nclass A {\n+int id\n}\nA <|-- B")
+
+        self.assertEqual(diagram.kind, CLASS)
+        self.assertEqual(diagram.cuts, [0, 4, 5])
+
+    def test_errors(self) -> None:
+        """Comprova que es detecten els blocs desequilibrats amb la línia on són."""
+        self.assertEqual(
+            parse_diagram("sequenceDiagram\nA->>B: x\nelse\nloop Retry\nA->>B: y").errors,
+            ["line 3: else outside of an alt block", "line 4: loop is never closed"],
+        )
+        self.assertEqual(parse_diagram("graph TD\nA-->B\nend").errors, ["line 3: end without an open block"])
+        self.assertEqual(parse_diagram("classDiagram\nclass A {\n+int id").errors, ["line 2: { is never closed"])
+
+    def test_quoted_text_and_comments(self) -> None:
+        """Comprova que els punts i coma, les claus i les paraules entre cometes o en un comentari
+        no es prenen per instruccions."""
+        flowchart = parse_diagram('graph TD\nA["x; end"] --> B\nclick A cb "Tooltip; end here"\nB --> C %% ; end')
+        self.assertEqual(flowchart.errors, [])
+        self.assertEqual(flowchart.cuts, [0, 2, 3, 4])
+
+        classes = parse_diagram('classDiagram\nclass Duck\nnote for Duck "can fly {"\nDuck <|-- Mallard')
+        self.assertEqual(classes.errors, [])
+        self.assertEqual(classes.cuts, [0, 2, 3, 4])
+
+    def test_multiline_quotes(self) -> None:
+        """Comprova que un end dins d'una etiqueta entre cometes de diverses línies no tanca cap bloc
+        i que no es talla dins de l'etiqueta."""
+        diagram = parse_diagram('graph TD\nA["first line\nend of the label"] --> B\nB --> C')
+        self.assertEqual(diagram.errors, [])
+        self.assertEqual(diagram.cuts, [0, 3, 4])
+
+    def test_directives(self) -> None:
+        """Comprova que les línies d'una directiva, abans o després del tipus, formen part de la capçalera
+        de cada tros i no s'hi talla mai."""
+        directive = "%%{init:\n{'theme': 'forest',\n'sequence': {'mirrorActors': true}}\n}%%"
+        diagram = parse_diagram(f"sequenceDiagram\n{directive}\nparticipant A\nA->>A: x\nA->>A: y")
+        self.assertEqual(diagram.kind, SEQUENCE)
+        self.assertEqual(diagram.directives, [1, 2, 3, 4])
+        self.assertEqual(diagram.cuts, [0, 5, 6, 7, 8])
+        self.assertEqual(diagram.errors, [])
+        self.assertEqual(diagram.header_before(7), f"sequenceDiagram\n{directive}\nparticipant A\n")
+        self.assertEqual(diagram.body(6, 8), "A->>A: x\nA->>A: y")
+
+        diagram = parse_diagram(f"{directive}\ngraph TD\nA-->B\nB-->C")
+        self.assertEqual(diagram.kind, FLOWCHART)
+        self.assertEqual(diagram.header, f"{directive}\ngraph TD")
+        self.assertEqual(diagram.cuts, [0, 6, 7])
+
+    def test_other_diagrams(self) -> None:
+        """Comprova que els altres tipus de diagrama no es validen, es poden tallar a cada línia i porten el tipus."""
+        diagram = parse_diagram("stateDiagram-v2\n[*] --> A\nA --> end\nA --> [*]")
+        self.assertIsNone(diagram.kind)
+        self.assertEqual(diagram.errors, [])
+        self.assertEqual(diagram.cuts, [0, 2, 3, 4])
+        self.assertEqual(diagram.header_before(2), "stateDiagram-v2\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,18 +1,19 @@
-import os
+import tempfile
 import unittest
+from pathlib import Path
 from typing import Any
-from unittest.mock import mock_open, patch
+from unittest.mock import patch
 
+from src.core.constants import Constants
 from src.core.models import PdfCfg
+from src.markdown.assets import AssetFetcher
 from src.markdown.processor import MarkdownProcessor
-from src.pdf.converter import PdfConverter
+from src.pdf.converter import MARKDOWN_EXTRAS, PdfConverter
+from src.pdf.fetcher import DiagramFetcher
 
 
 class TestPdfConverter(unittest.TestCase):
     def setUp(self) -> None:
-        os.makedirs("tests/resources", exist_ok=True)
-        with open("tests/resources/test.svg", "w") as f:
-            f.write("<svg></svg>")  # Contingut mínim d'un fitxer SVG
         # Configuració inicial per als tests
         self.cfg = PdfCfg(
             md_path="tests/output/test.md",
@@ -24,38 +25,89 @@ class TestPdfConverter(unittest.TestCase):
         self.processor = MarkdownProcessor(self.cfg)
         self.converter = PdfConverter(self.cfg, self.processor)
         self.markdown_content = "# Test Markdown\n\n```mermaid\ngraph TD;\nA-->B;\n```\n"
-        self.mock_svg_files = ["tests/resources/test.svg"]
-        self.mock_temp_md_path = "temp.md"
-
-    @patch("os.makedirs")
-    @patch("os.remove")
-    @patch("builtins.open", new_callable=mock_open, read_data="Mocked file content")
-    @patch("src.pdf.converter.md2pdf")
-    @patch.object(MarkdownProcessor, "process_markdown", return_value=("# Test Markdown", ["tests/resources/test.svg"]))
-    def test_convert_to_pdf(
-        self, mock_process_markdown: Any, mock_md2pdf: Any, mock_open: Any, mock_remove: Any, mock_makedirs: Any
-    ) -> None:
+        self.svgs = {"mermaid://diagrams/diagram_0.svg": "<svg></svg>"}
+
+    @patch("builtins.open")
+    @patch("src.pdf.converter.CSS")
+    @patch("src.pdf.converter.HTML")
+    @patch.object(MarkdownProcessor, "process_sections")
+    def test_convert_to_pdf(self, mock_process_sections: Any, mock_html: Any, mock_css: Any, mock_open: Any) -> None:
+        mock_process_sections.return_value = (self.svgs, iter(["# Test Markdown\n\n", "Some text\n"]))
+
         # Call the method to test
         self.converter.convert_to_pdf(self.markdown_content)
 
         # Check if the methods were called correctly
-        mock_process_markdown.assert_called_once_with(self.markdown_content)
-        mock_makedirs.assert_called_once_with(os.path.dirname(self.cfg.tmp_md_path), exist_ok=True)
-
-        # Verify all calls to os.remove
-        mock_remove.assert_has_calls(
-            [
-                unittest.mock.call(self.mock_svg_files[0]),  # El fitxer SVG
-                unittest.mock.call(self.cfg.tmp_md_path),  # El fitxer temporal
-            ],
-            any_order=True,
-        )
+        mock_process_sections.assert_called_once_with(self.markdown_content)
+        mock_css.assert_called_once_with(filename=self.cfg.css_path, font_config=self.converter.font_config)
 
-        # Verify the call to open
-        mock_open.assert_called_once_with(self.cfg.tmp_md_path, "w")
-        mock_md2pdf.assert_called_once_with(
-            self.cfg.pdf_path,
-            md_file_path=self.cfg.tmp_md_path,
-            css_file_path=self.cfg.css_path,
-            base_url=self.cfg.base_url,
+        # The processed content is handed in memory, without temp files
+        mock_open.assert_not_called()
+        kwargs = mock_html.call_args.kwargs
+        self.assertEqual(kwargs["string"], "<h1>Test Markdown</h1>\n<p>Some text</p>\n")
+        self.assertEqual(kwargs["base_url"], self.cfg.base_url)
+        self.assertIsInstance(kwargs["url_fetcher"], DiagramFetcher)
+        self.assertEqual(kwargs["url_fetcher"].svgs, self.svgs)
+        mock_html.return_value.render.assert_called_once_with(
+            stylesheets=[mock_css.return_value], font_config=self.converter.font_config
         )
+        mock_html.return_value.render.return_value.write_pdf.assert_called_once_with(self.cfg.pdf_path)
+
+    @patch("src.pdf.layout.render_parallel")
+    @patch("src.pdf.converter.HTML")
+    def test_render_pdf_by_groups(self, mock_html: Any, mock_render_parallel: Any) -> None:
+        """Comprova que un document gran es maqueta per grups de pàgines i un de petit en un sol procés."""
+        self.cfg.layout_jobs = 2
+        raw_html = Constants.DIV_BREAK_AFTER.join(["<p>page</p>"] * Constants.LAYOUT_MIN_PAGES * 2)
+        self.converter.render_pdf(raw_html, self.svgs)
+        groups, _, assets = mock_render_parallel.call_args.args[:3]
+        self.assertEqual(len(groups), 2)
+        self.assertIs(assets, self.processor.assets)
+        mock_html.assert_not_called()
+
+        self.converter.render_pdf("<p>page</p>", self.svgs)
+        mock_html.assert_called_once()
+        self.assertEqual(mock_render_parallel.call_count, 1)
+
+        self.cfg.layout_jobs = 1
+        with patch("src.pdf.converter.split_groups") as mock_split_groups:
+            self.converter.render_pdf(raw_html, self.svgs)
+        mock_split_groups.assert_not_called()
+        self.assertEqual(mock_render_parallel.call_count, 1)
+
+    def test_markdown_extras(self) -> None:
+        """Comprova que es fan servir els mateixos extres de markdown2 que md2pdf."""
+        self.assertEqual(MARKDOWN_EXTRAS, ["cuddled-lists", "tables", "footnotes"])
+
+
+class TestDiagramFetcher(unittest.TestCase):
+    def test_fetch_diagram_from_memory(self) -> None:
+        """Comprova que els diagrames se serveixen des de memòria com a SVG."""
+        fetcher = DiagramFetcher({"mermaid://diagrams/diagram_0.svg": "<svg>A</svg>"})
+        response = fetcher.fetch("mermaid://diagrams/diagram_0.svg")
+        self.assertEqual(response.read(), b"<svg>A</svg>")
+        self.assertEqual(response.content_type, "image/svg+xml")
+
+    @patch("weasyprint.urls.URLFetcher.fetch")
+    def test_fetch_other_resources(self, mock_fetch: Any) -> None:
+        """Comprova que la resta de recursos es demanen amb el fetcher de WeasyPrint."""
+        fetcher = DiagramFetcher({})
+        fetcher.fetch("file:///tmp/image.png")
+        mock_fetch.assert_called_once_with("file:///tmp/image.png", None)
+
+    @patch("weasyprint.urls.URLFetcher.fetch")
+    def test_fetch_prefetched_assets(self, mock_fetch: Any) -> None:
+        """Comprova que les imatges obtingudes per avançat se serveixen des de memòria."""
+        with tempfile.TemporaryDirectory() as tmp:
+            Path(tmp, "logo.png").write_bytes(b"PNG")
+            assets = AssetFetcher()
+            assets.prefetch(["logo.png"], tmp)
+            response = DiagramFetcher({}, assets).fetch(Path(tmp, "logo.png").resolve().as_uri())
+            assets.close()
+        self.assertEqual(response.read(), b"PNG")
+        self.assertEqual(response.content_type, "image/png")
+        mock_fetch.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
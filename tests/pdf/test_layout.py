@@ -0,0 +1,103 @@
+import io
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import Destination
+
+from src.core.constants import Constants
+from src.markdown.assets import Asset, AssetFetcher
+from src.pdf.layout import group_assets, merge_pdfs, render_group, split_groups
+
+
+def blank_pdf(pages: int) -> bytes:
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=595, height=842)
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+class TestSplitGroups(unittest.TestCase):
+    def test_small_document(self) -> None:
+        """Comprova que un document petit, o amb un sol procés, es maqueta sencer."""
+        raw_html = Constants.DIV_BREAK_AFTER.join(["<p>page</p>"] * 5)
+        self.assertEqual(split_groups(raw_html, 4, min_pages=3), [raw_html])
+        self.assertEqual(split_groups(raw_html, 1, min_pages=1), [raw_html])
+
+    def test_groups_keep_the_order(self) -> None:
+        """Comprova que els grups són de pàgines consecutives, de mida semblant i sense perdre'n cap."""
+        pages = [f"<p>page {i:02}</p>" for i in range(12)]
+        groups = split_groups(Constants.DIV_BREAK_AFTER.join(pages), 3, min_pages=2)
+
+        self.assertEqual(len(groups), 3)
+        self.assertEqual(
+            [group.split(Constants.DIV_BREAK_AFTER) for group in groups], [pages[:4], pages[4:8], pages[8:]]
+        )
+
+
+class TestRenderGroup(unittest.TestCase):
+    def test_group_assets(self) -> None:
+        """Comprova que cada grup rep les imatges obtingudes per avançat que fa servir, per la seva URL absoluta."""
+        with tempfile.TemporaryDirectory() as tmp:
+            Path(tmp, "logo.png").write_bytes(b"PNG")
+            logo = Path(tmp, "logo.png").resolve().as_uri()
+            assets = AssetFetcher()
+            assets.prefetch(["logo.png", "missing.png"], tmp)
+            found = group_assets('<p><img src="logo.png"><img src="missing.png"></p>', assets, tmp)
+            assets.close()
+        self.assertEqual(list(found), [logo])
+        self.assertEqual(found[logo].body, b"PNG")
+        self.assertEqual(group_assets('<img src="logo.png">', None, tmp), {})
+
+    @patch("src.pdf.layout.FontConfiguration")
+    @patch("src.pdf.layout.CSS")
+    @patch("src.pdf.layout.HTML")
+    def test_render_group_uses_fonts_and_assets(self, mock_html: Any, mock_css: Any, mock_font_config: Any) -> None:
+        """Comprova que un grup es maqueta amb la mateixa configuració de fonts per al full d'estil i les pàgines
+        i que les imatges del grup se serveixen des de memòria."""
+        mock_html.return_value.render.return_value.pages = []
+        mock_html.return_value.render.return_value.write_pdf.return_value = b"%PDF"
+        asset = Asset(b"PNG", "image/png")
+        pdf, bookmarks = render_group("<p></p>", {}, {"file:///img/logo.png": asset}, "/img", "style.css")
+
+        self.assertEqual((pdf, bookmarks), (b"%PDF", []))
+        font_config = mock_font_config.return_value
+        mock_css.assert_called_once_with(filename="style.css", font_config=font_config)
+        mock_html.return_value.render.assert_called_once_with(
+            stylesheets=[mock_css.return_value], font_config=font_config
+        )
+        fetcher = mock_html.call_args.kwargs["url_fetcher"]
+        self.assertEqual(fetcher.fetch("file:///img/logo.png").read(), b"PNG")
+
+
+class TestMergePdfs(unittest.TestCase):
+    def test_merge_pages_and_bookmarks(self) -> None:
+        """Comprova que les pàgines s'ajunten en ordre i que un títol queda dins del títol d'un grup anterior."""
+        results = [
+            (blank_pdf(2), [(0, 1, "Chapter", 800.0, True), (1, 2, "First", 400.0, False)]),
+            (blank_pdf(3), [(1, 2, "Second", 800.0, False), (2, 1, "Appendix", 800.0, True)]),
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            pdf_path = os.path.join(tmp, "output.pdf")
+            pages = merge_pdfs(results, pdf_path)
+            reader = PdfReader(pdf_path)
+
+            self.assertEqual(pages, 5)
+            self.assertEqual(len(reader.pages), 5)
+            chapter, children, appendix = reader.outline
+            assert isinstance(chapter, Destination) and isinstance(appendix, Destination)
+            assert isinstance(children, list) and all(isinstance(child, Destination) for child in children)
+            self.assertEqual([chapter.title, appendix.title], ["Chapter", "Appendix"])
+            self.assertEqual([child.title for child in children], ["First", "Second"])  # type: ignore[union-attr]
+            self.assertEqual([reader.get_destination_page_number(child) for child in children], [1, 3])  # type: ignore[arg-type]
+            self.assertEqual(reader.get_destination_page_number(appendix), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,194 @@
+import asyncio
+import contextlib
+import io
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from unittest.mock import patch
+
+from src.api import AsyncConverter, ConversionError, convert, convert_async
+from src.core.constants import Constants
+from src.core.models import ErrorHandler, PdfOptions
+from src.markdown.mermaid import RenderBackend, RenderResult
+
+
+class FailingBackend(RenderBackend):
+    """Backend that fails the diagrams whose code contains "fail"."""
+
+    def render_svg(self, code: str) -> RenderResult:
+        if "fail" in code:
+            return RenderResult(400, f"bad diagram {code}", "Bad Request")
+        return RenderResult(200, '<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"></svg>')
+
+    def identity(self) -> str:
+        return "failing"
+
+
+class SlowBackend(FailingBackend):
+    """Backend that takes a while for each diagram and counts the diagrams it renders at once."""
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def render_svg(self, code: str) -> RenderResult:
+        with self.lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        return super().render_svg(code)
+
+
+def document(i: int, fail: bool) -> str:
+    code = f"graph TD; fail{i}-->B;" if fail else f"graph TD; A{i}-->B;"
+    return f"# Document {i}\n\n```mermaid\n{code}\n```\n"
+
+
+@patch("src.markdown.mermaid.MermaidRenderer._backend", staticmethod(lambda _cfg: FailingBackend()))
+class TestConvert(unittest.TestCase):
+    def setUp(self) -> None:
+        ErrorHandler.errors = []
+        self.options = PdfOptions(
+            "", "", str(Constants.SCRIPT_PATH / "tests" / "resources" / "style.css"), "", no_cache=True
+        )
+
+    def test_convert(self) -> None:
+        """Comprova que es retorna el PDF sense sortir del procés ni tocar la llista global d'errors."""
+        pdf = convert("# Title\n\nSome text.\n", self.options)
+        self.assertTrue(pdf.startswith(b"%PDF"))
+
+        with self.assertRaises(ConversionError) as raised:
+            convert(document(0, fail=True), self.options)
+        self.assertEqual(len(raised.exception.errors), 1)
+        self.assertIn("fail0", raised.exception.errors[0])
+        self.assertTrue(raised.exception.pdf.startswith(b"%PDF"))
+        self.assertEqual(ErrorHandler.errors, [])
+
+    def test_quiet_with_debug(self) -> None:
+        """Comprova que amb debug la conversió no escriu res a la sortida ni a la sortida d'errors."""
+        self.options.debug = True
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            pdf = convert(document(0, fail=False) + document(1, fail=False), self.options)
+        self.assertTrue(pdf.startswith(b"%PDF"))
+        self.assertEqual((stdout.getvalue(), stderr.getvalue()), ("", ""))
+
+    def test_invalid_options(self) -> None:
+        """Comprova que una opció no vàlida llança un ValueError en lloc de sortir."""
+        self.options.jobs = 0
+        with self.assertRaisesRegex(ValueError, "--jobs must be at least 1"):
+            convert("# Title\n", self.options)
+        self.assertEqual(self.options.cache_dir, None)
+
+        self.options.jobs = 1
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as rules:
+            rules.write('[{"pattern": "("}]')
+            rules.flush()
+            self.options.rules = rules.name
+            with self.assertRaisesRegex(ValueError, "Invalid rules file"):
+                convert("# Title\n", self.options)
+
+    def test_concurrent_calls_are_isolated(self) -> None:
+        """Comprova que les conversions simultànies en diversos fils només veuen els seus errors."""
+
+        def run(i: int) -> Any:
+            try:
+                return convert(document(i, fail=i % 2 == 1), self.options)
+            except ConversionError as e:
+                return e.errors
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(run, range(8)))
+
+        for i, result in enumerate(results):
+            if i % 2:
+                self.assertEqual(len(result), 1)
+                self.assertIn(f"fail{i}", result[0])
+            else:
+                self.assertTrue(result.startswith(b"%PDF"))
+        self.assertEqual(ErrorHandler.errors, [])
+
+
+class TestAsyncConverter(unittest.TestCase):
+    def setUp(self) -> None:
+        ErrorHandler.errors = []
+        self.options = PdfOptions(
+            "", "", str(Constants.SCRIPT_PATH / "tests" / "resources" / "style.css"), "", no_cache=True, jobs=4
+        )
+
+    def test_concurrent_conversions(self) -> None:
+        """Comprova que les conversions asíncrones simultànies retornen el seu PDF o els seus errors."""
+
+        async def run() -> list[Any]:
+            async with AsyncConverter(self.options, backend=FailingBackend()) as converter:
+                calls = [converter.convert(document(i, fail=i % 2 == 1)) for i in range(6)]
+                return await asyncio.gather(*calls, return_exceptions=True)
+
+        results = asyncio.run(run())
+        for i, result in enumerate(results):
+            if i % 2:
+                self.assertIsInstance(result, ConversionError)
+                self.assertIn(f"fail{i}", result.errors[0])
+                self.assertTrue(result.pdf.startswith(b"%PDF"))
+            else:
+                self.assertTrue(result.startswith(b"%PDF"))
+        self.assertEqual(ErrorHandler.errors, [])
+
+    def test_requests_are_limited(self) -> None:
+        """Comprova que els diagrames de totes les conversions es renderitzen com a molt de dos en dos."""
+        backend = SlowBackend(0.02)
+        markdown = "".join(f"```mermaid\ngraph TD; A{i}-->B;\n```\n\n" for i in range(6))
+
+        async def run() -> list[bytes]:
+            async with AsyncConverter(self.options, max_conversions=3, max_requests=2, backend=backend) as converter:
+                return await asyncio.gather(*[converter.convert(markdown) for _ in range(3)])
+
+        self.assertEqual(len(asyncio.run(run())), 3)
+        self.assertEqual(backend.calls, 18)
+        self.assertEqual(backend.max_running, 2)
+
+    def test_deadline_stops_the_conversion(self) -> None:
+        """Comprova que una conversió que passa del seu termini llança TimeoutError sense bloquejar el bucle,
+        i que deixa de renderitzar diagrames."""
+        backend = SlowBackend(0.05)
+        markdown = "".join(f"```mermaid\ngraph TD; A{i}-->B;\n```\n\n" for i in range(40))
+
+        async def run() -> float:
+            async with AsyncConverter(self.options, max_requests=1, backend=backend) as converter:
+                ticks = 0
+
+                async def tick() -> None:
+                    nonlocal ticks
+                    while True:
+                        await asyncio.sleep(0.01)
+                        ticks += 1
+
+                ticker = asyncio.create_task(tick())
+                start = time.perf_counter()
+                with self.assertRaises(asyncio.TimeoutError):
+                    await converter.convert(markdown, timeout=0.2)
+                elapsed = time.perf_counter() - start
+                ticker.cancel()
+                self.assertGreater(ticks, 5)
+                return elapsed
+
+        self.assertLess(asyncio.run(run()), 1.0)
+        self.assertLess(backend.calls, 10)
+
+    def test_convert_async(self) -> None:
+        """Comprova que convert_async converteix un document sense diagrames."""
+        pdf = asyncio.run(convert_async("# Title\n\nSome text.\n", self.options))
+        self.assertTrue(pdf.startswith(b"%PDF"))
+
+
+if __name__ == "__main__":
+    unittest.main()
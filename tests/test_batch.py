@@ -0,0 +1,96 @@
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Any, Iterable
+from unittest.mock import patch
+
+from src.batch import collect_documents, output_paths, run_batch
+from src.core.models import ErrorHandler, PdfCfg
+from src.pdf.converter import PdfConverter
+
+
+class TestCollectDocuments(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name).resolve()
+        for name in ["a.md", "b.md", "docs/c.md", "docs/api/d.md", "docs/notes.txt"]:
+            (self.root / name).parent.mkdir(parents=True, exist_ok=True)
+            (self.root / name).write_text(f"# {name}\n")
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_collect_documents(self) -> None:
+        """Comprova que s'expandeixen fitxers, patrons i directoris sense duplicats i en ordre."""
+        documents = collect_documents([str(self.root / "b.md"), str(self.root / "*.md"), str(self.root / "docs")])
+        expected = ["b.md", "a.md", "docs/api/d.md", "docs/c.md"]
+        self.assertEqual(documents, [self.root / name for name in expected])
+
+    def test_output_paths(self) -> None:
+        """Comprova que els PDF mantenen l'estructura relativa dels documents al directori de sortida."""
+        documents = [self.root / "a.md", self.root / "docs/api/d.md"]
+        self.assertEqual(output_paths(documents, "out"), [Path("out/a.pdf"), Path("out/docs/api/d.pdf")])
+
+
+class TestRunBatch(unittest.TestCase):
+    def setUp(self) -> None:
+        ErrorHandler.errors = []
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.cfg = PdfCfg("", "", "style.css", str(self.root), debug=False)
+        for name in ["a.md", "b.md"]:
+            (self.root / name).write_text(f"# {name}\n")
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    @patch("src.pdf.converter.PdfConverter.write_pdf", autospec=True)
+    def test_run_batch_reports_each_document(self, mock_write_pdf: Any) -> None:
+        """Comprova que un document que falla no atura la resta, que cada resultat té els seus errors
+        i que tots els documents es converteixen amb el mateix conversor, sense esperar Enter en mode debug."""
+        self.cfg.is_debug = True
+        written: list[tuple[PdfConverter, str]] = []
+
+        def write_pdf(converter: PdfConverter, sections: Iterable[str], _svgs: dict[str, str], _target: Any) -> None:
+            written.append((converter, converter.cfg.pdf_path))
+            if "a.md" in "".join(sections):
+                raise ValueError("broken document")
+
+        mock_write_pdf.side_effect = write_pdf
+        documents = [self.root / "a.md", self.root / "b.md"]
+        with patch("builtins.input", side_effect=EOFError) as mock_input:
+            results = run_batch(self.cfg, documents, str(self.root / "out"))
+
+        self.assertEqual([result.ok for result in results], [False, True])
+        self.assertEqual(results[0].errors, [f"Error converting {documents[0]}: ValueError: broken document"])
+        self.assertEqual(ErrorHandler.errors, [])
+        mock_input.assert_not_called()
+        self.assertIs(written[0][0], written[1][0])
+        pdf_paths = [pdf_path for _, pdf_path in written]
+        self.assertEqual(pdf_paths, [str(self.root / "out" / "a.pdf"), str(self.root / "out" / "b.pdf")])
+
+    @patch("src.pdf.converter.PdfConverter.write_pdf", autospec=True)
+    def test_unchanged_documents_are_skipped(self, mock_write_pdf: Any) -> None:
+        """Comprova que en tornar a executar només es converteixen els documents que han canviat
+        o que no tenen PDF, i que amb force es converteixen tots."""
+
+        def write_pdf(converter: PdfConverter, _sections: Iterable[str], _svgs: dict[str, str], _target: Any) -> None:
+            Path(converter.cfg.pdf_path).write_bytes(b"%PDF")
+
+        mock_write_pdf.side_effect = write_pdf
+        documents = [self.root / "a.md", self.root / "b.md"]
+        out = str(self.root / "out")
+        self.assertEqual([result.skipped for result in run_batch(self.cfg, documents, out)], [False, False])
+        self.assertEqual([result.skipped for result in run_batch(self.cfg, documents, out)], [True, True])
+        self.assertEqual(mock_write_pdf.call_count, 2)
+
+        (self.root / "a.md").write_text("# a.md edited\n")
+        (self.root / "out" / "b.pdf").unlink()
+        results = run_batch(self.cfg, documents, out)
+        self.assertEqual([(result.ok, result.skipped) for result in results], [(True, False), (True, False)])
+        self.assertEqual([result.skipped for result in run_batch(self.cfg, documents, out, force=True)], [False, False])
+        self.assertEqual(mock_write_pdf.call_count, 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.core.models import PdfCfg
+from src.manifest import Manifest, fingerprint
+
+
+class TestFingerprint(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        (self.root / "style.css").write_text("body { color: black; }")
+        (self.root / "logo.png").write_bytes(b"PNG")
+        (self.root / "doc.md").write_text("# Title\n\n![Logo](logo.png)\n")
+        self.cfg = PdfCfg("", "", str(self.root / "style.css"), str(self.root), debug=False)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_fingerprint_changes_with_each_input(self) -> None:
+        """Comprova que l'empremta canvia amb el Markdown, el CSS, les imatges locals i les opcions de renderització."""
+        md_path = str(self.root / "doc.md")
+        fingerprints = [fingerprint(self.cfg, md_path)]
+        self.assertEqual(fingerprint(self.cfg, md_path), fingerprints[0])
+        (self.root / "style.css").write_text("body { color: red; }")
+        fingerprints.append(fingerprint(self.cfg, md_path))
+        (self.root / "logo.png").write_bytes(b"PNG 2")
+        fingerprints.append(fingerprint(self.cfg, md_path))
+        (self.root / "doc.md").write_text("# Title 2\n\n![Logo](logo.png)\n")
+        fingerprints.append(fingerprint(self.cfg, md_path))
+        self.cfg.optimize_svg = True
+        fingerprints.append(fingerprint(self.cfg, md_path))
+        self.assertEqual(len(set(fingerprints)), 5)
+
+
+class TestManifest(unittest.TestCase):
+    def test_record_and_reload(self) -> None:
+        """Comprova que un PDF és al dia només si existeix i té la mateixa empremta, també en una altra execució."""
+        with tempfile.TemporaryDirectory() as tmp:
+            pdf_path = str(Path(tmp) / "docs" / "a.pdf")
+            manifest = Manifest(tmp)
+            manifest.record(pdf_path, "abc")
+            manifest.save()
+            self.assertFalse(Manifest(tmp).is_current(pdf_path, "abc"))
+
+            Path(pdf_path).parent.mkdir()
+            Path(pdf_path).write_bytes(b"%PDF")
+            manifest = Manifest(tmp)
+            self.assertEqual(manifest.entries, {"docs/a.pdf": "abc"})
+            self.assertTrue(manifest.is_current(pdf_path, "abc"))
+            self.assertFalse(manifest.is_current(pdf_path, "def"))
+            manifest.forget(pdf_path)
+            manifest.save()
+            self.assertEqual(Manifest(tmp).entries, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,223 @@
+import http.client
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator
+from unittest.mock import patch
+
+from src import serve
+from src.core.constants import Constants
+from src.core.models import PdfCfg
+from src.markdown.cache import DirectoryStore
+from src.markdown.processor import MarkdownProcessor
+from src.serve import ERRORS_HEADER, ConversionService, JobResult, UnixHTTPServer, make_server
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str) -> None:
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+class TestServe(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cfg = PdfCfg(
+            "",
+            "",
+            str(Constants.SCRIPT_PATH / "tests" / "resources" / "style.css"),
+            str(Constants.SCRIPT_PATH / "img"),
+            debug=False,
+            cache_dir=None,
+        )
+
+    def start(self, service: ConversionService, socket_path: str | None = None) -> Any:
+        server = make_server(service, port=0, socket_path=socket_path)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        def stop() -> None:
+            server.shutdown()
+            server.server_close()
+            service.close()
+
+        self.addCleanup(stop)
+        return server
+
+    def request(self, conn: http.client.HTTPConnection, method: str, path: str, body: str = "") -> Any:
+        conn.request(method, path, body=body.encode("utf-8"))
+        response = conn.getresponse()
+        return response.status, response.getheader("Content-Type"), response.read()
+
+    def test_convert_and_health(self) -> None:
+        """Comprova que el servei retorna el PDF del document i que /health compta les feines."""
+        server = self.start(ConversionService(self.cfg, workers=1))
+        conn = http.client.HTTPConnection(Constants.SERVE_HOST, server.server_port, timeout=30)
+
+        status, content_type, body = self.request(conn, "POST", "/convert", "# Title\n\nSome text.\n")
+        self.assertEqual((status, content_type), (200, "application/pdf"))
+        self.assertTrue(body.startswith(b"%PDF"))
+
+        status, _, body = self.request(conn, "POST", "/convert", "  \n")
+        self.assertEqual(status, 400)
+
+        status, content_type, body = self.request(conn, "GET", "/health")
+        self.assertEqual((status, content_type), (200, "application/json"))
+        health = json.loads(body)
+        self.assertEqual(health["status"], "ok")
+        self.assertEqual(health["jobs"]["completed"], 1)
+        self.assertEqual(health["pending"], 0)
+
+    def test_negative_content_length(self) -> None:
+        """Comprova que una petició amb un Content-Length negatiu es rebutja sense llegir el cos."""
+        server = self.start(ConversionService(self.cfg, workers=1))
+        conn = http.client.HTTPConnection(Constants.SERVE_HOST, server.server_port, timeout=30)
+        conn.putrequest("POST", "/convert")
+        conn.putheader("Content-Length", "-1")
+        conn.endheaders()
+        response = conn.getresponse()
+        self.assertEqual(response.status, 400)
+        self.assertEqual(json.loads(response.read()), {"errors": ["Invalid request: Content-Length -1"]})
+
+    def test_invalid_timeout(self) -> None:
+        """Comprova que un timeout negatiu, NaN o infinit es rebutja."""
+        server = self.start(ConversionService(self.cfg, workers=1))
+        conn = http.client.HTTPConnection(Constants.SERVE_HOST, server.server_port, timeout=30)
+        for timeout in ("-1", "nan", "inf"):
+            status, _, body = self.request(conn, "POST", f"/convert?timeout={timeout}", "# Title\n")
+            self.assertEqual(status, 400, timeout)
+            self.assertEqual(json.loads(body), {"errors": [f"Invalid request: timeout {float(timeout)}"]})
+
+    def test_debug_without_terminal(self) -> None:
+        """Comprova que en mode de depuració els treballadors, que no tenen terminal, no esperen cap tecla."""
+        self.cfg.is_debug = True
+        server = self.start(ConversionService(self.cfg, workers=1))
+        conn = http.client.HTTPConnection(Constants.SERVE_HOST, server.server_port, timeout=30)
+        status, content_type, body = self.request(conn, "POST", "/convert", "# Title\n\nSome text.\n")
+        self.assertEqual((status, content_type), (200, "application/pdf"), body)
+
+    @patch("src.serve.ProcessPoolExecutor", ThreadPoolExecutor)
+    def test_queue_full_and_timeout(self) -> None:
+        """Comprova que una feina que triga massa respon 504 i que amb la cua plena es respon 503."""
+        release = threading.Event()
+
+        def convert(_markdown_content: str, _deadline: float) -> JobResult:
+            release.wait(10)
+            return JobResult(pdf=b"%PDF")
+
+        with patch("src.serve._convert_in_worker", side_effect=convert):
+            server = self.start(ConversionService(self.cfg, workers=1, queue_size=0, job_timeout=5))
+            conn = http.client.HTTPConnection(Constants.SERVE_HOST, server.server_port, timeout=30)
+
+            status, _, body = self.request(conn, "POST", "/convert?timeout=0.1", "# Slow\n")
+            self.assertEqual(status, 504)
+            # The job that timed out keeps the only worker until it ends
+            status, _, body = self.request(conn, "POST", "/convert", "# Rejected\n")
+            self.assertEqual(status, 503)
+            self.assertEqual(json.loads(body), {"errors": ["The queue of jobs is full"]})
+
+            release.set()
+            service: ConversionService = getattr(server, "service")
+            service.executor.shutdown(wait=True)
+            self.assertEqual(service.health()["jobs"]["timed_out"], 1)
+            self.assertEqual(service.health()["jobs"]["rejected"], 1)
+            self.assertEqual(service.health()["pending"], 0)
+
+    def test_worker_deadline(self) -> None:
+        """Comprova que el termini de la feina limita el temps de renderitzar els diagrames i que el treballador
+        atura la feina a la secció següent quan passa, o abans de començar-la si ja ha passat."""
+        serve._init_worker(self.cfg)
+        assert serve._worker is not None
+        cfg = serve._worker.cfg
+        self.addCleanup(serve._close_worker, serve._worker.processor)
+        render_deadlines = []
+
+        def process_sections(_source: str) -> tuple[dict[str, str], Iterator[str]]:
+            def sections() -> Iterator[str]:
+                yield "# One\n"
+                time.sleep(0.3)
+                yield "# Two\n"
+
+            render_deadlines.append(cfg.render_deadline)
+            return {}, sections()
+
+        with patch.object(serve._worker.processor, "process_sections", side_effect=process_sections):
+            result = serve._convert_in_worker("# One\n", time.time() + 0.2)
+        error = "Error converting the document: it took longer than the timeout of the job"
+        self.assertEqual((result.pdf, result.errors), (b"", [error]))
+        self.assertLessEqual(render_deadlines[0], 0.2)
+        self.assertEqual(cfg.render_deadline, Constants.RENDER_DEADLINE)
+
+        result = serve._convert_in_worker("# One\n", time.time() - 1)
+        self.assertEqual((result.pdf, result.errors), (b"", [error]))
+        result = serve._convert_in_worker("# One\n", time.time() + 30)
+        self.assertTrue(result.pdf.startswith(b"%PDF"))
+
+    def test_close_worker(self) -> None:
+        """Comprova que el processador del treballador es tanca sense buidar la memòria cau."""
+        with tempfile.TemporaryDirectory() as tmp:
+            self.cfg.cache_dir = tmp
+            processor = MarkdownProcessor(self.cfg)
+            with patch.object(DirectoryStore, "evict", return_value=0) as evict:
+                serve._close_worker(processor)
+            evict.assert_not_called()
+            self.assertIsNone(processor.cache)
+
+    @patch("src.serve.ProcessPoolExecutor", ThreadPoolExecutor)
+    def test_unix_socket(self) -> None:
+        """Comprova que el servei també respon per un socket Unix."""
+        with patch("src.serve._convert_in_worker", return_value=JobResult(errors=["Error rendering diagram"])):
+            with tempfile.TemporaryDirectory() as tmp:
+                socket_path = os.path.join(tmp, "md-mermaid-pdf.sock")
+                server = self.start(ConversionService(self.cfg), socket_path=socket_path)
+                self.assertIsInstance(server, UnixHTTPServer)
+
+                status, _, body = self.request(UnixHTTPConnection(socket_path), "POST", "/convert", "# Title\n")
+                self.assertEqual(status, 422)
+                self.assertEqual(json.loads(body), {"errors": ["Error rendering diagram"]})
+
+    @patch("src.serve.ProcessPoolExecutor", ThreadPoolExecutor)
+    def test_errors_with_pdf(self) -> None:
+        """Comprova que un document convertit amb errors retorna el PDF amb els errors a la capçalera."""
+        result = JobResult(pdf=b"%PDF", errors=["Error rendering diagram"])
+        with patch("src.serve._convert_in_worker", return_value=result):
+            server = self.start(ConversionService(self.cfg))
+            conn = http.client.HTTPConnection(Constants.SERVE_HOST, server.server_port, timeout=30)
+            conn.request("POST", "/convert", body=b"# Title\n")
+            response = conn.getresponse()
+
+            self.assertEqual((response.status, response.getheader("Content-Type")), (200, "application/pdf"))
+            self.assertEqual(response.read(), b"%PDF")
+            self.assertEqual(json.loads(response.getheader(ERRORS_HEADER, "")), ["Error rendering diagram"])
+            self.assertEqual(getattr(server, "service").health()["jobs"]["degraded"], 1)
+
+    def test_socket_path_is_checked(self) -> None:
+        """Comprova que es reemplaça el socket d'un servidor anterior, però no un fitxer que no és un socket."""
+        service = ConversionService(self.cfg)
+        self.addCleanup(service.close)
+        with tempfile.TemporaryDirectory() as tmp:
+            socket_path = os.path.join(tmp, "md-mermaid-pdf.sock")
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            stale.bind(socket_path)
+            stale.close()
+            make_server(service, socket_path=socket_path).server_close()
+
+            file_path = os.path.join(tmp, "notes.md")
+            with open(file_path, "w") as f:
+                f.write("# Notes\n")
+            with self.assertRaises(FileExistsError):
+                make_server(service, socket_path=file_path)
+            with open(file_path) as f:
+                self.assertEqual(f.read(), "# Notes\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
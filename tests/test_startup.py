@@ -0,0 +1,56 @@
+import subprocess
+import sys
+import textwrap
+import unittest
+
+from src.core.constants import Constants
+
+# Microseconds allowed to import the command line, measured with -X importtime
+IMPORT_BUDGET = 250_000
+HEAVY_MODULES = ["weasyprint", "markdown2", "requests", "tqdm", "pypdf", "src.markdown.mermaid", "src.pdf.converter"]
+
+
+def import_times(code: str) -> dict[str, int]:
+    """Run the code in a new interpreter and return the cumulative import time of each module, in microseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=Constants.SCRIPT_PATH,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+class TestStartup(unittest.TestCase):
+    def test_cli_import_budget(self) -> None:
+        """Comprova que importar la línia de comandes no carrega les dependències pesades i cap en el pressupost."""
+        times = import_times("import src.main")
+        self.assertEqual([module for module in HEAVY_MODULES if module in times], [])
+        self.assertLess(times["src.main"], IMPORT_BUDGET)
+
+    def test_document_without_diagrams(self) -> None:
+        """Comprova que un document sense diagrames no carrega ni Mermaid ni el client HTTP."""
+        code = textwrap.dedent(
+            """
+            from src.core.models import PdfCfg
+            from src.markdown.processor import MarkdownProcessor
+
+            processor = MarkdownProcessor(PdfCfg("", "", "", "", debug=False))
+            processor.process_markdown("# Title\\n\\nSome text.\\n")
+            processor.close()
+            """
+        )
+        times = import_times(code)
+        self.assertIn("markdown2", times)
+        self.assertEqual([module for module in ["requests", "tqdm", "src.markdown.mermaid"] if module in times], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Any, Iterable
+from unittest.mock import patch
+
+from src.core.models import ErrorHandler, PdfCfg
+from src.pdf.converter import PdfConverter
+from src.watch import Watcher
+
+
+class TestWatcher(unittest.TestCase):
+    def setUp(self) -> None:
+        ErrorHandler.errors = []
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.md_path = self.root / "doc.md"
+        self.css_path = self.root / "style.css"
+        self.md_path.write_text("# Title\n")
+        self.css_path.write_text("body {}\n")
+        cfg = PdfCfg(str(self.md_path), str(self.root / "doc.pdf"), str(self.css_path), str(self.root), debug=False)
+        self.watcher = Watcher(cfg, interval=0)
+
+    def tearDown(self) -> None:
+        self.watcher.processor.close()
+        self.tmp.cleanup()
+
+    def touch(self, path: Path, content: str) -> None:
+        path.write_text(content)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    def test_changed(self) -> None:
+        """Comprova que es detecten els canvis del Markdown i del CSS, i que un fitxer absent no és un canvi."""
+        self.assertTrue(self.watcher.changed())
+        self.assertFalse(self.watcher.changed())
+        self.touch(self.css_path, "body { color: red; }\n")
+        self.assertTrue(self.watcher.changed())
+        self.md_path.unlink()
+        self.assertFalse(self.watcher.changed())
+        self.touch(self.md_path, "# Title 2\n")
+        self.assertTrue(self.watcher.changed())
+
+    @patch("src.pdf.converter.PdfConverter.write_pdf", autospec=True)
+    def test_build_returns_errors(self, mock_write_pdf: Any) -> None:
+        """Comprova que un error en la conversió es mostra sense aturar el procés i que la següent pot funcionar."""
+
+        def write_pdf(_converter: PdfConverter, sections: Iterable[str], _svgs: dict[str, str], _target: Any) -> None:
+            if "Broken" in "".join(sections):
+                raise ValueError("broken document")
+
+        mock_write_pdf.side_effect = write_pdf
+        self.touch(self.md_path, "# Broken\n")
+        with patch("src.watch.print_error"):
+            errors = self.watcher.build()
+        self.assertEqual(errors, [f"Error converting {self.md_path}: ValueError: broken document"])
+        self.assertEqual(ErrorHandler.errors, [])
+
+        self.touch(self.md_path, "# Fixed\n")
+        self.assertEqual(self.watcher.build(), [])
+        self.assertEqual(mock_write_pdf.call_count, 2)
+
+    @patch("src.pdf.converter.PdfConverter.write_pdf", autospec=True)
+    def test_run(self, mock_write_pdf: Any) -> None:
+        """Comprova que run construeix el PDF quan comença i després de cada canvi."""
+        with patch.object(self.watcher, "changed", side_effect=[True, False, True]):
+            self.watcher.run(max_builds=2)
+        self.assertEqual(mock_write_pdf.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()